@@ -8,6 +8,10 @@ Content-Type: multipart/form-data
 Parameters:
 - file: File to upload (required)
 - file_type: Type of file - image, document, video, audio, other (optional)
+- tenant: Tenant the upload belongs to; prefixes the request ID as "tenant:uuid" (optional)
+- ttl: Seconds to keep the file, overriding the retention policy (optional)
+- previous_version: ID of the file this upload is a new version of; the upload
+  gets its request ID and `version` + 1 (optional)
 
 Response:
 {
@@ -18,17 +22,138 @@ Response:
     "storage_backend": "cloudinary",
     "public_url": "https://res.cloudinary.com/demo/image/upload/v1/example.jpg",
     "secure_url": "https://res.cloudinary.com/demo/image/upload/v1/example.jpg",
+    "placeholder": {
+        "data_uri": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD...",
+        "width": 16,
+        "height": 9,
+        "color": "#3a6b8c",
+        "aspect_ratio": 1.7778
+    },
     "metadata": {
         "width": 1920,
         "height": 1080,
         "format": "jpg"
     },
+    "version": 1,
+    "previous_version": null,
     "created_at": "2024-01-01T12:00:00Z",
     "updated_at": "2024-01-01T12:00:00Z"
 }
 
+Images get a `placeholder`: a JPEG of at most `FILE_UPLOAD_PLACEHOLDER_SIZE`
+pixels and under 1KB as a data URI, plus the dominant color and aspect ratio.
+Show it scaled up with CSS `filter: blur()` (or the color) while the image
+loads, instead of requesting a thumbnail. It is computed from a reduced-size
+decode when the image is uploaded, and is null for other files.
+
+### 1a. Upload Raw File (server-to-server)
+PUT /api/files/raw/{filename}?file_type=document
+Content-Type: text/csv
+Content-Length: 1048576
+
+The request body is the file itself. It is streamed to the storage backend in
+`FILE_UPLOAD_RAW_CHUNK_SIZE` chunks without multipart parsing; only backends
+that cannot consume streams (Cloudinary) spool it first, as do images, which
+are decoded for their hashes and placeholder. Content-Length is
+required and limited by `FILE_UPLOAD_RAW_MAX_SIZE`; Content-Type must match the
+file extension or be `application/octet-stream`. `?previous_version=<id>`
+uploads a new version of a file. Responds like Upload File.
+
+### 1b. Upload Progress
+Send a random token (8-64 letters, digits, `-` or `_`) with an upload, as an
+`X-Upload-ID` header or `upload_id` query parameter, then read its progress:
+
+GET /api/files/progress/{upload_id}/
+GET /api/files/progress/{upload_id}/events/   (Server-Sent Events)
+
+Response:
+{
+    "upload_id": "3f1c9a7e-upload",
+    "state": "uploading",
+    "received": 5242880,
+    "total": 10485760,
+    "percent": 50.0,
+    "updated_at": "2024-01-01T12:00:00+00:00"
+}
+
+`state` moves from `uploading` to `received` (body in, being stored) to `done`
+(with `file_id`) or `failed` (with `error`). Progress is written at most every
+`FILE_UPLOAD_PROGRESS_INTERVAL` seconds to the Django cache, or to process
+memory with `FILE_UPLOAD_PROGRESS_STORE=memory` on single-process deployments.
+The event stream may be opened before the upload starts and closes when it ends.
+
+### 1c. Idempotent Retries
+Send an `Idempotency-Key` header (any unique string up to 255 characters,
+e.g. a UUID per logical upload) with Upload, Raw Upload or Delete. The first
+response is stored for `FILE_UPLOAD_IDEMPOTENCY_TTL` seconds and retries with
+the same key get it back (with `Idempotent-Replayed: true`) without creating
+another file. A retry arriving while the first request is still running waits
+for it, then answers `409` after `FILE_UPLOAD_IDEMPOTENCY_WAIT` seconds. Keys
+are scoped to the client, identified as for Upload Throttling. Using a key
+with a different method, path, Content-Type or (except for multipart uploads)
+Content-Length answers `422`. Server errors are not stored, so the retry runs
+again.
+
+### 1d. File Events
+Instead of polling file details, subscribe to the events of a `request_id`:
+
+GET /api/files/events/?request_id=batch-42   (Server-Sent Events)
+
+```
+id: 17
+event: file.created
+data: {"id": 17, "type": "file.created", "file_id": "...", "request_id": "batch-42",
+       "created_at": "2024-01-01T12:00:00+00:00", "data": {...file details...}}
+```
+
+Events (`file.created`, `file.deleted`) are written to an outbox table in the
+same transaction as the file change, so they are never lost or sent for a
+rolled back change. The stream closes after `FILE_UPLOAD_EVENTS_SSE_TIMEOUT`
+seconds; browsers reconnect with `Last-Event-ID` and resume where they left.
+
+With `FILE_UPLOAD_WEBHOOK_URL` set, `python manage.py dispatchevents --loop`
+POSTs events in batches of `FILE_UPLOAD_WEBHOOK_BATCH_SIZE` as
+`{"events": [...]}`, with an `X-Webhook-Signature: t=<unix time>,v1=<hex>`
+header, the HMAC-SHA256 of `"<t>.<body>"` keyed with
+`FILE_UPLOAD_WEBHOOK_SECRET`. Failed batches are retried with exponential
+backoff up to `FILE_UPLOAD_WEBHOOK_MAX_ATTEMPTS` times. Delivery is at least
+once: deduplicate on the event `id`.
+
+### 1e. Asynchronous Cloudinary Processing
+With `FILE_UPLOAD_CLOUDINARY_ASYNC=true`, uploads of at least
+`FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE` bytes to Cloudinary return as soon as
+Cloudinary has received the file, without waiting for it to be processed.
+Only audio and video may exceed `MAX_FILE_SIZE` (up to `MAX_MEDIA_FILE_SIZE`),
+so with the default threshold of 10MB they are the files uploaded this way;
+lower it to process smaller files asynchronously too. Nothing is uploaded
+asynchronously while `FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL` is unset.
+The response has `metadata.processing: "pending"` and a delivery URL.
+Cloudinary then calls
+
+POST /api/files/cloudinary/notifications/
+
+at `FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL` (must be reachable from
+Cloudinary) once the file is processed, and again when the eager
+transformations of `FILE_UPLOAD_CLOUDINARY_EAGER` for its file type are
+ready. Notifications are checked against `X-Cld-Signature` and
+`X-Cld-Timestamp` with the API secret. They fill in `width`, `height`,
+`format`, `bytes`, `duration` and `derived` (URLs of the eager
+transformations) and set `processing` to `complete` or `failed`. A
+`file.processed` (or `file.processing_failed`) event is published, so
+clients can wait on the event stream instead of polling the file. A
+notification that arrives before the upload has recorded the file is
+answered 202, kept and applied once the file is recorded; `purgeexpired`
+drops kept notifications older than `FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE`.
+
 ### 2. List Files
-GET /api/files/files/
+GET /api/files/files/?search=report&search_mode=substring&page=1&page_size=50
+
+`search` matches `original_filename` and the metadata keys listed in
+`FILE_UPLOAD_SEARCH_METADATA_KEYS`, case-insensitively, best matches first.
+`search_mode=prefix` restricts matches to filenames starting with the query.
+The search is served by an FTS5 trigram index on SQLite and a pg_trgm index
+on PostgreSQL, so it does not scan the table. Results are paginated,
+`page_size` defaults to 50 and is capped at 500.
 
 Response:
 {
@@ -41,10 +166,47 @@ Response:
 ### 3. Get File Details
 GET /api/files/files/{file_id}/
 
+Responses carry an `ETag` derived from `updated_at` and a `Cache-Control`
+header (`FILE_UPLOAD_CACHE_CONTROL`). Send the ETag back in `If-None-Match`
+to get a `304 Not Modified` without a body. Records are served from the
+Django cache (`FILE_UPLOAD_CACHE_ALIAS`) and invalidated on save and delete.
+Invalidation only reaches other processes, and management commands such as
+`migratefiles` and `archivefiles`, through a shared cache: set
+`CACHE_BACKEND` and `CACHE_LOCATION` (Redis, Memcached or the database
+cache). With the default per-process cache the `file_upload.W002` check
+warns, since other workers keep serving changed or deleted files for up to
+`FILE_UPLOAD_OBJECT_CACHE_TIMEOUT` seconds; set it to 0 to turn the cache off.
+Upload progress and replica pins are kept in the same cache and need it
+shared too.
+
 ### 4. Delete File
 DELETE /api/files/files/{file_id}/
 
-### 5. Get File URL with Transformations
+### 5. Export File Records
+GET /api/files/files/export/?format=ndjson&created_after=2024-01-01&created_before=2024-02-01&storage_backend=s3&file_type=image
+
+Streams every matching record as NDJSON (default) or CSV (`format=csv`).
+Rows are read from the database in chunks, so memory stays flat and the first
+bytes are sent immediately. The same export is available as a command:
+
+```bash
+python manage.py exportfiles --format=csv --created-after=2024-01-01 --output=files.csv
+```
+
+### 5a. Download Files as ZIP
+GET /api/files/files/archive/?ids={file_id},{file_id}
+GET /api/files/files/archive/?request_id=acme:123
+POST /api/files/files/archive/ with {"ids": [...]} for long lists
+
+Streams a ZIP built on the fly; members are read through their storage
+backend a few at a time (`FILE_UPLOAD_ZIP_PREFETCH`), so memory does not
+grow with the archive. Images, video, audio and archives are stored as is,
+other files are deflated (`compress=false` stores everything). When every
+member is stored the response has a `Content-Length`, an `ETag` and
+`Accept-Ranges: bytes`, so interrupted downloads resume with
+`Range`/`If-Range`. At most `FILE_UPLOAD_ZIP_MAX_FILES` files per archive.
+
+### 6. Get File URL with Transformations
 GET /api/files/files/{file_id}/url/?width=300&height=300&quality=auto
 
 Parameters (for images):
@@ -53,13 +215,199 @@ Parameters (for images):
 - quality: Image quality (auto, best, good, eco)
 - format: Output format (jpg, png, webp, auto)
 - crop: Crop mode (fill, fit, scale, etc.)
-- expires_in: URL expiration in seconds (for S3)
+- expires_in: URL expiration in seconds (for S3 and local files)
 
 Response:
 {
     "url": "https://res.cloudinary.com/demo/image/upload/w_300,h_300,q_auto/example.jpg"
 }
 
+Local files get a signed URL, valid for `expires_in` or
+`FILE_UPLOAD_SIGNED_URL_TTL` seconds:
+
+GET /api/files/signed/local/images/3f2b....jpg?expires=1735689600&sig=Qm9v...
+
+The signature is an HMAC of the backend, storage key and expiry, so the
+file is served after a single hash check without a database query. Expired
+or altered URLs get 403. Expiries are rounded up to
+`FILE_UPLOAD_SIGNED_URL_GRANULARITY` seconds: the same file signed twice
+within that window has the same URL, which keeps browser caches warm. Set
+`FILE_UPLOAD_S3_URL_MODE=proxy` to serve S3 objects the same way instead of
+presigning them, and `FILE_UPLOAD_SIGNED_URL_BASE` to put a CDN origin in
+front of the path. Rotating `FILE_UPLOAD_URL_SIGNING_KEY` (default: derived
+from `SECRET_KEY`) invalidates every outstanding URL.
+
+### 6a. Storage Usage
+GET /api/files/usage/?tenant=acme&storage_backend=s3&file_type=image&since=2024-01-01&until=2024-01-31
+
+Response:
+{
+    "file_count": 1200,
+    "total_bytes": 734003200,
+    "by_storage_backend": {"s3": {"file_count": 1200, "total_bytes": 734003200}},
+    "by_file_type": {"image": {"file_count": 1200, "total_bytes": 734003200}}
+}
+
+Served from a summary table keyed by tenant, backend, file type and upload
+day, which is updated in the same transaction as uploads, deletes and
+migrations. `python manage.py rebuildusage --check` recomputes it from the
+file records and reports drift; without `--check` it rewrites the table.
+
+### 6b. Similar Images
+GET /api/files/files/{file_id}/similar/?max_distance=6&limit=20
+
+Images that look like the file (resized, re-encoded or lightly edited
+copies), nearest first. Each image upload gets a 64-bit perceptual hash
+(pHash, confirmed with a dHash) computed from a reduced-size decode and
+recorded in `metadata.image_hash`. `max_distance` is the number of differing
+bits, from 0 to 15 (default `FILE_UPLOAD_IMAGE_HASH_MAX_DISTANCE`). Only files
+of the same tenant are returned. The index is split into four 16-bit bands
+(multi-index hashing), so lookups read a few index buckets rather than every
+hash. Responds 404 for files without a hash; `hashimages` hashes existing ones.
+
+Response:
+{
+    "file_id": "550e8400-e29b-41d4-a716-446655440000",
+    "max_distance": 6,
+    "results": [{"id": "...", "original_filename": "photo-small.jpg", "distance": 2, ...}]
+}
+
+With `FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD=true`, an image upload within
+`FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE` bits of a stored, unexpired image of the
+same tenant is not stored again: Upload File and Upload Raw File respond
+`200 OK` with the stored file and its `near_duplicate_distance`.
+
+### 7. Health Checks
+GET /health/live/    (also /health-check/)
+GET /health/ready/
+
+Liveness always answers 200 while the process is up. Readiness probes the
+database and each backend in `FILE_UPLOAD_HEALTH_BACKENDS` (S3 HEAD bucket,
+Cloudinary ping, local disk write plus a `FILE_UPLOAD_LOCAL_MIN_FREE_BYTES`
+free-space check) and answers 503 when any probe fails. Results and latencies
+are cached for `FILE_UPLOAD_HEALTH_CACHE_SECONDS`.
+
+### 8. Metrics
+GET /metrics/
+
+Prometheus text format. Includes per-backend circuit breaker state
+(`file_upload_storage_circuit_state`: 0 closed, 1 half-open, 2 open),
+storage failures, retries and hedged requests.
+
+## Upload Admission Control
+
+Each process keeps a memory budget (`FILE_UPLOAD_MEMORY_BUDGET`) for uploads in
+flight. An upload reserves its size up to `FILE_UPLOAD_MAX_MEMORY_SIZE` (larger
+files are spooled to disk) plus `FILE_UPLOAD_ADMISSION_OVERHEAD`. When the
+budget is used up, uploads wait up to `FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT`
+seconds and are then answered `503` with a `Retry-After` based on how long
+recent uploads held their memory. Budget use is in `/health-check/`
+(`upload_memory`) and in the metrics `file_upload_memory_budget_bytes`,
+`file_upload_memory_in_use_bytes` and `file_upload_admission_waiting` for
+autoscaling.
+
+## Upload Throttling
+
+With `FILE_UPLOAD_RATE_LIMIT_ENABLED=true` (off by default), uploads are
+limited per client: the `X-API-Key` header or bearer token, else the
+`X-Tenant` header or `tenant` query parameter, else the client IP
+(`FILE_UPLOAD_RATE_LIMIT_KEYS`). Behind a load balancer or reverse proxy the
+peer address is the proxy's, so every client would share one bucket: set
+`FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR=true` to key on the first
+`X-Forwarded-For` address, and only when the proxy overwrites that header,
+since clients can forge it otherwise. Each client has a token bucket of requests
+(`FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND`, bursts of
+`FILE_UPLOAD_RATE_LIMIT_REQUEST_BURST`) and one of bytes
+(`FILE_UPLOAD_RATE_LIMIT_BYTES_PER_SECOND` and `FILE_UPLOAD_RATE_LIMIT_BYTE_BURST`),
+kept in the cache so every process shares them. That needs a shared cache in
+`CACHES` (Redis, Memcached or the database cache); with the default
+process-local cache the `file_upload.W001` check warns, and
+`FILE_UPLOAD_RATE_LIMIT_STORE=memory` is the honest choice for a single
+process. A request over either bucket is answered `429` with a `Retry-After`
+of when the buckets will cover it.
+
+Each process also runs at most `FILE_UPLOAD_FAIR_SLOTS` uploads, and at most
+`FILE_UPLOAD_CLIENT_MAX_CONCURRENCY` per client. Waiting uploads get free slots
+in weighted fair order by bytes, so a client with a backlog of large uploads
+only delays itself; uploads still waiting after `FILE_UPLOAD_FAIR_QUEUE_TIMEOUT`
+seconds get a `429`. Queuing needs threaded workers (e.g. gunicorn
+`--threads`). `FILE_UPLOAD_RATE_LIMIT_WEIGHTS = {'tenant:acme': 4}` gives a
+client four times the rates, bursts and share. Slot use is in `/health-check/`
+(`upload_slots`) and rejections in `file_upload_throttled_total`.
+
+## Compression at Rest
+With `FILE_UPLOAD_COMPRESSION_ENABLED=true`, the local and S3 backends compress
+uploads (CSV, text, JSON and other documents) while they stream to storage.
+Files smaller than `FILE_UPLOAD_COMPRESSION_MIN_SIZE`, files in compressed
+formats (images, audio, video, archives, Office documents, recognized by
+extension and by their leading bytes), and files whose first 64KB do not
+shrink are stored as is. zstd is used for large files when the optional
+`zstandard` package is installed and gzip otherwise. The object key gets a
+`.gz` or `.zst` suffix, and `metadata.compression` records the `encoding`,
+`stored_size` and `ratio`; `file_size` stays the original size.
+
+Signed URLs send compressed files as stored, with `Content-Encoding`, to
+clients whose `Accept-Encoding` allows it, and decompress them on the fly
+for the others. The URL API therefore always returns signed URLs for
+compressed files, also on S3 and with `FILE_UPLOAD_LOCAL_SIGNED_URLS=false`;
+the stored `public_url` downloads the compressed bytes without
+`Content-Encoding`. ZIP downloads contain the original content.
+
+## Chunk Store
+
+`FILE_UPLOAD_STORAGE_BACKEND = 'chunks'` stores files as content-defined
+chunks, for large files that are uploaded again with small changes. Uploads
+are cut where a rolling hash of the content matches, into chunks of
+`FILE_UPLOAD_CHUNK_STORE_MIN_SIZE` to `FILE_UPLOAD_CHUNK_STORE_MAX_SIZE`
+bytes, so an insertion only changes the chunks around it. Each chunk is stored
+once under its SHA-256, on disk (`FILE_UPLOAD_CHUNK_STORE_ROOT`) or in the S3
+bucket (`FILE_UPLOAD_CHUNK_STORE_BACKEND=s3`), and a file is a manifest of its
+chunks. Only chunks not stored yet are written, with up to
+`FILE_UPLOAD_CHUNK_STORE_WORKERS` writes in flight; uploading with
+`previous_version` skips the existence checks for the chunks of that version.
+`metadata.chunk_store` records the `chunks`, `new_chunks` and `new_bytes` of
+the upload. Files are served through signed URLs and support range reads.
+
+Chunking runs in Python at roughly 10MB/s per upload, so the backend suits
+versioned datasets, disk images and backups rather than high-volume media.
+
+## Read Replicas
+
+The primary database is configured with `DB_ENGINE`, `DB_NAME`, `DB_USER`,
+`DB_PASSWORD`, `DB_HOST` and `DB_PORT` (SQLite by default). Connections are
+kept open for `DB_CONN_MAX_AGE` seconds and checked before reuse
+(`DB_CONN_HEALTH_CHECKS`) instead of being opened per request.
+
+`DB_REPLICA_HOSTS=replica-1,replica-2` adds read replicas of the same
+database. Reads of files (`FILE_UPLOAD_DB_REPLICA_MODELS`), such as the file
+list, go to a healthy replica; writes, reads inside transactions and reads
+by a client for `FILE_UPLOAD_DB_STICKY_SECONDS` after it uploaded or deleted
+a file go to the primary, so clients always see their own changes. Cached
+file lookups are filled from the primary. Replicas are checked every
+`FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL` seconds; PostgreSQL replicas more than
+`FILE_UPLOAD_DB_REPLICA_MAX_LAG` seconds behind are skipped until they catch
+up. Replica health is in `/health-check/` (`database_replicas`).
+
+To try it locally with two SQLite files:
+```bash
+export DB_REPLICA_NAMES=replica.sqlite3
+python manage.py migrate
+python manage.py syncreplicas --interval=10  # a replica 10 seconds behind
+```
+
+## Storage Resilience
+
+Calls to the storage backend go through a resilience layer:
+- Idempotent calls (delete, URL generation, reads) are retried with jittered
+  exponential backoff (`FILE_UPLOAD_RETRY_ATTEMPTS`, `FILE_UPLOAD_RETRY_BASE_DELAY`,
+  `FILE_UPLOAD_RETRY_MAX_DELAY`). Uploads are never retried.
+- Each backend has a circuit breaker that fails fast after
+  `FILE_UPLOAD_BREAKER_FAILURE_THRESHOLD` consecutive transient failures and
+  retries after `FILE_UPLOAD_BREAKER_RESET_TIMEOUT` seconds. The state is shown
+  on `/health-check/`.
+- Reads and URL generation slower than the `FILE_UPLOAD_HEDGE_PERCENTILE`
+  latency percentile are hedged with a duplicate request; the first response wins.
+
 ## Python Usage Examples
 
 ### Basic Upload
@@ -249,6 +597,126 @@ python manage.py migrate_storage --from-backend=local --to-backend=cloudinary --
 python manage.py migrate_storage --from-backend=local --to-backend=cloudinary
 ```
 
+### Reconcile Storage and Database
+```bash
+# Report orphans on both sides for one prefix
+python manage.py reconcilefiles --backend=s3 --prefix=images/
+
+# Delete objects without a record and records without an object
+python manage.py reconcilefiles --backend=s3 --prefix=images/ --fix-storage --fix-records
+```
+
+The backend listing (S3 `list_objects_v2` pages, the Cloudinary Search API
+sorted by public_id, or a walk of the local media tree) is merge-joined
+against the database keys in sorted order, in bounded memory. Objects and
+records younger than `--min-age-hours` are skipped because their upload may
+still be in progress.
+
+### Purge Expired Files
+```bash
+python manage.py purgeexpired --batch-size=500
+```
+
+Files get an `expires_at` from the upload `ttl`, or from
+`FILE_UPLOAD_RETENTION_TENANT_TTLS`, `FILE_UPLOAD_RETENTION_FILE_TYPE_TTLS` and
+`FILE_UPLOAD_RETENTION_DEFAULT_TTL`, in that order. The purge deletes expired
+objects through the backends' bulk delete APIs, then their rows, in batches,
+sleeping `FILE_UPLOAD_PURGE_YIELD_RATIO` times each batch's duration in between.
+With `FILE_UPLOAD_S3_LIFECYCLE_EXPIRY`, S3 objects are tagged `retention-days=N`
+for a bucket lifecycle rule and the purge only deletes rows.
+
+### Deliver Webhooks
+```bash
+# One pass over the pending events
+python manage.py dispatchevents
+
+# Keep delivering, as a long-running worker
+python manage.py dispatchevents --loop
+```
+
+Several dispatchers may run at once: each batch is leased to one dispatcher
+for `FILE_UPLOAD_WEBHOOK_LEASE` seconds (keep it above
+`FILE_UPLOAD_WEBHOOK_TIMEOUT`) and posted outside any transaction. A batch
+whose dispatcher died is delivered again when the lease ends. `purgeexpired`
+deletes events older than `FILE_UPLOAD_EVENTS_RETENTION` seconds.
+
+### Probe Audio and Video Metadata
+```bash
+python manage.py probemedia --workers=4 --limit=10000
+```
+
+Audio and video uploads get `metadata["media"]` with the container, duration,
+codecs, width/height, sample rate, channels, bitrate and ID3 title/artist/album
+where available. Uploads may have the `ALLOWED_VIDEO_EXTENSIONS` and
+`ALLOWED_AUDIO_EXTENSIONS`, the containers the probe parses: MP4/MOV, WAV,
+FLAC and MP3 headers are parsed in pure Python from a few KB at the start and
+end of the file, without decoding. Seekable
+uploads are probed inline; streamed raw uploads and existing files are probed
+by this command through range reads on the storage backend. Probes stop after
+`FILE_UPLOAD_MEDIA_PROBE_MAX_BYTES`.
+
+### Hash Stored Images
+```bash
+python manage.py hashimages --workers=4 --limit=10000
+```
+
+Downloads stored images missing from the near-duplicate index and records
+their perceptual hashes. Images that cannot be decoded are reported and
+retried by the next run.
+
+### Build Image Placeholders
+```bash
+python manage.py buildplaceholders --workers=8 --limit=10000
+```
+
+Computes the placeholder of stored images that have none, such as images
+uploaded before placeholders existed. Images are
+downloaded and decoded by `--workers` threads. `--force` recomputes
+existing placeholders, e.g. after changing `FILE_UPLOAD_PLACEHOLDER_SIZE`.
+
+### Collect Unreferenced Chunks
+```bash
+python manage.py gcchunks --grace-hours=24 --dry-run
+```
+
+Deleting a file from the chunk store only deletes its manifest. `gcchunks`
+deletes the chunks no manifest references, except those written or reused
+within the grace period (`FILE_UPLOAD_CHUNK_STORE_GC_GRACE` by default), which
+may belong to an upload still in progress.
+
+### Bulk Ingest
+```bash
+python manage.py ingestfiles /data/archive --tenant=acme --workers=8 --batch-size=200
+python manage.py ingestfiles /data/archive/manifest.csv
+```
+
+Uploads every file under a directory (in sorted order, skipping hidden files
+and symlinks), or those listed in a CSV or JSONL manifest with a `path` and
+optionally `file_type`, `request_id` and `ttl`. Files are uploaded by
+`--workers` threads and inserted `--batch-size` at a time, with their usage
+totals and `file.created` events, in one transaction per batch. Progress is
+checkpointed after every batch to `<source>.ingest-checkpoint.json`; rerunning
+the command resumes from it, and `--restart` starts over. Files uploaded by a
+batch that was interrupted are uploaded again; `reconcilefiles` removes the
+orphaned copies.
+
+### Archive Cold Files
+```bash
+python manage.py archivefiles --older-than-days=365 --to=ndjson --dry-run
+```
+
+Moves whole months of files created more than `--older-than-days` ago
+(`FILE_UPLOAD_ARCHIVE_AFTER_DAYS`) out of the hot `UploadedFile` table, so
+its indexes stay small. Records go to the `ArchivedFile` table, which is
+partitioned by month on PostgreSQL (emulated by an indexed column elsewhere),
+or with `--to=ndjson` to gzip-compressed NDJSON files in
+`FILE_UPLOAD_ARCHIVE_DIR`, leaving only an id and offset in the table. The
+stored files, usage totals and events are untouched. Archived ids keep
+resolving in the file detail, URL and delete endpoints; the file list only
+shows hot files. Files due to expire, and earlier versions of files that are
+still hot, are not archived. `reconcilefiles` counts the stored objects of
+archived files as referenced.
+
 ## Installation & Setup
 
 1. Install requirements:
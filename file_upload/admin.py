@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from file_upload.models import UploadedFile
+from file_upload.models import StorageUsage, UploadedFile
+from file_upload.services.search_service import SearchService
 
 
 @admin.register(UploadedFile)
@@ -17,7 +18,24 @@ class UploadedFileAdmin(admin.ModelAdmin):
         'created_at', 'updated_at'
     ]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the search index instead of the default icontains scan
+        if not search_term.strip():
+            return queryset, False
+        return SearchService.search(search_term, queryset), False
+
     def file_size_mb(self, obj):
         return f"{obj.file_size / (1024 * 1024):.2f} MB"
 
     file_size_mb.short_description = "File Size"
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ['day', 'tenant', 'storage_backend', 'file_type', 'file_count', 'total_bytes']
+    list_filter = ['storage_backend', 'file_type', 'day']
+    search_fields = ['tenant']
+    readonly_fields = ['tenant', 'storage_backend', 'file_type', 'day', 'file_count', 'total_bytes']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,162 @@
+"""
+Per-process memory budget for uploads in flight
+
+Each upload reserves the memory it may hold, which is its size up to
+FILE_UPLOAD_MAX_MEMORY_SIZE (larger uploads are spooled to disk by Django's
+upload handlers and FileUploadService) plus a fixed allowance for buffers.
+When the reservations would exceed FILE_UPLOAD_MEMORY_BUDGET the request
+waits briefly for memory to be released, then is rejected with 503 and a
+Retry-After derived from how long uploads have recently held their memory.
+"""
+import functools
+import math
+import threading
+import time
+from typing import Any, Dict
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from file_upload.metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Upload memory budget exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    def __init__(self, budget: int, queue_timeout: float = 2.0, max_waiting: int = 20):
+        self.budget = budget
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self.in_use = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._hold_seconds = None
+        self._condition = threading.Condition()
+
+    def acquire(self, cost: int) -> int:
+        """
+        Reserve `cost` bytes, waiting up to `queue_timeout` for them
+
+        A cost above the whole budget is capped to it, so any single upload
+        can be admitted once the process is idle.
+
+        Returns:
+            int: The reserved amount, to pass to release()
+
+        Raises:
+            AdmissionRejected: If the bytes could not be reserved in time
+        """
+        cost = min(cost, self.budget)
+        with self._condition:
+            if self.in_use + cost > self.budget:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise AdmissionRejected(self.retry_after())
+
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.in_use + cost <= self.budget, timeout=self.queue_timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    raise AdmissionRejected(self.retry_after())
+
+            self.in_use += cost
+            self.admitted += 1
+            return cost
+
+    def release(self, cost: int, held_seconds: float):
+        with self._condition:
+            self.in_use -= cost
+            # Exponentially weighted average of how long uploads hold memory
+            if self._hold_seconds is None:
+                self._hold_seconds = held_seconds
+            else:
+                self._hold_seconds += 0.2 * (held_seconds - self._hold_seconds)
+            self._condition.notify_all()
+
+    def retry_after(self) -> int:
+        if self._hold_seconds is None:
+            return getattr(settings, 'FILE_UPLOAD_ADMISSION_RETRY_AFTER', 5)
+        return min(max(math.ceil(self._hold_seconds), 1), 60)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'budget_bytes': self.budget,
+                'in_use_bytes': self.in_use,
+                'utilization': round(self.in_use / self.budget, 4) if self.budget else 0,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_memory_budget() -> MemoryBudget:
+    """The process-wide budget, recreated if its settings change"""
+    global _budget
+    config = (
+        getattr(settings, 'FILE_UPLOAD_MEMORY_BUDGET', 256 * 1024 * 1024),
+        getattr(settings, 'FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT', 2.0),
+        getattr(settings, 'FILE_UPLOAD_ADMISSION_MAX_WAITING', 20),
+    )
+    with _budget_lock:
+        if _budget is None or (_budget.budget, _budget.queue_timeout, _budget.max_waiting) != config:
+            _budget = MemoryBudget(*config)
+        return _budget
+
+
+def upload_cost(request) -> int:
+    """Bytes an upload may hold in memory; uploads without a Content-Length are charged the maximum"""
+    threshold = settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    held = min(content_length, threshold) if content_length > 0 else threshold
+    return held + getattr(settings, 'FILE_UPLOAD_ADMISSION_OVERHEAD', 256 * 1024)
+
+
+def admit_upload(view):
+    """Run `view` under a memory reservation, answering 503 with Retry-After when none is available"""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        budget = get_memory_budget()
+        try:
+            reserved = budget.acquire(upload_cost(request))
+        except AdmissionRejected as e:
+            metrics.inc('file_upload_admission_rejected_total')
+            response = JsonResponse({'error': 'Too many uploads in progress, retry later'}, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+        started = time.monotonic()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            budget.release(reserved, time.monotonic() - started)
+
+    return wrapper
+
+
+def _collect_budget_metrics():
+    snapshot = get_memory_budget().snapshot()
+    yield 'file_upload_memory_budget_bytes', {}, snapshot['budget_bytes']
+    yield 'file_upload_memory_in_use_bytes', {}, snapshot['in_use_bytes']
+    yield 'file_upload_admission_waiting', {}, snapshot['waiting']
+
+
+metrics.register_collector(_collect_budget_metrics)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class FileUploadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'file_upload'
+
+    def ready(self):
+        from django.core import checks
+
+        from file_upload import signals  # noqa: F401
+        from file_upload.services.cache_service import check_shared_cache
+        from file_upload.throttling import check_rate_limit_store
+
+        checks.register(check_rate_limit_store)
+        checks.register(check_shared_cache)
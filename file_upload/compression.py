@@ -0,0 +1,248 @@
+"""
+Compression at rest for compressible uploads
+
+Uploads that are large enough, not in an already-compressed format and
+whose first SAMPLE_SIZE bytes actually shrink are compressed while they
+stream to storage. Compressed objects get the encoding's suffix on their
+storage key (`reports/<uuid>.csv.gz`), so the encoding is known from the
+key alone, and `metadata['compression']` records the encoding and sizes.
+zstd needs the optional `zstandard` package; without it gzip is used.
+"""
+import os
+import zlib
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+SUFFIXES = {GZIP: '.gz', ZSTD: '.zst'}
+
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Formats whose content is already compressed; compressing them again costs CPU for nothing
+COMPRESSED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif', 'heic', 'heif',
+    'mp4', 'm4v', 'mov', 'webm', 'mkv', 'avi', 'mp3', 'm4a', 'aac', 'ogg', 'opus', 'flac',
+    'zip', 'gz', 'tgz', 'bz2', 'xz', 'zst', '7z', 'rar',
+    'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'epub', 'jar', 'apk',
+}
+
+# Leading bytes of compressed formats, for uploads with a misleading or no extension
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b', b'PK\x03\x04', b'\x28\xb5\x2f\xfd', b'BZh', b'\xfd7zXZ', b'7z\xbc\xaf', b'Rar!',
+    b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'RIFF', b'OggS', b'fLaC', b'ID3', b'\x1a\x45\xdf\xa3',
+)
+
+
+def choose_encoding(sample: bytes, filename: str, size: Optional[int] = None) -> Optional[str]:
+    """
+    Encoding to store an upload with, or None to store it as is
+
+    FILE_UPLOAD_COMPRESSION_ALGORITHM 'auto' picks zstd (when installed) for
+    uploads of at least FILE_UPLOAD_COMPRESSION_ZSTD_MIN_SIZE bytes or of
+    unknown size, and gzip for smaller ones.
+    """
+    if not getattr(settings, 'FILE_UPLOAD_COMPRESSION_ENABLED', False):
+        return None
+
+    min_size = getattr(settings, 'FILE_UPLOAD_COMPRESSION_MIN_SIZE', 8 * 1024)
+    if (size if size is not None else len(sample)) < min_size or len(sample) < min(min_size, SAMPLE_SIZE):
+        return None
+    if os.path.splitext(filename)[1].lower().lstrip('.') in COMPRESSED_EXTENSIONS:
+        return None
+    if sample.startswith(COMPRESSED_SIGNATURES) or sample[4:8] == b'ftyp':
+        return None
+    # A fast deflate of the sample tells whether the rest is worth compressing
+    if len(zlib.compress(sample, 1)) > len(sample) * getattr(settings, 'FILE_UPLOAD_COMPRESSION_MAX_RATIO', 0.9):
+        return None
+
+    algorithm = getattr(settings, 'FILE_UPLOAD_COMPRESSION_ALGORITHM', 'auto')
+    if algorithm == ZSTD or algorithm == 'auto':
+        large = size is None or size >= getattr(settings, 'FILE_UPLOAD_COMPRESSION_ZSTD_MIN_SIZE', 1024 * 1024)
+        if zstandard is not None and (algorithm == ZSTD or large):
+            return ZSTD
+    return GZIP
+
+
+def prepare(file, filename: str) -> Tuple[object, Optional[str]]:
+    """
+    Sniff the start of an upload and choose its encoding
+
+    Returns the file to read from, positioned where it was, which is a
+    wrapper replaying the sample when the upload cannot seek.
+    """
+    if not getattr(settings, 'FILE_UPLOAD_COMPRESSION_ENABLED', False):
+        return file, None
+
+    size = getattr(file, 'size', None)
+    seekable = getattr(file, 'seekable', None)
+    if seekable() if callable(seekable) else hasattr(file, 'seek'):
+        position = file.tell()
+        sample = file.read(SAMPLE_SIZE)
+        file.seek(position)
+    else:
+        sample = file.read(SAMPLE_SIZE)
+        file = _Replay(sample, file)
+    return file, choose_encoding(sample, filename, size)
+
+
+def stored_key(key: str, encoding: Optional[str]) -> str:
+    return f"{key}{SUFFIXES[encoding]}" if encoding else key
+
+
+def encoding_for_key(key: str) -> Optional[str]:
+    for encoding, suffix in SUFFIXES.items():
+        if key.endswith(suffix):
+            return encoding
+    return None
+
+
+def original_key(key: str) -> str:
+    encoding = encoding_for_key(key)
+    return key[:-len(SUFFIXES[encoding])] if encoding else key
+
+
+def encoding_for(uploaded_file) -> Optional[str]:
+    return ((uploaded_file.metadata or {}).get('compression') or {}).get('encoding')
+
+
+def accepts(request, encoding: str) -> bool:
+    """Whether the request's Accept-Encoding allows `encoding`"""
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() in (encoding, '*') or (encoding == GZIP and name.strip().lower() == 'x-gzip'):
+            quality = params.strip()
+            try:
+                return not quality.startswith('q=') or float(quality[2:]) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def decoded(stream, encoding: Optional[str]):
+    """`stream` of stored bytes as a stream of the original content"""
+    return DecompressingReader(stream, encoding) if encoding else stream
+
+
+class _Replay:
+    """A non-seekable stream whose first bytes were already read"""
+
+    def __init__(self, head: bytes, stream):
+        self.head = head
+        self.stream = stream
+        self.name = getattr(stream, 'name', None)
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.head:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.stream.read(), b''
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        return data
+
+
+class _Coder:
+    """Reads `stream` through an incremental compressor or decompressor"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.in_bytes = 0
+        self.out_bytes = 0
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _process(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def _finish(self) -> bytes:
+        raise NotImplementedError
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self.stream.read(CHUNK_SIZE)
+            if chunk:
+                self.in_bytes += len(chunk)
+                self._buffer += self._process(chunk)
+            else:
+                self._buffer += self._finish()
+                self._eof = True
+
+        if size is None or size < 0:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        self.out_bytes += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def __iter__(self):
+        while True:
+            data = self.read(CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            close()
+
+
+class CompressingReader(_Coder):
+    """Compressed view of a stream, produced as it is read"""
+
+    def __init__(self, stream, encoding: str):
+        super().__init__(stream)
+        self.encoding = encoding
+        if encoding == ZSTD:
+            level = getattr(settings, 'FILE_UPLOAD_COMPRESSION_ZSTD_LEVEL', 3)
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            level = getattr(settings, 'FILE_UPLOAD_COMPRESSION_GZIP_LEVEL', 6)
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def _process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def _finish(self) -> bytes:
+        return self._compressor.flush()
+
+    def summary(self) -> dict:
+        """metadata['compression'] of the stored object, once it has been read to the end"""
+        return {
+            'encoding': self.encoding,
+            'stored_size': self.out_bytes,
+            'ratio': round(self.out_bytes / self.in_bytes, 4) if self.in_bytes else None,
+        }
+
+
+class DecompressingReader(_Coder):
+    """Original content of a stream of compressed bytes, decoded as it is read"""
+
+    def __init__(self, stream, encoding: str):
+        super().__init__(stream)
+        if encoding == ZSTD:
+            if zstandard is None:
+                raise RuntimeError('Reading zstd compressed files requires the zstandard package')
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            self._decompressor = zlib.decompressobj(31)
+
+    def _process(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+    def _finish(self) -> bytes:
+        flush = getattr(self._decompressor, 'flush', None)
+        return flush() if flush is not None else b''
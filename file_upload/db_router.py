@@ -0,0 +1,167 @@
+"""
+Read-replica routing with read-your-writes stickiness
+
+Reads of FILE_UPLOAD_DB_REPLICA_MODELS go to a healthy replica of
+FILE_UPLOAD_DB_REPLICAS; everything else, and every write, goes to the
+primary ('default'). Reads go to the primary instead:
+
+- inside a transaction, so read-modify-write code never sees stale rows;
+- for the rest of a request once it has written anything;
+- for FILE_UPLOAD_DB_STICKY_SECONDS after a client's last write, so an
+  upload or delete is visible to the requests that follow it although the
+  replicas have not replayed it yet (see ReplicaPinMiddleware).
+
+Replicas are checked at most every FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL
+seconds per process; a replica that fails the check, or a PostgreSQL replica
+more than FILE_UPLOAD_DB_REPLICA_MAX_LAG seconds behind, gets no reads until
+it passes again. With no healthy replica, reads go to the primary.
+"""
+import contextvars
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+from file_upload.metrics import metrics
+from file_upload.throttling import client_key
+
+_pinned = contextvars.ContextVar('file_upload_db_pinned', default=False)
+_wrote = contextvars.ContextVar('file_upload_db_wrote', default=False)
+
+PIN_KEY_PREFIX = 'file_upload:db-pin:'
+
+
+def get_replicas():
+    return getattr(settings, 'FILE_UPLOAD_DB_REPLICAS', [])
+
+
+class ReplicaHealth:
+    """Per-process health of the replicas, checked at most every interval"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias: str) -> bool:
+        interval = getattr(settings, 'FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL', 5.0)
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(alias)
+            if state is not None and now - state[0] < interval:
+                return state[1]
+            # Other threads keep the previous result while this one checks
+            self._states[alias] = (now, state[1] if state else True)
+
+        healthy = self.check(alias)
+        with self._lock:
+            self._states[alias] = (time.monotonic(), healthy)
+        metrics.set('file_upload_db_replica_up', 1 if healthy else 0, alias=alias)
+        return healthy
+
+    @staticmethod
+    def check(alias: str) -> bool:
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # Seconds since the last replayed transaction, 0 when fully caught up
+                    cursor.execute(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                    )
+                    lag = cursor.fetchone()[0] or 0
+                    return lag <= getattr(settings, 'FILE_UPLOAD_DB_REPLICA_MAX_LAG', 30)
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            return True
+        except DatabaseError as e:
+            print(f"Health check of database {alias} failed: {str(e)}")
+            connection.close_if_unusable_or_obsolete()
+            return False
+
+    def snapshot(self) -> Dict[str, Optional[bool]]:
+        with self._lock:
+            return {alias: self._states.get(alias, (None, None))[1] for alias in get_replicas()}
+
+    def reset(self):
+        with self._lock:
+            self._states = {}
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """Database router of DATABASE_ROUTERS; see the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or model._meta.label_lower not in getattr(
+                settings, 'FILE_UPLOAD_DB_REPLICA_MODELS', ['file_upload.uploadedfile']
+        ):
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects are read from where the instance came from
+            return instance._state.db
+        if _pinned.get() or connections['default'].in_atomic_block:
+            return 'default'
+
+        healthy = [alias for alias in replicas if replica_health.is_healthy(alias)]
+        if not healthy:
+            metrics.inc('file_upload_db_replica_fallback_total')
+            return 'default'
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        if get_replicas():
+            _pinned.set(True)
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary through replication
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins a client's reads to the primary for FILE_UPLOAD_DB_STICKY_SECONDS after it writes
+
+    Clients are identified as for rate limiting (throttling.client_key), so
+    API clients without cookies get their own writes back too. The pins live
+    in the cache (FILE_UPLOAD_CACHE_ALIAS), shared by every process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        cache = caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+        key = f"{PIN_KEY_PREFIX}{client_key(request)}"
+        pinned_token = _pinned.set(bool(cache.get(key)))
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                cache.set(key, True, timeout=getattr(settings, 'FILE_UPLOAD_DB_STICKY_SECONDS', 5))
+            return response
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
@@ -0,0 +1,173 @@
+"""
+Idempotency-Key support for mutating endpoints
+
+The first request with a key claims an IdempotencyKey row; its response is
+stored when it completes and replayed to every retry with the same key
+until FILE_UPLOAD_IDEMPOTENCY_TTL expires. Keys are scoped to the client
+sending them, identified as for rate limiting. A retry arriving while the first
+request is still running waits for it (up to FILE_UPLOAD_IDEMPOTENCY_WAIT
+seconds) instead of uploading again. Server errors, 429s and exceptions
+release the key so the request can be retried for real.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from file_upload.metrics import metrics
+from file_upload.models import IdempotencyKey
+from file_upload.throttling import client_key
+
+HEADER = 'Idempotency-Key'
+
+
+class IdempotencyError(Exception):
+    status = 409
+
+    def response(self) -> JsonResponse:
+        return JsonResponse({'error': str(self)}, status=self.status)
+
+
+class KeyReused(IdempotencyError):
+    status = 422
+
+
+class RequestInProgress(IdempotencyError):
+    status = 409
+
+
+def scoped_key(request, key: str) -> str:
+    """Stored form of the request's `key`, so two clients choosing the same key do not share it"""
+    return hashlib.sha256(f"{client_key(request)}\n{key}".encode()).hexdigest()
+
+
+def fingerprint(request) -> str:
+    """
+    Identity of the request a key was first used for
+
+    The method, path, query string, media type and, except for multipart
+    bodies, Content-Length. Multipart bodies of identical retries differ in
+    their boundary, so neither they nor their length can be compared.
+    """
+    content_type = request.content_type or ''
+    source = f"{request.method} {request.path}?{request.META.get('QUERY_STRING', '')}\n{content_type}"
+    if not content_type.startswith('multipart/'):
+        source += f"\n{request.META.get('CONTENT_LENGTH') or ''}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def claim(key: str, request_fingerprint: str) -> IdempotencyKey:
+    """
+    Claim `key` for a new request, or return its completed record
+
+    Raises:
+        KeyReused: If the key was used for a different request
+        RequestInProgress: If the request holding the key did not finish in time
+    """
+    ttl = timedelta(seconds=getattr(settings, 'FILE_UPLOAD_IDEMPOTENCY_TTL', 24 * 3600))
+    lock_timeout = timedelta(seconds=getattr(settings, 'FILE_UPLOAD_IDEMPOTENCY_LOCK_TIMEOUT', 300))
+    deadline = time.monotonic() + getattr(settings, 'FILE_UPLOAD_IDEMPOTENCY_WAIT', 30)
+
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    key=key, fingerprint=request_fingerprint, locked_at=now, expires_at=now + ttl
+                )
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue
+        if record.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            continue
+        if record.fingerprint != request_fingerprint:
+            raise KeyReused(f'{HEADER} was already used for a different request')
+        if record.status == IdempotencyKey.COMPLETED:
+            return record
+
+        if record.locked_at <= now - lock_timeout:
+            # The request holding the key died without releasing it
+            taken_over = IdempotencyKey.objects.filter(
+                pk=record.pk, status=IdempotencyKey.IN_PROGRESS, locked_at=record.locked_at
+            ).update(locked_at=now)
+            if taken_over:
+                record.locked_at = now
+                return record
+            continue
+
+        if time.monotonic() >= deadline:
+            raise RequestInProgress('A request with this Idempotency-Key is still in progress')
+        time.sleep(getattr(settings, 'FILE_UPLOAD_IDEMPOTENCY_POLL_INTERVAL', 0.2))
+
+
+def complete(record: IdempotencyKey, response):
+    if response.status_code >= 500 or response.status_code == 429:
+        release(record)
+        return
+
+    body = getattr(response, 'data', None)
+    if body is None and response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(response.content or b'null')
+
+    record.status = IdempotencyKey.COMPLETED
+    record.response_status = response.status_code
+    record.response_body = body
+    record.save(update_fields=['status', 'response_status', 'response_body'])
+
+
+def release(record: IdempotencyKey):
+    IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.IN_PROGRESS).delete()
+
+
+def replay(record: IdempotencyKey) -> HttpResponse:
+    if record.response_body is None:
+        response = HttpResponse(status=record.response_status)
+    else:
+        response = JsonResponse(record.response_body, status=record.response_status, safe=False)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired() -> int:
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def idempotent(view):
+    """Honor the Idempotency-Key header on `view`; requests without one run as usual"""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'error': f'{HEADER} must be at most 255 characters'}, status=400)
+
+        try:
+            record = claim(scoped_key(request, key), fingerprint(request))
+        except IdempotencyError as e:
+            return e.response()
+
+        if record.status == IdempotencyKey.COMPLETED:
+            metrics.inc('file_upload_idempotent_replays_total')
+            return replay(record)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            release(record)
+            raise
+        complete(record, response)
+        return response
+
+    return wrapper
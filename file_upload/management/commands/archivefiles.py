@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from file_upload.services.cold_archive_service import ColdArchiveService
+
+
+class Command(BaseCommand):
+    help = 'Move files of months older than the archive age out of the hot table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=getattr(settings, 'FILE_UPLOAD_ARCHIVE_AFTER_DAYS', 365),
+            help='Archive whole months of files created more than this many days ago'
+        )
+        parser.add_argument(
+            '--month',
+            type=str,
+            help='Archive only this month (YYYY-MM), if it is old enough'
+        )
+        parser.add_argument(
+            '--to',
+            choices=ColdArchiveService.DESTINATIONS,
+            default=getattr(settings, 'FILE_UPLOAD_ARCHIVE_DESTINATION', 'table'),
+            help='Keep records in the archive table or in compressed NDJSON files'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'FILE_UPLOAD_ARCHIVE_BATCH_SIZE', 1000),
+            help='Number of files moved per transaction'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be archived without moving anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0:
+            raise CommandError('--older-than-days must not be negative')
+
+        months = ColdArchiveService.cold_partitions(options['older_than_days'])
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must be YYYY-MM')
+            months = [m for m in months if m == month]
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No files will be moved'))
+
+        totals = {'archived': 0, 'kept': 0}
+        for month in months:
+            counts = ColdArchiveService.archive_partition(
+                month,
+                destination=options['to'],
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+            )
+            self.stdout.write(f"{month:%Y-%m}: {counts['archived']} archived, {counts['kept']} kept")
+            for key in totals:
+                totals[key] += counts[key]
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{totals['archived']} files from {len(months)} months {'would be ' if options['dry_run'] else ''}"
+                f"archived to {options['to']}; {totals['kept']} kept as previous versions of hot files"
+            )
+        )
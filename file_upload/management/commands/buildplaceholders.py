@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from file_upload.services.placeholder_service import PlaceholderService
+
+
+class Command(BaseCommand):
+    help = 'Compute low-quality placeholders and dominant colors of stored images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of files loaded per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of images downloaded and decoded concurrently'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many files'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute placeholders of images that already have one'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Compute placeholders without saving them'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No placeholders will be saved'))
+
+        def on_file(uploaded_file, placeholder, error):
+            if error is not None:
+                self.stderr.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {error}")
+            elif options['verbosity'] > 1 or options['dry_run']:
+                result = placeholder.get('error') or f"{placeholder['color']}, {len(placeholder['data_uri'])} chars"
+                self.stdout.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {result}")
+
+        counts = PlaceholderService.backfill(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            limit=options['limit'],
+            force=options['force'],
+            dry_run=options['dry_run'],
+            on_file=on_file,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {counts['created']} placeholders, {counts['unreadable']} unreadable, "
+                f"{counts['failed']} failed"
+            )
+        )
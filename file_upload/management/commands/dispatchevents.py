@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from file_upload.services.event_service import EventService
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending file events to FILE_UPLOAD_WEBHOOK_URL in signed batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of events per webhook request (defaults to FILE_UPLOAD_WEBHOOK_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep dispatching until interrupted'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between runs with --loop when no events are pending'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            progress = EventService.dispatch(batch_size=options['batch_size'])
+            if progress['batches'] or not options['loop']:
+                self.stdout.write(
+                    f"{progress['delivered']} events delivered, {progress['failed']} failed "
+                    f"in {progress['batches']} batches"
+                )
+            if not options['loop']:
+                return
+            if not progress['delivered']:
+                time.sleep(options['interval'])
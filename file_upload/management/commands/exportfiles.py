@@ -0,0 +1,64 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from file_upload.services.export_service import ExportService
+
+
+class Command(BaseCommand):
+    help = 'Stream UploadedFile records as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            type=str,
+            default='ndjson',
+            choices=list(ExportService.FORMATS),
+            help='Output format'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Output file path (defaults to stdout)'
+        )
+        parser.add_argument('--created-after', type=str, help='Only records created at or after this date')
+        parser.add_argument('--created-before', type=str, help='Only records created before this date')
+        parser.add_argument(
+            '--storage-backend',
+            type=str,
+            choices=['cloudinary', 's3', 'local', 'chunks'],
+            help='Only records stored in this backend'
+        )
+        parser.add_argument(
+            '--file-type',
+            type=str,
+            choices=['image', 'document', 'video', 'audio', 'other'],
+            help='Only records of this file type'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of rows fetched from the database per round trip'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            queryset = ExportService.build_queryset(
+                created_after=options['created_after'],
+                created_before=options['created_before'],
+                storage_backend=options['storage_backend'],
+                file_type=options['file_type'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in ExportService.stream(queryset, options['format'], options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from file_upload.utils import get_storage_backend
+
+
+class Command(BaseCommand):
+    help = 'Delete chunk store chunks that no stored file references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            help='Keep unreferenced chunks written within this many hours '
+                 '(defaults to FILE_UPLOAD_CHUNK_STORE_GC_GRACE)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be deleted without deleting anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['grace_hours'] is not None:
+            grace_seconds = options['grace_hours'] * 3600
+        else:
+            grace_seconds = getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_GC_GRACE', 24 * 3600)
+        if grace_seconds < 0:
+            raise CommandError('--grace-hours must not be negative')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No chunks will be deleted'))
+
+        result = get_storage_backend('chunks').collect_garbage(grace_seconds, dry_run=options['dry_run'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {result['chunks']} chunks against {result['manifests']} manifests: "
+                f"{result['deleted_chunks']} unreferenced chunks ({result['deleted_bytes']} bytes) "
+                f"{'would be ' if options['dry_run'] else ''}deleted"
+            )
+        )
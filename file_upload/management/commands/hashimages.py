@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from file_upload.services.image_hash_service import ImageHashService
+
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes of stored images missing from the near-duplicate index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of files loaded per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of images downloaded and hashed concurrently'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many files'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Hash images without saving the hashes'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No hashes will be saved'))
+
+        def on_file(uploaded_file, hashes, error):
+            if error is not None:
+                self.stderr.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {error}")
+            elif options['verbosity'] > 1 or options['dry_run']:
+                result = ImageHashService.describe(hashes) if hashes else 'unreadable'
+                self.stdout.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {result}")
+
+        counts = ImageHashService.backfill(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            limit=options['limit'],
+            dry_run=options['dry_run'],
+            on_file=on_file,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Hashed {counts['hashed']} images, {counts['unreadable']} unreadable, {counts['failed']} failed"
+            )
+        )
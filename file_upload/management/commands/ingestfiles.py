@@ -0,0 +1,96 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from file_upload.services.ingest_service import IngestError, IngestService
+
+
+class Command(BaseCommand):
+    help = 'Upload a local directory tree or the files of a CSV/JSONL manifest in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory to walk, or a .csv/.jsonl manifest of files')
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='Progress file to resume from (defaults to <source>.ingest-checkpoint.json)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start from the beginning'
+        )
+        parser.add_argument(
+            '--tenant',
+            type=str,
+            help='Tenant of the ingested files, unless the manifest gives a request_id'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'FILE_UPLOAD_INGEST_WORKERS', 8),
+            help='Number of files uploaded concurrently'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'FILE_UPLOAD_INGEST_BATCH_SIZE', 200),
+            help='Number of files uploaded and inserted per batch'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many files'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+
+        checkpoint = options['checkpoint'] or f"{os.path.abspath(options['source']).rstrip(os.sep)}.ingest-checkpoint.json"
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elif os.path.exists(checkpoint):
+            self.stdout.write(f'Resuming from {checkpoint}')
+
+        request_id = None
+        if options['tenant']:
+            request_id = f"{options['tenant']}{settings.FILE_UPLOAD_TENANT_SEPARATOR}{uuid.uuid4()}"
+
+        def on_batch(progress):
+            self.stdout.write(
+                f"Batch {progress['batches']}: {progress['files']} files, {progress['failed']} failed, "
+                f"{self._rates(progress)}"
+            )
+
+        def on_error(item, error):
+            self.stderr.write(f"{item.name}: {error}")
+
+        try:
+            progress = IngestService.ingest(
+                options['source'],
+                checkpoint=checkpoint,
+                request_id=request_id,
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                limit=options['limit'],
+                on_batch=on_batch,
+                on_error=on_error,
+            )
+        except IngestError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ingested {progress['files']} files ({progress['bytes']} bytes) in {progress['seconds']:.1f}s, "
+                f"{self._rates(progress)}; {progress['duplicates']} near-duplicates, {progress['failed']} failed. "
+                f"Request ID: {progress['request_id']}"
+            )
+        )
+
+    @staticmethod
+    def _rates(progress) -> str:
+        seconds = max(progress['seconds'], 1e-6)
+        return f"{progress['files'] / seconds:.1f} files/s, {progress['bytes'] / seconds / (1024 * 1024):.2f} MB/s"
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from file_upload.services.media_service import MediaMetadataService
+
+
+class Command(BaseCommand):
+    help = 'Record duration, codecs, dimensions and bitrate of stored audio and video files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of files loaded per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of files probed concurrently'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many files'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Probe files that already have media metadata again'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be recorded without saving it'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No metadata will be saved'))
+
+        def on_file(uploaded_file, media, error):
+            if error is not None:
+                self.stderr.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {error}")
+            elif options['verbosity'] > 1 or options['dry_run']:
+                self.stdout.write(f"{uploaded_file.id} {uploaded_file.original_filename}: {media}")
+
+        counts = MediaMetadataService.backfill(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            limit=options['limit'],
+            force=options['force'],
+            dry_run=options['dry_run'],
+            on_file=on_file,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Probed {counts['probed']} files, {counts['unparsable']} unparsable, {counts['failed']} failed"
+            )
+        )
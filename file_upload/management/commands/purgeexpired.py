@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from file_upload import idempotency
+from file_upload.services.cloudinary_service import CloudinaryNotificationService
+from file_upload.services.event_service import EventService
+from file_upload.services.retention_service import RetentionService
+
+
+class Command(BaseCommand):
+    help = 'Delete expired files from storage and the database in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of files deleted per batch (defaults to FILE_UPLOAD_PURGE_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many batches'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many files would be purged without deleting anything'
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No files will be deleted'))
+
+        progress = RetentionService.purge(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+            on_batch=lambda p: self.stdout.write(
+                f"Batch {p['batches']}: {p['deleted_records']} records purged, "
+                f"{p['failed_objects']} objects failed"
+            ),
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purge {'completed' if progress['finished'] else 'stopped'}: "
+                f"{progress['deleted_records']} records, {progress['deleted_objects']} objects deleted, "
+                f"{progress['failed_objects']} objects failed"
+            )
+        )
+
+        if not options['dry_run']:
+            self.stdout.write(f'Removed {idempotency.purge_expired()} expired idempotency keys')
+            self.stdout.write(f'Removed {EventService.purge()} old file events')
+            self.stdout.write(f'Removed {CloudinaryNotificationService.purge()} unmatched Cloudinary notifications')
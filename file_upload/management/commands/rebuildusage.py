@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from file_upload.services.usage_service import UsageService
+
+
+class Command(BaseCommand):
+    help = 'Recompute storage usage statistics from the file records and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift without rewriting the statistics'
+        )
+
+    def handle(self, *args, **options):
+        computed = UsageService.compute()
+        drift = UsageService.drift(computed)
+
+        for bucket, delta in sorted(drift.items()):
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Drift in {bucket.tenant or '-'}/{bucket.storage_backend}/{bucket.file_type}/{bucket.day}: "
+                    f"{delta['file_count']:+d} files, {delta['total_bytes']:+d} bytes"
+                )
+            )
+
+        if options['check']:
+            self.stdout.write(f'{len(drift)} of {len(computed)} buckets drifted')
+            return
+
+        UsageService.rebuild(computed)
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {len(computed)} usage buckets ({len(drift)} had drifted)')
+        )
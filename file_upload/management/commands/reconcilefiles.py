@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from file_upload.services.reconcile_service import ReconcileError, ReconcileService
+
+
+class Command(BaseCommand):
+    help = 'Find (and optionally remove) storage objects without records and records without storage objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            type=str,
+            required=True,
+            choices=['cloudinary', 's3', 'local', 'chunks'],
+            help='Storage backend to reconcile'
+        )
+        parser.add_argument(
+            '--prefix',
+            type=str,
+            action='append',
+            help='Only reconcile keys under this prefix (repeatable, e.g. --prefix images/ --prefix documents/)'
+        )
+        parser.add_argument(
+            '--fix-storage',
+            action='store_true',
+            help='Delete storage objects that have no database record'
+        )
+        parser.add_argument(
+            '--fix-records',
+            action='store_true',
+            help='Delete database records whose storage object is missing'
+        )
+        parser.add_argument(
+            '--min-age-hours',
+            type=float,
+            default=1,
+            help='Ignore objects and records younger than this, as their upload may still be in progress'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of orphans deleted per bulk request'
+        )
+        parser.add_argument(
+            '--verbose-orphans',
+            action='store_true',
+            help='Print every orphan found'
+        )
+
+    def handle(self, *args, **options):
+        service = ReconcileService(
+            backend=options['backend'],
+            fix_storage=options['fix_storage'],
+            fix_records=options['fix_records'],
+            min_age=timedelta(hours=options['min_age_hours']),
+            batch_size=options['batch_size'],
+            on_orphan=self._print_orphan if options['verbose_orphans'] else None,
+        )
+
+        for prefix in options['prefix'] or ['']:
+            self.stdout.write(f"Reconciling {options['backend']} prefix '{prefix}'")
+            try:
+                report = service.reconcile(prefix)
+            except ReconcileError as e:
+                raise CommandError(str(e))
+
+            if not options['verbose_orphans']:
+                for sample in report.samples:
+                    self.stdout.write(f'  {sample}')
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Scanned {report.scanned_objects} objects and {report.scanned_records} records: "
+                    f"{report.matched} matched, {report.storage_orphans} storage orphans, "
+                    f"{report.record_orphans} record orphans, {report.skipped_recent} too recent to judge"
+                )
+            )
+            if options['fix_storage'] or options['fix_records']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Deleted {report.deleted_objects} objects and {report.deleted_records} records"
+                    )
+                )
+
+    def _print_orphan(self, kind, description):
+        self.stdout.write(f'  {kind}: {description}')
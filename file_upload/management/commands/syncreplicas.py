@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the SQLite read replicas (local replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep copying every this many seconds, which is then the replication lag'
+        )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replicas = [
+            alias for alias in getattr(settings, 'FILE_UPLOAD_DB_REPLICAS', [])
+            if settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3'
+        ]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('The primary database is not SQLite; use the database\'s own replication')
+        if not replicas:
+            raise CommandError('No SQLite replicas configured (set DB_REPLICA_NAMES)')
+
+        while True:
+            started = time.monotonic()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for alias in replicas:
+                    target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                    try:
+                        # The online backup API copies a consistent snapshot while both are in use
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Copied {primary['NAME']} to {len(replicas)} replicas in {time.monotonic() - started:.2f}s"
+                )
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
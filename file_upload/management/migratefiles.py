@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
 from file_upload.models import UploadedFile
 from file_upload.utils import get_storage_backend
 
@@ -80,6 +81,8 @@ class Command(BaseCommand):
                     file_obj.storage_backend = to_backend
                     file_obj.public_url = upload_result['public_url']
                     file_obj.secure_url = upload_result.get('secure_url')
+                    # The new backend decides on its own whether to compress
+                    file_obj.metadata.pop('compression', None)
                     file_obj.metadata.update(upload_result.get('metadata', {}))
 
                     # Clear old storage-specific fields and set new ones
@@ -94,7 +97,9 @@ class Command(BaseCommand):
                     elif to_backend == 'local':
                         file_obj.local_path = upload_result['storage_id']
 
-                    file_obj.save()
+                    # Keeps the usage statistics in the same transaction as the record
+                    with transaction.atomic():
+                        file_obj.save()
 
                     self.stdout.write(
                         self.style.SUCCESS(f'Migrated: {file_obj.original_filename}')
@@ -123,18 +128,31 @@ class Command(BaseCommand):
     @staticmethod
     def _download_file_content(file_obj, backend):
         import requests
-        from io import BytesIO
+        import shutil
+        import tempfile
 
+        from file_upload import compression
+
+        # Held in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE, spooled to disk above
+        spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
         try:
             if backend in ['cloudinary', 's3']:
-                response = requests.get(file_obj.secure_url or file_obj.public_url)
-                if response.status_code == 200:
-                    return BytesIO(response.content)
+                with requests.get(file_obj.secure_url or file_obj.public_url, stream=True) as response:
+                    if response.status_code == 200:
+                        # Undoes any transfer encoding; compression at rest is decoded below
+                        response.raw.decode_content = True
+                        stream = compression.decoded(response.raw, compression.encoding_for(file_obj))
+                        shutil.copyfileobj(stream, spooled, 64 * 1024)
+                        spooled.seek(0)
+                        return spooled
             elif backend == 'local':
                 if file_obj.local_path:
                     with open(file_obj.local_path, 'rb') as f:
-                        return BytesIO(f.read())
+                        shutil.copyfileobj(compression.decoded(f, compression.encoding_for(file_obj)), spooled, 64 * 1024)
+                    spooled.seek(0)
+                    return spooled
         except Exception as e:
             print(f"Error downloading file: {str(e)}")
 
+        spooled.close()
         return None
\ No newline at end of file
@@ -0,0 +1,422 @@
+"""
+Header-only parsers for common audio and video containers
+
+The parsers read a few small pieces near the start and the end of a file
+through a RangeReader, never the media payload, and return facts such as
+duration, codecs, dimensions and bitrate. Nothing is decoded.
+"""
+import os
+import struct
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class MediaProbeError(Exception):
+    """Raised when a file is not a recognized container or its headers are malformed"""
+
+
+class RangeReader:
+    """
+    Random access over a file through `read_range(offset, length)`
+
+    Reads are served from an LRU of aligned blocks so that the many small
+    header reads of a parser turn into a few range requests. Fetching more
+    than `max_bytes` raises MediaProbeError, which bounds the work done on
+    files whose headers are not where the parsers expect them.
+    """
+
+    def __init__(
+            self,
+            read_range: Callable[[int, int], bytes],
+            size: int,
+            block_size: int = 16 * 1024,
+            max_blocks: int = 16,
+            max_bytes: int = 1024 * 1024
+    ):
+        self.read_range = read_range
+        self.size = size
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.max_bytes = max_bytes
+        self.fetched = 0
+        self.blocks = OrderedDict()
+
+    @classmethod
+    def from_file(cls, file, size: Optional[int] = None, **kwargs) -> 'RangeReader':
+        """Reader over a seekable file object; the caller restores its position"""
+        if size is None:
+            size = file.seek(0, os.SEEK_END)
+
+        def read_range(offset: int, length: int) -> bytes:
+            file.seek(offset)
+            return file.read(length)
+
+        return cls(read_range, size, **kwargs)
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset < 0 or length <= 0 or offset >= self.size:
+            return b''
+        end = min(offset + length, self.size)
+
+        data = bytearray()
+        for index in range(offset // self.block_size, (end - 1) // self.block_size + 1):
+            block = self._block(index)
+            block_start = index * self.block_size
+            data += block[max(offset - block_start, 0):end - block_start]
+        return bytes(data)
+
+    def _block(self, index: int) -> bytes:
+        if index in self.blocks:
+            self.blocks.move_to_end(index)
+            return self.blocks[index]
+
+        start = index * self.block_size
+        length = min(self.block_size, self.size - start)
+        self.fetched += length
+        if self.fetched > self.max_bytes:
+            raise MediaProbeError(f"Headers not found within {self.max_bytes} bytes")
+
+        block = self.read_range(start, length)
+        self.blocks[index] = block
+        if len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return block
+
+
+def probe(reader: RangeReader, filename: str = '') -> Dict[str, Any]:
+    """
+    Media facts of the file behind `reader`
+
+    The container is recognized from its signature; the extension only helps
+    with MP3 streams, which have none. Raises MediaProbeError if no parser
+    applies.
+    """
+    try:
+        head = reader.read(0, 12)
+        if head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+            return _probe_mp4(reader)
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            return _probe_wav(reader)
+
+        # FLAC and MP3 may both start with an ID3v2 tag
+        audio_start = _id3v2_size(head)
+        if reader.read(audio_start, 4) == b'fLaC':
+            return _probe_flac(reader, audio_start)
+        if audio_start or os.path.splitext(filename)[1].lower() == '.mp3' or head[:1] == b'\xff':
+            return _probe_mp3(reader, audio_start)
+    except (struct.error, IndexError, KeyError, ZeroDivisionError) as e:
+        raise MediaProbeError(f"Malformed media headers: {str(e)}") from e
+    raise MediaProbeError('Unrecognized media container')
+
+
+def _bitrate(size: int, duration: Optional[float]) -> Optional[int]:
+    return int(size * 8 / duration) if duration else None
+
+
+# MP4 / MOV
+
+MP4_CONTAINER_BOXES = {b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _boxes(reader: RangeReader, start: int, end: int):
+    """(type, payload offset, payload end) of the boxes between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        header = reader.read(offset, 16)
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise MediaProbeError(f"Invalid {box_type!r} box size at offset {offset}")
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _probe_mp4(reader: RangeReader) -> Dict[str, Any]:
+    result = {'container': 'mp4'}
+    moov = None
+    for box_type, start, end in _boxes(reader, 0, reader.size):
+        if box_type == b'ftyp':
+            if reader.read(start, 4) == b'qt  ':
+                result['container'] = 'mov'
+        elif box_type == b'moov':
+            moov = (start, end)
+            break
+    if moov is None:
+        raise MediaProbeError('No moov box')
+
+    for box_type, start, end in _boxes(reader, *moov):
+        if box_type == b'mvhd':
+            timescale, duration = _mp4_duration(reader, start)
+            if timescale:
+                result['duration'] = round(duration / timescale, 3)
+        elif box_type == b'trak':
+            _probe_mp4_track(reader, start, end, result)
+
+    result['bitrate'] = _bitrate(reader.size, result.get('duration'))
+    return result
+
+
+def _mp4_duration(reader: RangeReader, start: int):
+    """Timescale and duration from an mvhd or mdhd payload"""
+    version = reader.read(start, 1)[0]
+    if version == 1:
+        return struct.unpack('>IQ', reader.read(start + 20, 12))
+    return struct.unpack('>II', reader.read(start + 12, 8))
+
+
+def _probe_mp4_track(reader: RangeReader, start: int, end: int, result: Dict[str, Any]):
+    track = {}
+
+    def walk(walk_start, walk_end):
+        for box_type, box_start, box_end in _boxes(reader, walk_start, walk_end):
+            if box_type in MP4_CONTAINER_BOXES:
+                walk(box_start, box_end)
+            elif box_type == b'tkhd':
+                # Width and height are 16.16 fixed point at the end of the box
+                track['width'], track['height'] = (
+                    value >> 16 for value in struct.unpack('>II', reader.read(box_end - 8, 8))
+                )
+            elif box_type == b'hdlr':
+                track['handler'] = reader.read(box_start + 8, 4)
+            elif box_type == b'stsd':
+                entry = reader.read(box_start + 8, 44)
+                if len(entry) >= 8:
+                    track['codec'] = entry[4:8].decode('latin-1').strip()
+                track['entry'] = entry
+
+    walk(start, end)
+    entry = track.get('entry', b'')
+
+    if track.get('handler') == b'vide' and 'video_codec' not in result:
+        result['video_codec'] = track.get('codec')
+        if len(entry) >= 36:
+            # Visual sample entry: the coded size follows 24 reserved bytes
+            result['width'], result['height'] = struct.unpack('>HH', entry[32:36])
+        if not result.get('width') and track.get('width'):
+            result['width'], result['height'] = track['width'], track['height']
+    elif track.get('handler') == b'soun' and 'audio_codec' not in result:
+        result['audio_codec'] = track.get('codec')
+        if len(entry) >= 36:
+            channels, _, _, _, sample_rate = struct.unpack('>HHHHI', entry[24:36])
+            result['channels'] = channels
+            result['sample_rate'] = sample_rate >> 16
+
+
+# WAV
+
+WAV_CODECS = {1: 'pcm', 2: 'adpcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw', 0x55: 'mp3', 0xFFFE: 'pcm'}
+
+
+def _probe_wav(reader: RangeReader) -> Dict[str, Any]:
+    result = {'container': 'wav'}
+    offset = 12
+    byte_rate = None
+
+    while offset + 8 <= reader.size:
+        chunk_id, chunk_size = struct.unpack('<4sI', reader.read(offset, 8))
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack(
+                '<HHIIHH', reader.read(offset + 8, 16)
+            )
+            result.update(
+                audio_codec=WAV_CODECS.get(audio_format, hex(audio_format)),
+                channels=channels,
+                sample_rate=sample_rate,
+                bits_per_sample=bits,
+                bitrate=byte_rate * 8,
+            )
+        elif chunk_id == b'data':
+            if byte_rate:
+                # Streams written without a known length leave the size at 0 or 0xFFFFFFFF
+                data_size = chunk_size if 0 < chunk_size < 0xFFFFFFFF else reader.size - offset - 8
+                result['duration'] = round(data_size / byte_rate, 3)
+            break
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if 'audio_codec' not in result:
+        raise MediaProbeError('No fmt chunk')
+    return result
+
+
+# FLAC
+
+def _probe_flac(reader: RangeReader, start: int) -> Dict[str, Any]:
+    header = reader.read(start + 4, 4 + 34)
+    if len(header) < 38 or header[0] & 0x7F != 0:
+        raise MediaProbeError('FLAC stream does not start with STREAMINFO')
+
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1, 36 bits total samples
+    packed = int.from_bytes(header[14:22], 'big')
+    sample_rate = packed >> 44
+    channels = (packed >> 41 & 0x7) + 1
+    bits = (packed >> 36 & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+
+    duration = round(total_samples / sample_rate, 3) if sample_rate and total_samples else None
+    return {
+        'container': 'flac',
+        'audio_codec': 'flac',
+        'channels': channels,
+        'sample_rate': sample_rate,
+        'bits_per_sample': bits,
+        'duration': duration,
+        'bitrate': _bitrate(reader.size - start, duration),
+    }
+
+
+# MP3 / ID3
+
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+ID3_TEXT_FRAMES = {b'TIT2': 'title', b'TPE1': 'artist', b'TALB': 'album'}
+
+
+def _id3v2_size(head: bytes) -> int:
+    """Bytes taken by an ID3v2 tag at the start of the file, 0 if there is none"""
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = _syncsafe(head[6:10])
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def _syncsafe(data: bytes) -> int:
+    return data[0] << 21 | data[1] << 14 | data[2] << 7 | data[3]
+
+
+def _probe_mp3(reader: RangeReader, audio_start: int) -> Dict[str, Any]:
+    # Some encoders pad between the tag and the first frame; only look a few KB ahead
+    window = reader.read(audio_start, 8 * 1024)
+    frame = None
+    for position in range(len(window) - 4):
+        if window[position] == 0xFF and window[position + 1] & 0xE0 == 0xE0:
+            frame = _mp3_frame(window[position:position + 4])
+            if frame:
+                frame_offset = audio_start + position
+                break
+    if frame is None:
+        raise MediaProbeError('No MPEG audio frame found')
+
+    result = {
+        'container': 'mp3',
+        'audio_codec': f"mp{frame['layer']}",
+        'sample_rate': frame['sample_rate'],
+        'channels': frame['channels'],
+    }
+
+    audio_end = reader.size
+    if reader.read(reader.size - 128, 3) == b'TAG':
+        audio_end -= 128
+
+    # A Xing/Info or VBRI header in the first frame gives the frame count of VBR files
+    frames = _mp3_frame_count(reader, frame_offset, frame)
+    if frames:
+        result['duration'] = round(frames * frame['samples'] / frame['sample_rate'], 3)
+        result['bitrate'] = _bitrate(audio_end - frame_offset, result['duration'])
+    else:
+        result['bitrate'] = frame['bitrate']
+        result['duration'] = round((audio_end - frame_offset) * 8 / frame['bitrate'], 3)
+
+    tags = _id3v2_tags(reader, audio_start) or _id3v1_tags(reader)
+    result.update(tags)
+    return result
+
+
+def _mp3_frame(header: bytes) -> Optional[Dict[str, Any]]:
+    version_bits = header[1] >> 3 & 0x3
+    layer_bits = header[1] >> 1 & 0x3
+    bitrate_index = header[2] >> 4
+    sample_rate_index = header[2] >> 2 & 0x3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    layer = 4 - layer_bits
+    if layer == 1:
+        samples = 384
+    elif layer == 3 and version != 1:
+        samples = 576
+    else:
+        samples = 1152
+
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000,
+        'sample_rate': MP3_SAMPLE_RATES[version][sample_rate_index],
+        'channels': 1 if header[3] >> 6 == 3 else 2,
+        'samples': samples,
+    }
+
+
+def _mp3_frame_count(reader: RangeReader, frame_offset: int, frame: Dict[str, Any]) -> Optional[int]:
+    if frame['version'] == 1:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+
+    xing = reader.read(frame_offset + 4 + side_info, 12)
+    if xing[:4] in (b'Xing', b'Info') and len(xing) == 12:
+        flags, frames = struct.unpack('>II', xing[4:12])
+        return frames if flags & 0x1 else None
+
+    vbri = reader.read(frame_offset + 4 + 32, 18)
+    if vbri[:4] == b'VBRI' and len(vbri) == 18:
+        return struct.unpack('>I', vbri[14:18])[0]
+    return None
+
+
+def _id3v2_tags(reader: RangeReader, tag_size: int) -> Dict[str, str]:
+    if not tag_size:
+        return {}
+    head = reader.read(0, 10)
+    major = head[3]
+    # Only the first few KB: cover art usually follows the text frames
+    data = reader.read(10, min(tag_size - 10, 4 * 1024))
+
+    tags, offset = {}, 0
+    if head[5] & 0x40 and len(data) >= 4:
+        # Extended header
+        offset = _syncsafe(data[:4]) if major == 4 else struct.unpack('>I', data[:4])[0] + 4
+
+    while offset + 10 <= len(data) and data[offset] != 0:
+        frame_id = data[offset:offset + 4]
+        size_bytes = data[offset + 4:offset + 8]
+        size = _syncsafe(size_bytes) if major == 4 else struct.unpack('>I', size_bytes)[0]
+        body = data[offset + 10:offset + 10 + size]
+        if frame_id in ID3_TEXT_FRAMES and body:
+            tags[ID3_TEXT_FRAMES[frame_id]] = _id3_text(body)
+        offset += 10 + size
+    return {key: value for key, value in tags.items() if value}
+
+
+def _id3_text(body: bytes) -> str:
+    encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(body[0], 'latin-1')
+    return body[1:].decode(encoding, errors='replace').rstrip('\x00').split('\x00')[0].strip()
+
+
+def _id3v1_tags(reader: RangeReader) -> Dict[str, str]:
+    tail = reader.read(reader.size - 128, 128)
+    if tail[:3] != b'TAG':
+        return {}
+    tags = {
+        'title': tail[3:33],
+        'artist': tail[33:63],
+        'album': tail[63:93],
+    }
+    return {
+        key: text for key, text in (
+            (key, value.split(b'\x00')[0].decode('latin-1').strip()) for key, value in tags.items()
+        ) if text
+    }
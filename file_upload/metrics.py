@@ -0,0 +1,57 @@
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+
+class MetricsRegistry:
+    """In-process counters and gauges rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._gauges: Dict[Tuple[str, Tuple], float] = {}
+        self._collectors = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict, float]]]):
+        """
+        Register a callable evaluated at render time
+
+        The collector returns (name, labels, value) tuples, which keeps values
+        that live elsewhere (e.g. circuit breaker state) out of the registry.
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            samples = [(name, labels, value) for (name, labels), value in self._counters.items()]
+            samples += [(name, labels, value) for (name, labels), value in self._gauges.items()]
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            samples += [
+                (name, tuple(sorted(labels.items())), value)
+                for name, labels, value in collector()
+            ]
+
+        lines = []
+        for name, labels, value in sorted(samples, key=lambda s: (s[0], s[1])):
+            if labels:
+                label_str = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'{name}{{{label_str}}} {value}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -1,7 +1,8 @@
 import os
 
 from django.http import JsonResponse
-from django.conf import settings
+
+from file_upload.utils import allowed_extensions, max_file_size
 
 
 class FileUploadMiddleware:
@@ -12,18 +13,15 @@ class FileUploadMiddleware:
         if request.method == 'POST' and request.content_type.startswith('multipart/form-data'):
             if hasattr(request, 'FILES') and request.FILES:
                 for field_name, uploaded_file in request.FILES.items():
-                    if uploaded_file.size > getattr(settings, 'MAX_FILE_SIZE', 10485760):
+                    if uploaded_file.size > max_file_size(uploaded_file.name):
                         return JsonResponse({
                             'error': f'File {uploaded_file.name} exceeds maximum size limit'
                         }, status=413)
 
                     file_ext = os.path.splitext(uploaded_file.name)[1].lower()
-                    allowed_extensions = (
-                            getattr(settings, 'ALLOWED_IMAGE_EXTENSIONS', []) +
-                            getattr(settings, 'ALLOWED_DOCUMENT_EXTENSIONS', [])
-                    )
+                    extensions = allowed_extensions()
 
-                    if allowed_extensions and file_ext not in allowed_extensions:
+                    if extensions and file_ext not in extensions:
                         return JsonResponse({
                             'error': f'File extension {file_ext} is not allowed'
                         }, status=400)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0002_uploadedfile_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant', models.CharField(blank=True, max_length=100)),
+                ('storage_backend', models.CharField(choices=[('cloudinary', 'Cloudinary'), ('s3', 'Amazon S3'), ('local', 'Local Storage')], max_length=20)),
+                ('file_type', models.CharField(choices=[('image', 'Image'), ('document', 'Document'), ('video', 'Video'), ('audio', 'Audio'), ('other', 'Other')], max_length=20)),
+                ('day', models.DateField()),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='file_upload_day_a38f55_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'storage_backend', 'file_type', 'day'), name='unique_storage_usage_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+from file_upload.services.search_service import install_search_index, remove_search_index
+
+
+def populate_search_text(apps, schema_editor):
+    UploadedFile = apps.get_model('file_upload', 'UploadedFile')
+    keys = getattr(settings, 'FILE_UPLOAD_SEARCH_METADATA_KEYS', [])
+
+    batch = []
+    for uploaded_file in UploadedFile.objects.only('id', 'original_filename', 'metadata').iterator(chunk_size=2000):
+        values = [uploaded_file.original_filename]
+        for key in keys:
+            value = (uploaded_file.metadata or {}).get(key)
+            if isinstance(value, (list, tuple)):
+                values.extend(str(item) for item in value)
+            elif value not in (None, ''):
+                values.append(str(value))
+        uploaded_file.search_text = ' '.join(values)
+        batch.append(uploaded_file)
+
+        if len(batch) >= 2000:
+            UploadedFile.objects.bulk_update(batch, ['search_text'])
+            batch = []
+
+    if batch:
+        UploadedFile.objects.bulk_update(batch, ['search_text'])
+
+
+def create_index(apps, schema_editor):
+    install_search_index(schema_editor)
+
+
+def drop_index(apps, schema_editor):
+    remove_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0003_storageusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
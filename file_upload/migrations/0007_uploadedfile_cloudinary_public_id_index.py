@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0006_fileevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['cloudinary_public_id'], name='file_upload_cloudin_ef7f6c_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from file_upload.services.search_service import install_search_index
+
+
+def create_index(apps, schema_editor):
+    # The new columns rebuild the table on SQLite, dropping the search triggers
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0007_uploadedfile_cloudinary_public_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_index),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='manifest_key',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='previous_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='next_versions', to='file_upload.uploadedfile'),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='storageusage',
+            name='storage_backend',
+            field=models.CharField(choices=[('cloudinary', 'Cloudinary'), ('s3', 'Amazon S3'), ('local', 'Local Storage'), ('chunks', 'Chunk Store')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='storage_backend',
+            field=models.CharField(choices=[('cloudinary', 'Cloudinary'), ('s3', 'Amazon S3'), ('local', 'Local Storage'), ('chunks', 'Chunk Store')], default='cloudinary', max_length=20),
+        ),
+        migrations.RunPython(create_index, migrations.RunPython.noop),
+    ]
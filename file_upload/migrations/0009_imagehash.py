@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 19:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0008_uploadedfile_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageHash',
+            fields=[
+                ('uploaded_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='image_hash', serialize=False, to='file_upload.uploadedfile')),
+                ('tenant', models.CharField(blank=True, max_length=100)),
+                ('phash', models.BigIntegerField()),
+                ('dhash', models.BigIntegerField()),
+                ('band0', models.PositiveIntegerField()),
+                ('band1', models.PositiveIntegerField()),
+                ('band2', models.PositiveIntegerField()),
+                ('band3', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tenant', 'band0'], name='file_upload_tenant_0c0a9a_idx'), models.Index(fields=['tenant', 'band1'], name='file_upload_tenant_c283e2_idx'), models.Index(fields=['tenant', 'band2'], name='file_upload_tenant_d20ccb_idx'), models.Index(fields=['tenant', 'band3'], name='file_upload_tenant_37f349_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 20:08
+
+from django.db import migrations, models
+
+
+def partition_table(apps, schema_editor):
+    # PostgreSQL partitions natively by month; partitions are created by
+    # `archivefiles` as it fills them, rows outside them go to the default one
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE file_upload_archivedfile RENAME TO file_upload_archivedfile_unpartitioned"
+    )
+    schema_editor.execute(
+        "CREATE TABLE file_upload_archivedfile (LIKE file_upload_archivedfile_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (partition)"
+    )
+    # Unique constraints of a partitioned table must include the partition key
+    schema_editor.execute("ALTER TABLE file_upload_archivedfile ADD PRIMARY KEY (id, partition)")
+    schema_editor.execute("DROP TABLE file_upload_archivedfile_unpartitioned")
+    # LIKE copies no indexes; recreate the one the migration state declares,
+    # which also creates it on every partition
+    schema_editor.execute(
+        "CREATE INDEX file_upload_partiti_4ad5bd_idx ON file_upload_archivedfile (partition)"
+    )
+    schema_editor.execute(
+        "CREATE TABLE file_upload_archivedfile_default PARTITION OF file_upload_archivedfile DEFAULT"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0009_imagehash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFile',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('partition', models.DateField()),
+                ('created_at', models.DateTimeField()),
+                ('record', models.JSONField(blank=True, null=True)),
+                ('location', models.CharField(blank=True, max_length=500)),
+                ('offset', models.BigIntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['partition'], name='file_upload_partiti_4ad5bd_idx')],
+            },
+        ),
+        migrations.RunPython(partition_table, migrations.RunPython.noop),
+    ]
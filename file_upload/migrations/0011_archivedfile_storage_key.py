@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-19 20:16
+
+import zlib
+
+from django.db import migrations, models
+
+from file_upload.services.cold_archive_service import ColdArchiveService
+
+
+def populate_storage_key(apps, schema_editor):
+    ArchivedFile = apps.get_model('file_upload', 'ArchivedFile')
+    key_fields = {
+        'cloudinary': 'cloudinary_public_id', 's3': 's3_key', 'local': 'local_path', 'chunks': 'manifest_key',
+    }
+    for entry in ArchivedFile.objects.filter(storage_backend='').iterator():
+        try:
+            record = entry.record if entry.record is not None else ColdArchiveService._read_member(entry)
+        except (OSError, zlib.error, ValueError) as e:
+            print(f"Reading archived file {entry.id} failed: {str(e)}")
+            continue
+        backend = record.get('storage_backend') or ''
+        entry.storage_backend = backend
+        entry.storage_key = record.get(key_fields.get(backend, ''))
+        entry.save(update_fields=['storage_backend', 'storage_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0010_archivedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedfile',
+            name='storage_backend',
+            field=models.CharField(blank=True, choices=[('cloudinary', 'Cloudinary'), ('s3', 'Amazon S3'), ('local', 'Local Storage'), ('chunks', 'Chunk Store')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='archivedfile',
+            name='storage_key',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='archivedfile',
+            index=models.Index(fields=['storage_backend', 'storage_key'], name='file_upload_storage_a59e7a_idx'),
+        ),
+        migrations.RunPython(populate_storage_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0011_archivedfile_storage_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CloudinaryNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_id', models.CharField(db_index=True, max_length=255)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
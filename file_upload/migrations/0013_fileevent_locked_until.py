@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('file_upload', '0012_cloudinarynotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileevent',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
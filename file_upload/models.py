@@ -1,6 +1,8 @@
 import os
 import uuid
 
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from file_upload.utils import get_storage_backend
@@ -11,8 +13,17 @@ class UploadedFile(models.Model):
         ('cloudinary', 'Cloudinary'),
         ('s3', 'Amazon S3'),
         ('local', 'Local Storage'),
+        ('chunks', 'Chunk Store'),
     ]
 
+    # Field holding the storage key (the backend's `storage_id`) per backend
+    STORAGE_KEY_FIELDS = {
+        'cloudinary': 'cloudinary_public_id',
+        's3': 's3_key',
+        'local': 'local_path',
+        'chunks': 'manifest_key',
+    }
+
     FILE_TYPE_CHOICES = [
         ('image', 'Image'),
         ('document', 'Document'),
@@ -35,12 +46,24 @@ class UploadedFile(models.Model):
     cloudinary_public_id = models.CharField(max_length=255, null=True, blank=True)
     s3_key = models.CharField(max_length=500, null=True, blank=True)
     local_path = models.CharField(max_length=500, null=True, blank=True)
+    manifest_key = models.CharField(max_length=500, null=True, blank=True)
+
+    # Uploads may replace an earlier file; the chunk store deduplicates against it
+    version = models.PositiveIntegerField(default=1)
+    previous_version = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='next_versions'
+    )
 
     public_url = models.URLField(max_length=500)
     secure_url = models.URLField(max_length=500, null=True, blank=True)
 
     metadata = models.JSONField(default=dict, blank=True)
 
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    # Filename plus selected metadata values, indexed for search
+    search_text = models.TextField(blank=True, default='', editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -50,12 +73,222 @@ class UploadedFile(models.Model):
             models.Index(fields=['request_id', '-created_at']),
             models.Index(fields=['file_type']),
             models.Index(fields=['storage_backend']),
+            # Cloudinary notifications identify files by public_id
+            models.Index(fields=['cloudinary_public_id']),
         ]
 
     def __str__(self):
         return f"{self.original_filename} ({self.file_type})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, so signal handlers can tell what a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'original_filename', 'metadata'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'search_text'}
+        super().save(*args, **kwargs)
+
+    def build_search_text(self) -> str:
+        values = [self.original_filename]
+        for key in getattr(settings, 'FILE_UPLOAD_SEARCH_METADATA_KEYS', []):
+            value = (self.metadata or {}).get(key)
+            if isinstance(value, (list, tuple)):
+                values.extend(str(item) for item in value)
+            elif value not in (None, ''):
+                values.append(str(value))
+        return ' '.join(values)
+
     def delete_from_storage(self):
-        storage = get_storage_backend()
+        storage = get_storage_backend(self.storage_backend)
         return storage.delete_file(self)
 
+
+class StorageUsage(models.Model):
+    """
+    Running totals of stored files per tenant, backend, file type and upload day
+
+    Maintained incrementally by the UploadedFile signal handlers, in the same
+    transaction as the change; `rebuildusage` recomputes it from scratch.
+    """
+
+    tenant = models.CharField(max_length=100, blank=True)
+    storage_backend = models.CharField(max_length=20, choices=UploadedFile.STORAGE_CHOICES)
+    file_type = models.CharField(max_length=20, choices=UploadedFile.FILE_TYPE_CHOICES)
+    day = models.DateField()
+    file_count = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tenant', 'storage_backend', 'file_type', 'day'],
+                name='unique_storage_usage_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant or '-'} {self.storage_backend} {self.file_type} {self.day}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an Idempotency-Key header
+
+    A row is claimed (in progress) by the first request with a key and
+    completed with its response, which retries with the same key get back
+    until `expires_at`.
+    """
+
+    IN_PROGRESS = 'in_progress'
+    COMPLETED = 'completed'
+
+    STATUS_CHOICES = [
+        (IN_PROGRESS, 'In progress'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    # Hash of the client and its Idempotency-Key (see idempotency.scoped_key)
+    key = models.CharField(max_length=255, unique=True)
+    # Method, path and body type of the first request; reusing a key elsewhere is an error
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+
+class FileEvent(models.Model):
+    """
+    Outbox of file events, written in the same transaction as the change
+
+    Read by the event stream endpoint and delivered to the webhook in
+    batches by `dispatchevents`; an event is retried with backoff until
+    delivered or FILE_UPLOAD_WEBHOOK_MAX_ATTEMPTS is reached, after which
+    `next_attempt_at` is cleared. `locked_until` is the end of the lease of
+    the dispatcher delivering it.
+    """
+
+    FILE_CREATED = 'file.created'
+    FILE_DELETED = 'file.deleted'
+    FILE_PROCESSED = 'file.processed'
+    FILE_PROCESSING_FAILED = 'file.processing_failed'
+
+    event_type = models.CharField(max_length=50)
+    file_id = models.UUIDField()
+    request_id = models.TextField(blank=True)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['request_id', 'id']),
+            models.Index(fields=['delivered_at', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.file_id}"
+
+
+class ImageHash(models.Model):
+    """
+    Perceptual hashes of an image file, indexed for near-duplicate lookups
+
+    The 64-bit pHash is also stored as four 16-bit bands. Two hashes within
+    Hamming distance d have a band within distance d // 4 of each other, so
+    a lookup reads a few indexed buckets per band instead of every hash
+    (multi-index hashing). Hashes are stored as signed 64-bit integers.
+    """
+
+    BANDS = 4
+    BAND_BITS = 16
+
+    uploaded_file = models.OneToOneField(
+        UploadedFile, primary_key=True, on_delete=models.CASCADE, related_name='image_hash'
+    )
+    tenant = models.CharField(max_length=100, blank=True)
+    phash = models.BigIntegerField()
+    dhash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField()
+    band1 = models.PositiveIntegerField()
+    band2 = models.PositiveIntegerField()
+    band3 = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'band0']),
+            models.Index(fields=['tenant', 'band1']),
+            models.Index(fields=['tenant', 'band2']),
+            models.Index(fields=['tenant', 'band3']),
+        ]
+
+    def __str__(self):
+        return f"{self.uploaded_file_id} {self.phash & (1 << 64) - 1:016x}"
+
+
+class ArchivedFile(models.Model):
+    """
+    An UploadedFile row moved out of the hot table by `archivefiles`
+
+    Every archived file keeps a row here so its id still resolves (see
+    ColdArchiveService.get): the serialized record itself, or the compressed
+    NDJSON archive and gzip member holding it. On PostgreSQL the table is
+    natively partitioned by `partition`, the month the file was created;
+    elsewhere partitions are emulated by the indexed column.
+    """
+
+    id = models.UUIDField(primary_key=True)
+    partition = models.DateField()
+    created_at = models.DateTimeField()
+    # The stored object, so reconcilefiles does not take it for an orphan
+    storage_backend = models.CharField(max_length=20, choices=UploadedFile.STORAGE_CHOICES, blank=True)
+    storage_key = models.CharField(max_length=500, null=True, blank=True)
+    record = models.JSONField(null=True, blank=True)
+    # Archive file, relative to FILE_UPLOAD_ARCHIVE_DIR, and offset of the gzip member holding the record
+    location = models.CharField(max_length=500, blank=True)
+    offset = models.BigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['partition']),
+            models.Index(fields=['storage_backend', 'storage_key']),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.partition:%Y-%m})"
+
+
+class CloudinaryNotification(models.Model):
+    """
+    A Cloudinary notification that arrived before its file was recorded
+
+    Cloudinary can report an asynchronous upload before the request that
+    sent it has inserted the file's row. The notification waits here and is
+    applied once the row exists (see CloudinaryNotificationService.apply_pending).
+    """
+
+    public_id = models.CharField(max_length=255, db_index=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.payload.get('notification_type')} {self.public_id}"
@@ -0,0 +1,125 @@
+"""
+Upload progress, published per client-chosen upload token
+
+Uploads that carry an `X-Upload-ID` header (or `upload_id` query parameter)
+report the bytes received so far to a progress store, which the progress
+endpoints read. The store is the Django cache, so every process sees every
+upload, or an in-memory store for single-process deployments.
+"""
+import re
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+UPLOADING = 'uploading'
+RECEIVED = 'received'
+DONE = 'done'
+FAILED = 'failed'
+FINAL_STATES = (DONE, FAILED)
+
+
+class CacheProgressStore:
+    KEY_PREFIX = 'file_upload:progress:'
+
+    def _cache(self):
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+
+    def set(self, upload_id: str, progress: Dict[str, Any], timeout: int):
+        self._cache().set(f"{self.KEY_PREFIX}{upload_id}", progress, timeout)
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        return self._cache().get(f"{self.KEY_PREFIX}{upload_id}")
+
+
+class MemoryProgressStore:
+    """Process-local store; only correct when uploads and progress reads hit the same process"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def set(self, upload_id: str, progress: Dict[str, Any], timeout: int):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[upload_id] = (now + timeout, progress)
+            if len(self._entries) > 1000:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(upload_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+
+_memory_store = MemoryProgressStore()
+
+
+def get_progress_store():
+    if getattr(settings, 'FILE_UPLOAD_PROGRESS_STORE', 'cache') == 'memory':
+        return _memory_store
+    return CacheProgressStore()
+
+
+def get_upload_id(request) -> Optional[str]:
+    """Valid upload token of a request, or None"""
+    upload_id = request.headers.get('X-Upload-ID') or request.GET.get('upload_id')
+    if upload_id and UPLOAD_ID_PATTERN.match(upload_id):
+        return upload_id
+    return None
+
+
+def get_progress(upload_id: str) -> Optional[Dict[str, Any]]:
+    return get_progress_store().get(upload_id)
+
+
+class ProgressTracker:
+    """
+    Publishes the progress of one upload
+
+    `advance` is called for every chunk but only writes to the store every
+    FILE_UPLOAD_PROGRESS_INTERVAL seconds, so tracking costs a clock read
+    per chunk; state changes are always written.
+    """
+
+    def __init__(self, upload_id: str, total: Optional[int] = None):
+        self.upload_id = upload_id
+        self.total = total
+        self.received = 0
+        self.state = UPLOADING
+        self.store = get_progress_store()
+        self.interval = getattr(settings, 'FILE_UPLOAD_PROGRESS_INTERVAL', 0.5)
+        self.timeout = getattr(settings, 'FILE_UPLOAD_PROGRESS_TIMEOUT', 3600)
+        self._published_at = None
+        self.publish()
+
+    def advance(self, size: int):
+        self.received += size
+        if time.monotonic() - self._published_at >= self.interval:
+            self.publish()
+
+    def finish(self, state: str, **extra):
+        if state != FAILED and self.total is not None:
+            self.received = max(self.received, self.total)
+        self.state = state
+        self.publish(**extra)
+
+    def publish(self, **extra):
+        self._published_at = time.monotonic()
+        percent = round(100 * self.received / self.total, 1) if self.total else None
+        self.store.set(self.upload_id, {
+            'upload_id': self.upload_id,
+            'state': self.state,
+            'received': self.received,
+            'total': self.total,
+            'percent': min(percent, 100.0) if percent is not None else None,
+            'updated_at': datetime.now(UTC).isoformat(),
+            **extra,
+        }, self.timeout)
@@ -3,22 +3,30 @@ import os
 from rest_framework import serializers
 
 from file_upload.models import UploadedFile
-from django.conf import settings
+from file_upload.services.placeholder_service import PlaceholderService
+from file_upload.utils import allowed_extensions, max_file_size
 
 
 class UploadedFileSerializer(serializers.ModelSerializer):
+    # Inline blurred preview for images, so clients need no thumbnail request
+    placeholder = serializers.SerializerMethodField()
+
     class Meta:
         model = UploadedFile
         fields = [
             'id', 'original_filename', 'file_type', 'file_size',
-            'storage_backend', 'public_url', 'secure_url',
-            'metadata', 'created_at', 'updated_at'
+            'storage_backend', 'public_url', 'secure_url', 'placeholder',
+            'metadata', 'expires_at', 'version', 'previous_version', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'storage_backend', 'public_url', 'secure_url',
-            'metadata', 'created_at', 'updated_at'
+            'metadata', 'expires_at', 'version', 'previous_version', 'created_at', 'updated_at'
         ]
 
+    @staticmethod
+    def get_placeholder(obj):
+        return PlaceholderService.public(obj.metadata)
+
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
@@ -26,21 +34,22 @@ class FileUploadSerializer(serializers.Serializer):
         choices=['image', 'document', 'video', 'audio', 'other'],
         required=False
     )
+    tenant = serializers.RegexField(r'^[A-Za-z0-9_-]+$', max_length=100, required=False)
+    ttl = serializers.IntegerField(min_value=1, required=False, help_text="Seconds to keep the file")
+    previous_version = serializers.PrimaryKeyRelatedField(
+        queryset=UploadedFile.objects.all(), required=False, help_text="File this upload replaces"
+    )
 
     @staticmethod
     def validate_file(value):
-        if value.size > settings.MAX_FILE_SIZE:
+        max_size = max_file_size(value.name)
+        if value.size > max_size:
             raise serializers.ValidationError(
-                f"File size must be less than {settings.MAX_FILE_SIZE // (1024 * 1024)}MB"
+                f"File size must be less than {max_size // (1024 * 1024)}MB"
             )
 
         file_ext = os.path.splitext(value.name)[1].lower()
-        allowed_extensions = (
-                settings.ALLOWED_IMAGE_EXTENSIONS +
-                settings.ALLOWED_DOCUMENT_EXTENSIONS
-        )
-
-        if file_ext not in allowed_extensions:
+        if file_ext not in allowed_extensions():
             raise serializers.ValidationError(
                 f"File extension {file_ext} is not allowed"
             )
@@ -0,0 +1,426 @@
+import hashlib
+import os
+import queue
+import struct
+import threading
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from file_upload import compression
+from file_upload.models import UploadedFile
+from file_upload.utils import get_storage_backend
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+
+class ArchiveError(Exception):
+    """Raised for invalid archive requests and when a member cannot be streamed as declared"""
+
+
+@dataclass
+class ArchiveMember:
+    uploaded_file: UploadedFile
+    name: bytes
+    size: int
+    compress: bool
+    zip64: bool
+    crc: Optional[int] = None
+    compressed_size: Optional[int] = None
+    offset: int = 0
+
+    @property
+    def flags(self) -> int:
+        # Bit 3: sizes and CRC follow the data in a descriptor; bit 11: UTF-8 name
+        return 0x08 | 0x800
+
+    @property
+    def method(self) -> int:
+        return zlib.DEFLATED if self.compress else 0
+
+    @property
+    def version(self) -> int:
+        return 45 if self.zip64 else 20
+
+    @property
+    def dos_time(self):
+        created_at = self.uploaded_file.created_at
+        year = min(max(created_at.year, 1980), 2107)
+        return (
+            created_at.hour << 11 | created_at.minute << 5 | created_at.second // 2,
+            (year - 1980) << 9 | created_at.month << 5 | created_at.day,
+        )
+
+    def local_header(self) -> bytes:
+        if self.zip64:
+            # Sizes live in the (zeroed) ZIP64 extra field and the 8 byte data descriptor
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            sizes = (ZIP64_LIMIT, ZIP64_LIMIT)
+        else:
+            extra, sizes = b'', (0, 0)
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, self.version, self.flags, self.method, *self.dos_time,
+            0, *sizes, len(self.name), len(extra)
+        ) + self.name + extra
+
+    def data_descriptor(self) -> bytes:
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc or 0, self.compressed_size or 0, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc or 0, self.compressed_size or 0, self.size)
+
+    def central_header(self) -> bytes:
+        extra_values = []
+        size, compressed_size, offset = self.size, self.compressed_size or 0, self.offset
+        if self.zip64 or size >= ZIP64_LIMIT:
+            extra_values.append(size)
+            size = ZIP64_LIMIT
+        if self.zip64 or compressed_size >= ZIP64_LIMIT:
+            extra_values.append(compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            extra_values.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f'<HH{len(extra_values)}Q', 0x0001, 8 * len(extra_values), *extra_values) \
+            if extra_values else b''
+
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, 3 << 8 | self.version, self.version, self.flags, self.method,
+            *self.dos_time, self.crc or 0, compressed_size, size, len(self.name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset
+        ) + self.name + extra
+
+    @property
+    def entry_length(self) -> Optional[int]:
+        """Bytes taken by the header, data and descriptor, if known before streaming"""
+        if self.compress:
+            return None
+        return len(self.local_header()) + self.size + len(self.data_descriptor())
+
+
+class ArchiveService:
+    """
+    Streams a ZIP archive of stored files, built on the fly
+
+    Members are pulled through their storage backend by a small pool of
+    prefetch workers, each holding at most FILE_UPLOAD_ZIP_PREFETCH_CHUNKS
+    chunks, so memory stays constant whatever the size of the archive.
+    Already-compressed formats are stored, everything else is deflated.
+
+    When every member is stored the layout of the archive is known in
+    advance: `size` is set, and `stream(start)` can resume a download from
+    any offset. CRCs of members before the offset are taken from the cache
+    when an earlier download computed them, otherwise the member is read
+    again without being sent.
+    """
+
+    CRC_KEY_PREFIX = 'file_upload:zip:crc:'
+
+    def __init__(
+            self,
+            files: Iterable[UploadedFile],
+            compress: bool = True,
+            prefetch: Optional[int] = None,
+            chunk_size: Optional[int] = None
+    ):
+        self.prefetch = prefetch or getattr(settings, 'FILE_UPLOAD_ZIP_PREFETCH', 4)
+        self.chunk_size = chunk_size or getattr(settings, 'FILE_UPLOAD_ZIP_CHUNK_SIZE', 64 * 1024)
+        self.compression_level = getattr(settings, 'FILE_UPLOAD_ZIP_COMPRESSION_LEVEL', 6)
+        self.members = self._members(files, compress)
+
+        offset = 0
+        for member in self.members:
+            member.offset = offset
+            if member.entry_length is None:
+                break
+            offset += member.entry_length
+
+    @staticmethod
+    def select(ids: Optional[List[str]] = None, request_id: Optional[str] = None) -> List[UploadedFile]:
+        """
+        Files to archive, by id (in the given order) or by request_id
+
+        Raises:
+            ArchiveError: On missing or invalid ids, or too many files
+        """
+        max_files = getattr(settings, 'FILE_UPLOAD_ZIP_MAX_FILES', 1000)
+
+        if ids:
+            try:
+                ids = list(dict.fromkeys(uuid.UUID(str(file_id)) for file_id in ids))
+            except ValueError:
+                raise ArchiveError('Invalid file id')
+            if len(ids) > max_files:
+                raise ArchiveError(f'At most {max_files} files can be archived at once')
+
+            files = UploadedFile.objects.in_bulk(ids)
+            missing = [str(file_id) for file_id in ids if file_id not in files]
+            if missing:
+                raise ArchiveError(f'Files not found: {", ".join(missing)}')
+            return [files[file_id] for file_id in ids]
+
+        if request_id:
+            files = list(UploadedFile.objects.filter(request_id=request_id).order_by('created_at', 'id')[:max_files + 1])
+            if len(files) > max_files:
+                raise ArchiveError(f'At most {max_files} files can be archived at once')
+            return files
+
+        raise ArchiveError('Either ids or request_id is required')
+
+    @property
+    def size(self) -> Optional[int]:
+        """Total archive size, or None when deflated members make it unknown in advance"""
+        if any(member.compress for member in self.members):
+            return None
+        last = self.members[-1] if self.members else None
+        central_offset = last.offset + last.entry_length if last else 0
+        central_size = sum(len(member.central_header()) for member in self.members)
+        return central_offset + central_size + len(self._end_records(central_offset, central_size))
+
+    @property
+    def etag(self) -> str:
+        source = ':'.join(
+            f"{member.uploaded_file.id}/{member.uploaded_file.updated_at.isoformat()}/{member.method}"
+            for member in self.members
+        )
+        return '"%s"' % hashlib.sha1(source.encode()).hexdigest()
+
+    def stream(self, start: int = 0) -> Iterator[bytes]:
+        """Archive bytes from offset `start`, coalesced into chunks of about `chunk_size`"""
+        if start and self.size is None:
+            raise ArchiveError('Only archives of stored members can be resumed')
+
+        position = 0
+        pending = bytearray()
+        for piece in self._pieces(start):
+            if isinstance(piece, int):
+                # Bytes known to lie before `start`, skipped without producing them
+                position += piece
+                continue
+            end = position + len(piece)
+            if end > start:
+                pending += piece[start - position:] if position < start else piece
+                if len(pending) >= self.chunk_size:
+                    yield bytes(pending)
+                    pending.clear()
+            position = end
+
+        if pending:
+            yield bytes(pending)
+
+    def _members(self, files: Iterable[UploadedFile], compress: bool) -> List[ArchiveMember]:
+        members, names = [], set()
+        for uploaded_file in files:
+            name = self._unique_name(uploaded_file.original_filename, names)
+            extension = os.path.splitext(name)[1].lstrip('.').lower()
+            deflate = compress and extension not in compression.COMPRESSED_EXTENSIONS
+            members.append(ArchiveMember(
+                uploaded_file=uploaded_file,
+                name=name.encode('utf-8'),
+                size=uploaded_file.file_size,
+                compress=deflate,
+                # Deflate may slightly expand incompressible data, as in zipfile
+                zip64=uploaded_file.file_size * (1.05 if deflate else 1) >= ZIP64_LIMIT,
+            ))
+
+        cached = self._cache().get_many([self._crc_key(m.uploaded_file) for m in members if not m.compress])
+        for member in members:
+            member.crc = cached.get(self._crc_key(member.uploaded_file))
+            if member.crc is not None:
+                member.compressed_size = member.size
+        return members
+
+    @staticmethod
+    def _unique_name(filename: str, names: set) -> str:
+        name = os.path.basename((filename or '').replace('\\', '/')) or 'file'
+        stem, extension = os.path.splitext(name)
+        counter = 1
+        while name.lower() in names:
+            name = f"{stem} ({counter}){extension}"
+            counter += 1
+        names.add(name.lower())
+        return name
+
+    def _pieces(self, start: int) -> Iterator:
+        # Members entirely before `start` whose CRC is known need not be read at all
+        skipped = {
+            index for index, member in enumerate(self.members)
+            if member.crc is not None and member.entry_length is not None
+            and member.offset + member.entry_length <= start
+        }
+        prefetcher = _Prefetcher(
+            [member for index, member in enumerate(self.members) if index not in skipped],
+            workers=self.prefetch,
+            chunk_size=self.chunk_size,
+            depth=getattr(settings, 'FILE_UPLOAD_ZIP_PREFETCH_CHUNKS', 4),
+        )
+
+        try:
+            offset = 0
+            for index, member in enumerate(self.members):
+                member.offset = offset
+                if index in skipped:
+                    yield member.entry_length
+                    offset += member.entry_length
+                    continue
+
+                header = member.local_header()
+                yield header
+                compressed_size = 0
+                for data in self._member_data(member, prefetcher.chunks(member)):
+                    compressed_size += len(data)
+                    yield data
+                member.compressed_size = compressed_size
+
+                descriptor = member.data_descriptor()
+                yield descriptor
+                offset += len(header) + compressed_size + len(descriptor)
+        finally:
+            prefetcher.close()
+
+        central_size = 0
+        for member in self.members:
+            central_header = member.central_header()
+            central_size += len(central_header)
+            yield central_header
+        yield self._end_records(offset, central_size)
+
+    def _member_data(self, member: ArchiveMember, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(self.compression_level, zlib.DEFLATED, -15) if member.compress else None
+        crc, size = 0, 0
+
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            else:
+                if size > member.size:
+                    raise ArchiveError(f"{member.uploaded_file.id} is larger than its recorded size")
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+
+        if not member.compress and size != member.size:
+            # The layout (and Content-Length) was computed from the recorded size
+            raise ArchiveError(f"{member.uploaded_file.id} is smaller than its recorded size")
+        if not member.zip64 and size >= ZIP64_LIMIT:
+            raise ArchiveError(f"{member.uploaded_file.id} is too large for its recorded size")
+
+        member.size, member.crc = size, crc
+        if not member.compress:
+            self._cache().set(self._crc_key(member.uploaded_file), crc, 7 * 24 * 3600)
+
+    def _end_records(self, central_offset: int, central_size: int) -> bytes:
+        count = len(self.members)
+        records = b''
+        if count >= ZIP_FILECOUNT_LIMIT or central_offset >= ZIP64_LIMIT or central_size >= ZIP64_LIMIT:
+            zip64_end_offset = central_offset + central_size
+            records += struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, 3 << 8 | 45, 45, 0, 0, count, count, central_size, central_offset
+            )
+            records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+            count = min(count, ZIP_FILECOUNT_LIMIT)
+            central_size = min(central_size, ZIP64_LIMIT)
+            central_offset = min(central_offset, ZIP64_LIMIT)
+        return records + struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, count, count, central_size, central_offset, 0
+        )
+
+    @classmethod
+    def _crc_key(cls, uploaded_file: UploadedFile) -> str:
+        return f"{cls.CRC_KEY_PREFIX}{uploaded_file.id}:{uploaded_file.updated_at.timestamp()}"
+
+    @staticmethod
+    def _cache():
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+
+
+class _Prefetcher:
+    """
+    Reads members ahead of the archive writer
+
+    At most `workers` members are open at a time, each buffering at most
+    `depth` chunks; a member's slot is handed to the next one once the
+    writer has consumed it.
+    """
+
+    _END = object()
+
+    def __init__(self, members: List[ArchiveMember], workers: int, chunk_size: int, depth: int):
+        self.pending = deque(members)
+        self.in_flight = deque()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.depth = depth
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-prefetch')
+        self.storages = {}
+        for _ in range(workers):
+            self._submit_next()
+
+    def chunks(self, member: ArchiveMember) -> Iterator[bytes]:
+        # Members are consumed in submission order
+        _, buffer = self.in_flight.popleft()
+        try:
+            while True:
+                item = buffer.get()
+                if item is self._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._submit_next()
+
+    def close(self):
+        self.cancelled.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_next(self):
+        if self.pending and not self.cancelled.is_set():
+            member = self.pending.popleft()
+            buffer = queue.Queue(maxsize=self.depth)
+            self.in_flight.append((member, buffer))
+            self.executor.submit(self._fill, member, buffer)
+
+    def _storage(self, backend: str):
+        if backend not in self.storages:
+            self.storages[backend] = get_storage_backend(backend)
+        return self.storages[backend]
+
+    def _fill(self, member: ArchiveMember, buffer: queue.Queue):
+        stream = None
+        try:
+            stream = compression.decoded(
+                self._storage(member.uploaded_file.storage_backend).open_file(member.uploaded_file),
+                compression.encoding_for(member.uploaded_file)
+            )
+            while not self.cancelled.is_set():
+                data = stream.read(self.chunk_size)
+                if not data:
+                    break
+                self._put(buffer, data)
+            self._put(buffer, self._END)
+        except Exception as e:
+            print(f"Archive read of {member.uploaded_file.id} failed: {str(e)}")
+            self._put(buffer, e)
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def _put(self, buffer: queue.Queue, item):
+        while not self.cancelled.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
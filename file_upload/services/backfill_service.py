@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+
+from django.db.models import QuerySet
+
+from file_upload.models import UploadedFile
+from file_upload.storages.base_storage import StorageError
+from file_upload.utils import get_storage_backend
+
+
+class BackfillService:
+    """Batched, threaded walks over stored files, shared by the metadata backfills"""
+
+    @staticmethod
+    def run(
+            queryset: QuerySet,
+            compute: Callable[[UploadedFile, Any], Any],
+            record: Callable[[UploadedFile, Any], str],
+            counts: Dict[str, int],
+            batch_size: int = 200,
+            workers: int = 4,
+            limit: Optional[int] = None,
+            on_file: Optional[Callable[[UploadedFile, Any, Optional[str]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Compute and record a result for every file of `queryset`
+
+        Files are walked by id in batches. `compute(uploaded_file, storage)`
+        runs on `workers` threads; files whose backend fails, or cannot serve
+        them, are counted as 'failed' and left unchanged. `record(uploaded_file,
+        result)` saves a result from the calling thread and returns the count
+        it adds to. `on_file(uploaded_file, result, error)` is called for every
+        file, with the error of failed ones.
+        """
+        storages = {}
+
+        def compute_one(uploaded_file):
+            try:
+                if uploaded_file.storage_backend not in storages:
+                    storages[uploaded_file.storage_backend] = get_storage_backend(uploaded_file.storage_backend)
+                return uploaded_file, compute(uploaded_file, storages[uploaded_file.storage_backend]), None
+            except (StorageError, NotImplementedError, ValueError) as e:
+                return uploaded_file, None, str(e)
+
+        cursor = None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while limit is None or sum(counts.values()) < limit:
+                batch_queryset = queryset.filter(id__gt=cursor) if cursor else queryset
+                size = batch_size if limit is None else min(batch_size, limit - sum(counts.values()))
+                batch = list(batch_queryset.order_by('id')[:size])
+                if not batch:
+                    break
+                cursor = batch[-1].id
+
+                for uploaded_file, result, error in executor.map(compute_one, batch):
+                    counts['failed' if error is not None else record(uploaded_file, result)] += 1
+                    if on_file:
+                        on_file(uploaded_file, result, error)
+
+        return counts
+
+    @staticmethod
+    def read(uploaded_file: UploadedFile, storage) -> BytesIO:
+        """The whole stored file as a seekable buffer, as Pillow needs"""
+        with storage.open_file(uploaded_file) as stream:
+            return BytesIO(stream.read())
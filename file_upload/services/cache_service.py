@@ -0,0 +1,91 @@
+import hashlib
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from file_upload.metrics import metrics
+from file_upload.models import UploadedFile
+from file_upload.services.cold_archive_service import ColdArchiveService
+from file_upload.throttling import LOCAL_CACHE_BACKENDS
+
+
+class FileCacheService:
+    """
+    Object cache for UploadedFile lookups by id
+
+    Entries are invalidated by the post_save/post_delete signal handlers, so
+    code paths that bypass signals (QuerySet.update, bulk_create) must call
+    `invalidate` themselves.
+    """
+
+    KEY_PREFIX = 'file_upload:file:'
+
+    @staticmethod
+    def _cache():
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def get(cls, file_id) -> UploadedFile:
+        """
+        Return the UploadedFile with the given id, from cache when possible
+
+        Archived files are returned too, read from the archive.
+
+        Raises:
+            UploadedFile.DoesNotExist: If there is no such file
+        """
+        key = f"{cls.KEY_PREFIX}{file_id}"
+        cache = cls._cache()
+
+        uploaded_file = cache.get(key)
+        if uploaded_file is not None:
+            metrics.inc('file_upload_object_cache_total', result='hit')
+            return uploaded_file
+
+        metrics.inc('file_upload_object_cache_total', result='miss')
+        # Filled from the primary: an entry read from a lagging replica could
+        # outlive the invalidation of a write the replica had not replayed yet
+        try:
+            uploaded_file = UploadedFile.objects.using(DEFAULT_DB_ALIAS).get(id=file_id)
+        except UploadedFile.DoesNotExist:
+            # Files moved out of the hot table by `archivefiles` still resolve
+            uploaded_file = ColdArchiveService.get(file_id)
+            if uploaded_file is None:
+                raise
+        cache.set(key, uploaded_file, getattr(settings, 'FILE_UPLOAD_OBJECT_CACHE_TIMEOUT', 300))
+        return uploaded_file
+
+    @classmethod
+    def invalidate(cls, file_id):
+        cls._cache().delete(f"{cls.KEY_PREFIX}{file_id}")
+
+    @staticmethod
+    def etag(uploaded_file: UploadedFile, *variant) -> str:
+        """Strong ETag derived from the record id, `updated_at` and an optional response variant"""
+        source = ':'.join([str(uploaded_file.id), uploaded_file.updated_at.isoformat(), *map(str, variant)])
+        return '"%s"' % hashlib.sha1(source.encode()).hexdigest()
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """System check: state every process must see is kept in a cache the processes do not share"""
+    features = []
+    if getattr(settings, 'FILE_UPLOAD_OBJECT_CACHE_TIMEOUT', 300) != 0:
+        features.append('cached file records')
+    if getattr(settings, 'FILE_UPLOAD_PROGRESS_STORE', 'cache') == 'cache':
+        features.append('upload progress')
+    if getattr(settings, 'FILE_UPLOAD_DB_REPLICAS', []):
+        features.append('read-your-writes pins')
+    alias = getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if not features or backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"Shared state ({', '.join(features)}) is kept in the '{alias}' cache ({backend.rsplit('.', 1)[-1]}), "
+        "which processes do not share: other workers keep serving updated or deleted files, and management "
+        "commands (migratefiles, archivefiles, purgeexpired) cannot invalidate them",
+        hint="Configure a shared cache (Redis, Memcached, database) with CACHE_BACKEND and CACHE_LOCATION, "
+             "or run a single process.",
+        id='file_upload.W002',
+    )]
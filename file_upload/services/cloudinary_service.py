@@ -0,0 +1,164 @@
+import hmac
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import cloudinary
+import cloudinary.utils
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from file_upload.models import CloudinaryNotification, FileEvent, UploadedFile
+from file_upload.services.event_service import EventService
+from file_upload.storages.cloudinary_storage import CloudinaryStorage
+
+# Fields of an upload notification copied into the file's metadata
+RESOURCE_FIELDS = {
+    'version': 'cloudinary_version',
+    'width': 'width',
+    'height': 'height',
+    'format': 'format',
+    'resource_type': 'resource_type',
+    'bytes': 'bytes',
+    'duration': 'duration',
+}
+
+
+class CloudinaryNotificationService:
+    """Applies Cloudinary's notifications for asynchronous uploads to the file records"""
+
+    @staticmethod
+    def verify(body: bytes, timestamp: Optional[str], signature: Optional[str]) -> bool:
+        """
+        Check the X-Cld-Signature of a notification
+
+        The signature is a hash of the body, the X-Cld-Timestamp and the API
+        secret; notifications older than FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE
+        seconds are rejected so a captured one cannot be replayed later.
+        """
+        api_secret = cloudinary.config().api_secret
+        if not api_secret or not timestamp or not signature:
+            return False
+        try:
+            sent_at = int(timestamp)
+        except ValueError:
+            return False
+        if sent_at < time.time() - getattr(settings, 'FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE', 7200):
+            return False
+
+        expected = cloudinary.utils.compute_hex_hash(
+            f"{body.decode('utf-8', 'replace')}{timestamp}{api_secret}", cloudinary.config().signature_algorithm
+        )
+        return hmac.compare_digest(expected, signature)
+
+    @classmethod
+    def apply(cls, payload: Dict[str, Any]) -> Optional[UploadedFile]:
+        """
+        Record an `upload` or `eager` notification on the file it is about
+
+        Processing is complete once the upload notification has arrived and
+        no eager transformations are pending; that transition is published
+        as a `file.processed` event. Repeated notifications are harmless.
+        A notification for a file that is not recorded yet is kept and
+        applied when the file is inserted.
+
+        Returns:
+            UploadedFile: The updated file, or None if the notification was kept
+        """
+        public_id = payload['public_id']
+        with transaction.atomic():
+            uploaded_file = cls._locked_file(public_id)
+            if uploaded_file is not None:
+                return cls._apply(uploaded_file, payload)
+            CloudinaryNotification.objects.create(public_id=public_id, payload=payload)
+
+        # The file may have been inserted since, after it looked for notifications
+        applied = cls.apply_pending([public_id])
+        return applied[0] if applied else None
+
+    @classmethod
+    def apply_pending(cls, public_ids: Iterable[str]) -> List[UploadedFile]:
+        """
+        Apply the kept notifications of files that are now recorded, in the order they arrived
+
+        Called once a file is inserted and after a notification is kept, so
+        whichever of the two commits last applies it.
+        """
+        applied = []
+        for notification in CloudinaryNotification.objects.filter(public_id__in=list(public_ids)).order_by('id'):
+            with transaction.atomic():
+                uploaded_file = cls._locked_file(notification.public_id)
+                # Deleted first, so a notification applied by two processes at once is applied by one
+                if uploaded_file is not None and CloudinaryNotification.objects.filter(pk=notification.pk).delete()[0]:
+                    applied.append(cls._apply(uploaded_file, notification.payload))
+        return applied
+
+    @staticmethod
+    def awaits_notifications(uploaded_file: UploadedFile) -> bool:
+        return (
+            uploaded_file.storage_backend == CloudinaryStorage.name
+            and (uploaded_file.metadata or {}).get('processing') == CloudinaryStorage.PROCESSING_PENDING
+        )
+
+    @staticmethod
+    def purge(older_than: Optional[timedelta] = None) -> int:
+        """Delete kept notifications older than FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE seconds"""
+        if older_than is None:
+            older_than = timedelta(seconds=getattr(settings, 'FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE', 7200))
+        return CloudinaryNotification.objects.filter(received_at__lt=timezone.now() - older_than).delete()[0]
+
+    @staticmethod
+    def _locked_file(public_id: str) -> Optional[UploadedFile]:
+        return UploadedFile.objects.select_for_update().filter(
+            storage_backend=CloudinaryStorage.name, cloudinary_public_id=public_id
+        ).first()
+
+    @staticmethod
+    def _apply(uploaded_file: UploadedFile, payload: Dict[str, Any]) -> UploadedFile:
+        notification_type = payload.get('notification_type')
+        metadata = dict(uploaded_file.metadata or {})
+        previous_state = metadata.get('processing')
+        update_fields = ['metadata', 'updated_at']
+
+        if payload.get('error') or payload.get('status') == 'failed':
+            error = payload.get('error')
+            metadata['processing'] = CloudinaryStorage.PROCESSING_FAILED
+            metadata['processing_error'] = error.get('message') if isinstance(error, dict) else str(error)
+        elif notification_type == 'upload':
+            metadata.update({
+                key: payload[field] for field, key in RESOURCE_FIELDS.items() if payload.get(field) is not None
+            })
+            metadata['uploaded'] = True
+            if payload.get('secure_url'):
+                uploaded_file.public_url = uploaded_file.secure_url = payload['secure_url']
+                update_fields += ['public_url', 'secure_url']
+        elif notification_type == 'eager':
+            metadata['derived'] = [
+                {
+                    'transformation': derived.get('transformation'),
+                    'url': derived.get('secure_url') or derived.get('url'),
+                    'width': derived.get('width'),
+                    'height': derived.get('height'),
+                    'format': derived.get('format'),
+                    'bytes': derived.get('bytes'),
+                }
+                for derived in payload.get('eager', [])
+            ]
+            metadata['eager_pending'] = False
+        else:
+            return uploaded_file
+
+        if metadata.get('uploaded') and not metadata.get('eager_pending') \
+                and metadata.get('processing') != CloudinaryStorage.PROCESSING_FAILED:
+            metadata['processing'] = CloudinaryStorage.PROCESSING_COMPLETE
+
+        uploaded_file.metadata = metadata
+        uploaded_file.save(update_fields=update_fields)
+
+        state = metadata.get('processing')
+        if state != previous_state and state == CloudinaryStorage.PROCESSING_COMPLETE:
+            EventService.record(FileEvent.FILE_PROCESSED, uploaded_file)
+        elif state != previous_state and state == CloudinaryStorage.PROCESSING_FAILED:
+            EventService.record(FileEvent.FILE_PROCESSING_FAILED, uploaded_file)
+        return uploaded_file
@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, UTC
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from file_upload.models import ArchivedFile, ImageHash, UploadedFile
+
+
+class ColdArchiveService:
+    """
+    Moves cold months of UploadedFile rows out of the hot table
+
+    The hot table only keeps recent files, so its indexes stay small however
+    many files the service has stored. A month is archived as a whole once it
+    is older than FILE_UPLOAD_ARCHIVE_AFTER_DAYS: its rows are copied to
+    ArchivedFile, inline or as compressed NDJSON, and deleted from the hot
+    table without signals, since the files themselves still exist. Lookups by
+    id fall back to the archive (see FileCacheService.get).
+
+    Files due to expire are left for purgeexpired, and files a hot file
+    names as its previous version stay until that file is archived too.
+    """
+
+    DESTINATIONS = ('table', 'ndjson')
+
+    # Records per gzip member of an NDJSON archive; a lookup decompresses one member
+    MEMBER_RECORDS = 256
+
+    @staticmethod
+    def partition_of(created_at: datetime) -> date:
+        return created_at.astimezone(UTC).date().replace(day=1)
+
+    @staticmethod
+    def _bounds(month: date) -> Tuple[datetime, datetime]:
+        start = datetime(month.year, month.month, 1, tzinfo=UTC)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start, end
+
+    @classmethod
+    def cold_partitions(cls, older_than_days: Optional[int] = None) -> List[date]:
+        """Months whose files were all created more than `older_than_days` ago and still have hot rows"""
+        if older_than_days is None:
+            older_than_days = getattr(settings, 'FILE_UPLOAD_ARCHIVE_AFTER_DAYS', 365)
+        cutoff, _ = cls._bounds(cls.partition_of(timezone.now() - timedelta(days=older_than_days)))
+        return list(UploadedFile.objects.filter(created_at__lt=cutoff).dates('created_at', 'month'))
+
+    @classmethod
+    def archive_partition(
+            cls,
+            month: date,
+            destination: str = 'table',
+            batch_size: int = 1000,
+            dry_run: bool = False,
+            on_batch: Optional[Callable[[Dict[str, int]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Archive the files created in `month`
+
+        Files are moved newest first, a batch per transaction, so a file is
+        always archived before the earlier version it names.
+
+        Returns:
+            Counts of archived files and of files kept because a hot file names them
+        """
+        if destination not in cls.DESTINATIONS:
+            raise ValueError(f"Unsupported archive destination: {destination}")
+
+        start, end = cls._bounds(month)
+        queryset = UploadedFile.objects.filter(
+            created_at__gte=start, created_at__lt=end, expires_at__isnull=True
+        ).order_by('-created_at', '-id')
+
+        counts = {'archived': 0, 'kept': 0}
+        cursor = None
+        while True:
+            batch_queryset = queryset
+            if cursor is not None:
+                batch_queryset = queryset.filter(
+                    Q(created_at__lt=cursor.created_at) | Q(created_at=cursor.created_at, id__lt=cursor.id)
+                )
+            batch = list(batch_queryset[:batch_size])
+            if not batch:
+                break
+            cursor = batch[-1]
+
+            ids = [uploaded_file.pk for uploaded_file in batch]
+            referenced = set(
+                UploadedFile.objects.filter(previous_version_id__in=ids)
+                .exclude(pk__in=ids)
+                .values_list('previous_version_id', flat=True)
+            )
+            files = [uploaded_file for uploaded_file in batch if uploaded_file.pk not in referenced]
+            if files and not dry_run:
+                cls._move(month, files, destination)
+            counts['archived'] += len(files)
+            counts['kept'] += len(batch) - len(files)
+            if on_batch:
+                on_batch(counts)
+        return counts
+
+    @classmethod
+    def get(cls, file_id) -> Optional[UploadedFile]:
+        """
+        An archived file as an UploadedFile, or None if it is not archived
+
+        The instance is read-only: it has no hot row to update. Deleting it
+        deletes its archive entry (see signals).
+        """
+        entry = ArchivedFile.objects.filter(pk=file_id).first()
+        if entry is None:
+            return None
+        record = entry.record
+        if record is None:
+            try:
+                record = cls._read_member(entry)
+            except (OSError, zlib.error, ValueError) as e:
+                print(f"Reading archived file {file_id} failed: {str(e)}")
+                return None
+        return cls.deserialize(record)
+
+    @staticmethod
+    def serialize(uploaded_file: UploadedFile) -> Dict[str, Any]:
+        record = {}
+        for field in UploadedFile._meta.concrete_fields:
+            value = field.value_from_object(uploaded_file)
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif isinstance(value, uuid.UUID):
+                value = str(value)
+            record[field.attname] = value
+        return record
+
+    @staticmethod
+    def deserialize(record: Dict[str, Any]) -> UploadedFile:
+        fields = {field.attname: field for field in UploadedFile._meta.concrete_fields}
+        uploaded_file = UploadedFile(**{
+            attname: fields[attname].to_python(value) for attname, value in record.items() if attname in fields
+        })
+        uploaded_file._state.adding = False
+        uploaded_file._state.db = DEFAULT_DB_ALIAS
+        uploaded_file.archived = True
+        return uploaded_file
+
+    @staticmethod
+    def ensure_partition(month: date):
+        """Create the PostgreSQL partition of ArchivedFile for `month`; partitions are emulated elsewhere"""
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'postgresql':
+            return
+        start, end = ColdArchiveService._bounds(month)
+        table = ArchivedFile._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {connection.ops.quote_name(f'{table}_p{month:%Y_%m}')} "
+                f"PARTITION OF {connection.ops.quote_name(table)} "
+                f"FOR VALUES FROM ('{start.date().isoformat()}') TO ('{end.date().isoformat()}')"
+            )
+
+    @classmethod
+    def _move(cls, month: date, files: List[UploadedFile], destination: str):
+        records = [cls.serialize(uploaded_file) for uploaded_file in files]
+        if destination == 'ndjson':
+            location, offsets = cls._append_members(month, records)
+            entries = [
+                ArchivedFile(
+                    id=uploaded_file.pk, partition=month, created_at=uploaded_file.created_at,
+                    location=location, offset=offset,
+                )
+                for uploaded_file, offset in zip(files, offsets)
+            ]
+        else:
+            entries = [
+                ArchivedFile(id=uploaded_file.pk, partition=month, created_at=uploaded_file.created_at, record=record)
+                for uploaded_file, record in zip(files, records)
+            ]
+        for entry, uploaded_file in zip(entries, files):
+            entry.storage_backend = uploaded_file.storage_backend
+            entry.storage_key = getattr(uploaded_file, UploadedFile.STORAGE_KEY_FIELDS[uploaded_file.storage_backend])
+
+        ids = [uploaded_file.pk for uploaded_file in files]
+        with transaction.atomic():
+            cls.ensure_partition(month)
+            ArchivedFile.objects.bulk_create(entries)
+            # Archived files are not matched as near-duplicates
+            ImageHash.objects.filter(uploaded_file_id__in=ids).delete()
+            # A plain DELETE: the files still exist, so usage totals must not
+            # drop and no file.deleted events may be sent. Cached copies stay
+            # valid, the archive holds the same record.
+            UploadedFile.objects.filter(pk__in=ids)._raw_delete(DEFAULT_DB_ALIAS)
+
+    @classmethod
+    def _append_members(cls, month: date, records: List[Dict[str, Any]]) -> Tuple[str, List[int]]:
+        """Append records to the month's archive, MEMBER_RECORDS per gzip member; returns each record's member offset"""
+        directory = getattr(settings, 'FILE_UPLOAD_ARCHIVE_DIR', 'archive')
+        os.makedirs(directory, exist_ok=True)
+        location = f"uploadedfile-{month:%Y-%m}.ndjson.gz"
+
+        offsets = []
+        with open(os.path.join(directory, location), 'ab') as f:
+            for start in range(0, len(records), cls.MEMBER_RECORDS):
+                member = records[start:start + cls.MEMBER_RECORDS]
+                offset = f.tell()
+                f.write(gzip.compress(''.join(f"{json.dumps(record)}\n" for record in member).encode()))
+                offsets.extend([offset] * len(member))
+            # Durable before the hot rows are deleted; a failed transaction leaves unreferenced members
+            f.flush()
+            os.fsync(f.fileno())
+        return location, offsets
+
+    @staticmethod
+    def _read_member(entry: ArchivedFile) -> Dict[str, Any]:
+        directory = getattr(settings, 'FILE_UPLOAD_ARCHIVE_DIR', 'archive')
+        decompressor = zlib.decompressobj(wbits=31)
+        data = b''
+        with open(os.path.join(directory, entry.location), 'rb') as f:
+            f.seek(entry.offset)
+            while not decompressor.eof:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                data += decompressor.decompress(chunk)
+
+        file_id = str(entry.id)
+        for line in data.splitlines():
+            record = json.loads(line)
+            if record.get('id') == file_id:
+                return record
+        raise ValueError(f"Not found in {entry.location} at offset {entry.offset}")
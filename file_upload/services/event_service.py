@@ -0,0 +1,211 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from file_upload.metrics import metrics
+from file_upload.models import FileEvent, UploadedFile
+from file_upload.serializers.upload import UploadedFileSerializer
+
+
+class EventService:
+    """
+    File event outbox: recording, streaming and webhook delivery
+
+    Events are rows written in the caller's transaction, so an event exists
+    exactly when the change it describes was committed. Webhooks are
+    delivered at least once; receivers deduplicate on the event id.
+    """
+
+    LATEST_KEY_PREFIX = 'file_upload:events:latest:'
+    SIGNATURE_HEADER = 'X-Webhook-Signature'
+
+    @staticmethod
+    def _cache():
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def record(cls, event_type: str, uploaded_file: UploadedFile, **data) -> FileEvent:
+        event = FileEvent.objects.create(
+            event_type=event_type,
+            file_id=uploaded_file.pk,
+            request_id=uploaded_file.request_id or '',
+            payload={**UploadedFileSerializer(uploaded_file).data, **data},
+            next_attempt_at=timezone.now(),
+        )
+        request_id = event.request_id
+        transaction.on_commit(
+            lambda: cls._cache().set(f"{cls.LATEST_KEY_PREFIX}{request_id}", event.pk, None)
+        )
+        metrics.inc('file_upload_events_total', type=event_type)
+        return event
+
+    @classmethod
+    def record_many(cls, event_type: str, uploaded_files: List[UploadedFile]) -> List[FileEvent]:
+        """Record one event per file with a single insert, for files inserted with bulk_create"""
+        now = timezone.now()
+        events = FileEvent.objects.bulk_create([
+            FileEvent(
+                event_type=event_type,
+                file_id=uploaded_file.pk,
+                request_id=uploaded_file.request_id or '',
+                payload=UploadedFileSerializer(uploaded_file).data,
+                next_attempt_at=now,
+            )
+            for uploaded_file in uploaded_files
+        ])
+        latest = {}
+        for event in events:
+            latest[event.request_id] = max(event.pk or 0, latest.get(event.request_id, 0))
+        transaction.on_commit(
+            lambda: cls._cache().set_many(
+                {f"{cls.LATEST_KEY_PREFIX}{request_id}": event_id for request_id, event_id in latest.items()}, None
+            )
+        )
+        metrics.inc('file_upload_events_total', len(events), type=event_type)
+        return events
+
+    @staticmethod
+    def serialize(event: FileEvent) -> Dict[str, Any]:
+        return {
+            'id': event.pk,
+            'type': event.event_type,
+            'file_id': str(event.file_id),
+            'request_id': event.request_id,
+            'created_at': event.created_at.isoformat(),
+            'data': event.payload,
+        }
+
+    @classmethod
+    def events_after(cls, request_id: str, after_id: int, limit: int = 100) -> List[FileEvent]:
+        return list(
+            FileEvent.objects.filter(request_id=request_id, id__gt=after_id).order_by('id')[:limit]
+        )
+
+    @classmethod
+    def latest_id(cls, request_id: str) -> Optional[int]:
+        """Id of the newest committed event of a request, if the cache still knows it"""
+        return cls._cache().get(f"{cls.LATEST_KEY_PREFIX}{request_id}")
+
+    @classmethod
+    def remember_latest(cls, request_id: str, event_id: int):
+        # add(), not set(): an event committed meanwhile must not be overwritten
+        cls._cache().add(f"{cls.LATEST_KEY_PREFIX}{request_id}", event_id, None)
+
+    @staticmethod
+    def signature(body: bytes, timestamp: int) -> str:
+        """Value of the signature header: HMAC-SHA256 of "<timestamp>.<body>" """
+        secret = getattr(settings, 'FILE_UPLOAD_WEBHOOK_SECRET', None) or settings.SECRET_KEY
+        digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={digest}"
+
+    @classmethod
+    def dispatch(cls, batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> Dict[str, int]:
+        """
+        Deliver pending events to FILE_UPLOAD_WEBHOOK_URL in batches
+
+        Each batch is one signed POST of up to `batch_size` events. A batch
+        is leased to one dispatcher for FILE_UPLOAD_WEBHOOK_LEASE seconds in
+        a short transaction and posted outside it, so a slow receiver holds
+        no row locks; several dispatchers can run at once. Events of a
+        dispatcher that died are taken over when its lease ends. Stops at
+        the first failed batch, as the receiver is likely down; the failed
+        events back off exponentially before their next attempt.
+        """
+        progress = {'batches': 0, 'delivered': 0, 'failed': 0}
+        url = getattr(settings, 'FILE_UPLOAD_WEBHOOK_URL', '')
+        if not url:
+            return progress
+
+        batch_size = batch_size or getattr(settings, 'FILE_UPLOAD_WEBHOOK_BATCH_SIZE', 100)
+        lease = timedelta(seconds=getattr(settings, 'FILE_UPLOAD_WEBHOOK_LEASE', 60))
+        while max_batches is None or progress['batches'] < max_batches:
+            events = cls._claim(batch_size, lease)
+            if not events:
+                break
+
+            error = cls._deliver(url, events)
+            if error is None:
+                FileEvent.objects.filter(id__in=[event.pk for event in events]).update(
+                    delivered_at=timezone.now(), last_error='', locked_until=None
+                )
+                progress['delivered'] += len(events)
+            else:
+                cls._schedule_retry(events, error)
+                progress['failed'] += len(events)
+
+            progress['batches'] += 1
+            metrics.inc('file_upload_webhook_batches_total', result='delivered' if error is None else 'failed')
+            if error is not None:
+                break
+        return progress
+
+    @staticmethod
+    def _claim(batch_size: int, lease: timedelta) -> List[FileEvent]:
+        """Lease up to `batch_size` due events; other dispatchers skip them until the lease ends"""
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                FileEvent.objects.select_for_update(skip_locked=True)
+                .filter(delivered_at__isnull=True, next_attempt_at__lte=now)
+                .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+                .order_by('id')[:batch_size]
+            )
+            if events:
+                FileEvent.objects.filter(id__in=[event.pk for event in events]).update(locked_until=now + lease)
+        return events
+
+    @classmethod
+    def _deliver(cls, url: str, events: List[FileEvent]) -> Optional[str]:
+        body = json.dumps({'events': [cls.serialize(event) for event in events]}, cls=DjangoJSONEncoder).encode()
+        headers = {
+            'Content-Type': 'application/json',
+            cls.SIGNATURE_HEADER: cls.signature(body, int(time.time())),
+        }
+        try:
+            response = requests.post(
+                url, data=body, headers=headers, timeout=getattr(settings, 'FILE_UPLOAD_WEBHOOK_TIMEOUT', 10)
+            )
+        except requests.RequestException as e:
+            return str(e)
+        if not 200 <= response.status_code < 300:
+            return f"HTTP {response.status_code}"
+        return None
+
+    @staticmethod
+    def _schedule_retry(events: List[FileEvent], error: str):
+        max_attempts = getattr(settings, 'FILE_UPLOAD_WEBHOOK_MAX_ATTEMPTS', 10)
+        base_delay = getattr(settings, 'FILE_UPLOAD_WEBHOOK_RETRY_BASE_DELAY', 10)
+        max_delay = getattr(settings, 'FILE_UPLOAD_WEBHOOK_RETRY_MAX_DELAY', 3600)
+        now = timezone.now()
+
+        for event in events:
+            event.attempts += 1
+            event.last_error = error[:1000]
+            event.locked_until = None
+            if event.attempts >= max_attempts:
+                event.next_attempt_at = None
+                metrics.inc('file_upload_webhook_dead_events_total')
+            else:
+                delay = min(base_delay * 2 ** (event.attempts - 1), max_delay)
+                # Jitter keeps retries of many dispatchers from arriving together
+                event.next_attempt_at = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+        FileEvent.objects.bulk_update(events, ['attempts', 'last_error', 'next_attempt_at', 'locked_until'])
+
+    @staticmethod
+    def purge(older_than: Optional[timedelta] = None) -> int:
+        """Delete events older than FILE_UPLOAD_EVENTS_RETENTION seconds, delivered or not"""
+        if older_than is None:
+            older_than = timedelta(seconds=getattr(settings, 'FILE_UPLOAD_EVENTS_RETENTION', 7 * 24 * 3600))
+        return FileEvent.objects.filter(created_at__lt=timezone.now() - older_than).delete()[0]
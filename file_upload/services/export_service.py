@@ -0,0 +1,109 @@
+import csv
+import json
+from datetime import datetime, time
+from typing import Iterator, Optional
+
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from file_upload.models import UploadedFile
+
+
+class ExportService:
+    """
+    Streams UploadedFile records as NDJSON or CSV
+
+    Rows are read with `values()` and `iterator(chunk_size=...)` so neither
+    model instances nor the whole result set are held in memory, and output
+    is flushed in small buffers so the first bytes go out immediately.
+    """
+
+    FIELDS = [
+        'id', 'request_id', 'original_filename', 'file_type', 'file_size',
+        'storage_backend', 'cloudinary_public_id', 's3_key', 'local_path',
+        'public_url', 'secure_url', 'metadata', 'created_at', 'updated_at',
+    ]
+    FORMATS = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+    FLUSH_SIZE = 64 * 1024
+
+    @staticmethod
+    def build_queryset(
+            created_after: Optional[str] = None,
+            created_before: Optional[str] = None,
+            storage_backend: Optional[str] = None,
+            file_type: Optional[str] = None
+    ) -> QuerySet:
+        """
+        Build the export queryset from filter values
+
+        Raises:
+            ValueError: If a date filter cannot be parsed
+        """
+        queryset = UploadedFile.objects.order_by()
+
+        if created_after:
+            queryset = queryset.filter(created_at__gte=ExportService._parse_date(created_after))
+        if created_before:
+            queryset = queryset.filter(created_at__lt=ExportService._parse_date(created_before))
+        if storage_backend:
+            queryset = queryset.filter(storage_backend=storage_backend)
+        if file_type:
+            queryset = queryset.filter(file_type=file_type)
+
+        return queryset
+
+    @staticmethod
+    def stream(queryset: QuerySet, export_format: str = 'ndjson', chunk_size: int = 2000) -> Iterator[bytes]:
+        if export_format not in ExportService.FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+
+        rows = queryset.values(*ExportService.FIELDS).iterator(chunk_size=chunk_size)
+        lines = ExportService._csv_lines(rows) if export_format == 'csv' else ExportService._ndjson_lines(rows)
+
+        buffer = []
+        buffered = 0
+        for line in lines:
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= ExportService.FLUSH_SIZE:
+                yield ''.join(buffer).encode()
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield ''.join(buffer).encode()
+
+    @staticmethod
+    def _ndjson_lines(rows) -> Iterator[str]:
+        for row in rows:
+            yield json.dumps(row, default=str) + '\n'
+
+    @staticmethod
+    def _csv_lines(rows) -> Iterator[str]:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(ExportService.FIELDS)
+        for row in rows:
+            row['metadata'] = json.dumps(row['metadata'])
+            yield writer.writerow([row[field] for field in ExportService.FIELDS])
+
+    @staticmethod
+    def _parse_date(value: str) -> datetime:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"Invalid date: {value}")
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class _Echo:
+    """File-like object that returns what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
@@ -1,8 +1,18 @@
 import os
-from typing import Optional
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
 
 from file_upload.models import UploadedFile
-from file_upload.utils import get_storage_backend
+from file_upload.services.image_hash_service import ImageHashService
+from file_upload.services.media_service import MediaMetadataService
+from file_upload.services.placeholder_service import PlaceholderService
+from file_upload.services.retention_service import RetentionService
+from file_upload.utils import get_storage_backend, reduced_image
 
 
 class FileUploadService:
@@ -11,7 +21,9 @@ class FileUploadService:
     def upload_file(
             file,
             request_id: Optional[str] = None,
-            file_type: Optional[str] = None
+            file_type: Optional[str] = None,
+            ttl: Optional[int] = None,
+            previous_version: Optional[UploadedFile] = None
     ) -> UploadedFile:
         """
         Upload a file using the configured storage backend
@@ -20,49 +32,109 @@ class FileUploadService:
             file: File object to upload
             request_id: Request ID
             file_type: Type of file (will be auto-detected if not provided)
+            ttl: Seconds to keep the file (defaults to the retention policy)
+            previous_version: File this upload is a new version of
+
+        Returns:
+            UploadedFile: The created file record, or with FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD
+                an existing near-duplicate image, which has a `near_duplicate_distance`
+        """
+        uploaded_file, hashes = FileUploadService.prepare_upload(file, request_id, file_type, ttl, previous_version)
+        if not uploaded_file._state.adding:
+            return uploaded_file
+
+        with transaction.atomic():
+            uploaded_file.save(force_insert=True)
+            if hashes is not None:
+                ImageHashService.index(uploaded_file, hashes)
+        return uploaded_file
+
+    @staticmethod
+    def prepare_upload(
+            file,
+            request_id: Optional[str] = None,
+            file_type: Optional[str] = None,
+            ttl: Optional[int] = None,
+            previous_version: Optional[UploadedFile] = None,
+            storage=None
+    ) -> Tuple[UploadedFile, Optional[Tuple[int, int]]]:
+        """
+        Send a file to storage and build its record, without saving it
+
+        Safe to call from several threads; the caller inserts the records,
+        alone or in bulk, together with the image hash index entries.
 
         Returns:
-            UploadedFile: The created file record
+            The unsaved UploadedFile (or a saved near-duplicate, see upload_file)
+            and the image hashes to index, if any
         """
         if not file_type:
             file_type = FileUploadService._detect_file_type(file.name)
 
-        storage = get_storage_backend()
+        expires_at = RetentionService.expiry_for(file_type, request_id, ttl)
+
+        storage = storage or get_storage_backend()
+
+        if not FileUploadService._is_seekable(file) and (not storage.accepts_streams or (
+                file_type == 'image' and (ImageHashService.enabled() or PlaceholderService.enabled()))):
+            # Images are decoded whole for their hashes and placeholder, so
+            # streamed ones are spooled; they are at most MAX_FILE_SIZE
+            file = FileUploadService._spool(file)
+
+        metadata = {}
+        media = MediaMetadataService.probe_upload(file, file_type)
+        if media is not None:
+            metadata[MediaMetadataService.METADATA_KEY] = media
+
+        image = None
+        if file_type == 'image' and FileUploadService._is_seekable(file) and (
+                ImageHashService.enabled() or PlaceholderService.enabled()):
+            # One reduced-size decode serves the hashes and the placeholder
+            image = reduced_image(file)
+
+        hashes = ImageHashService.hash_upload(image) if image is not None else None
+        if hashes is not None:
+            duplicate = None if previous_version else ImageHashService.find_upload_duplicate(hashes, request_id)
+            if duplicate is not None:
+                return duplicate, None
+            metadata[ImageHashService.METADATA_KEY] = ImageHashService.describe(hashes)
+
+        if image is not None and PlaceholderService.enabled():
+            metadata[PlaceholderService.METADATA_KEY] = PlaceholderService.build(image)
 
         upload_result = storage.upload_file(
             file=file,
             filename=file.name,
             file_type=file_type,
-            request_id=request_id if request_id else None
+            request_id=request_id if request_id else None,
+            expires_at=expires_at,
+            previous=previous_version
         )
 
-        uploaded_file = UploadedFile.objects.create(
+        uploaded_file = UploadedFile(
             request_id=request_id,
             original_filename=file.name,
             file_type=file_type,
             file_size=file.size,
-            storage_backend=storage.__class__.__name__.lower().replace('storage', ''),
+            storage_backend=storage.name,
             public_url=upload_result['public_url'],
             secure_url=upload_result.get('secure_url'),
-            metadata=upload_result.get('metadata', {}),
+            metadata={**upload_result.get('metadata', {}), **metadata},
+            expires_at=expires_at,
+            version=previous_version.version + 1 if previous_version else 1,
+            previous_version=previous_version,
+            # The key is set before the insert, so the row is written once
+            **{UploadedFile.STORAGE_KEY_FIELDS[storage.name]: upload_result['storage_id']},
         )
-
-        if 'cloudinary' in storage.__class__.__name__.lower():
-            uploaded_file.cloudinary_public_id = upload_result['storage_id']
-        elif 's3' in storage.__class__.__name__.lower():
-            uploaded_file.s3_key = upload_result['storage_id']
-        elif 'local' in storage.__class__.__name__.lower():
-            uploaded_file.local_path = upload_result['storage_id']
-
-        uploaded_file.save()
-        return uploaded_file
+        return uploaded_file, hashes
 
     @staticmethod
     def delete_file(uploaded_file: UploadedFile) -> bool:
         try:
             success = uploaded_file.delete_from_storage()
 
-            uploaded_file.delete()
+            with transaction.atomic():
+                uploaded_file.delete()
 
             return success
         except Exception as e:
@@ -71,9 +143,22 @@ class FileUploadService:
 
     @staticmethod
     def get_file_url(uploaded_file: UploadedFile, **kwargs) -> str:
-        storage = get_storage_backend()
+        storage = get_storage_backend(uploaded_file.storage_backend)
         return storage.get_file_url(uploaded_file, **kwargs)
 
+    @staticmethod
+    def _is_seekable(file) -> bool:
+        seekable = getattr(file, 'seekable', None)
+        return seekable() if callable(seekable) else hasattr(file, 'seek')
+
+    @staticmethod
+    def _spool(file) -> File:
+        """Copy a non-seekable stream into a temporary file, in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE"""
+        spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        shutil.copyfileobj(file, spooled, getattr(file, 'chunk_size', 64 * 1024))
+        spooled.seek(0)
+        return File(spooled, name=file.name)
+
     @staticmethod
     def _detect_file_type(filename: str) -> str:
         ext = os.path.splitext(filename)[1].lower()
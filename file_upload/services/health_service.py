@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict
+
+from django.conf import settings
+from django.db import connections
+
+from file_upload.metrics import metrics
+from file_upload.storages.resilient_storage import circuit_breaker_states
+from file_upload.utils import get_storage_backend
+
+
+class HealthService:
+    """
+    Readiness probes for the database and the configured storage backends
+
+    Probe results are cached in process for `FILE_UPLOAD_HEALTH_CACHE_SECONDS`
+    so load balancers can poll the readiness endpoint at a high rate without
+    each poll hitting S3 or Cloudinary. While one thread refreshes an expired
+    result, concurrent callers keep getting the previous one.
+    """
+
+    _lock = threading.Lock()
+    _refreshing = False
+    _cached: Dict[str, Any] = {}
+    _checked_at = 0.0
+
+    @classmethod
+    def readiness(cls, force: bool = False) -> Dict[str, Any]:
+        ttl = getattr(settings, 'FILE_UPLOAD_HEALTH_CACHE_SECONDS', 10)
+
+        with cls._lock:
+            fresh = cls._cached and time.monotonic() - cls._checked_at < ttl
+            if (fresh or cls._refreshing) and cls._cached and not force:
+                return cls._cached
+            cls._refreshing = True
+
+        try:
+            result = cls._run_probes()
+        finally:
+            with cls._lock:
+                cls._refreshing = False
+
+        with cls._lock:
+            cls._cached = result
+            cls._checked_at = time.monotonic()
+        return result
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._cached = {}
+            cls._checked_at = 0.0
+
+    @classmethod
+    def _run_probes(cls) -> Dict[str, Any]:
+        checks = {'database': cls._probe('database', cls._probe_database)}
+
+        backends = getattr(settings, 'FILE_UPLOAD_HEALTH_BACKENDS', None) or [
+            getattr(settings, 'FILE_UPLOAD_STORAGE_BACKEND', 'cloudinary')
+        ]
+        for backend in backends:
+            checks[f'storage:{backend}'] = cls._probe(backend, lambda b=backend: get_storage_backend(b).probe())
+
+        return {
+            'status': 'ok' if all(c['status'] == 'ok' for c in checks.values()) else 'unavailable',
+            'checked_at': datetime.now(UTC).isoformat(),
+            'checks': checks,
+            'circuit_breakers': circuit_breaker_states(),
+        }
+
+    @staticmethod
+    def _probe(name: str, probe: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            details = probe() or {}
+            result = {'status': 'ok', **details}
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e)}
+
+        latency = time.monotonic() - started
+        result['latency_ms'] = round(latency * 1000, 2)
+        metrics.set('file_upload_health_probe_latency_seconds', latency, check=name)
+        metrics.set('file_upload_health_probe_up', 1 if result['status'] == 'ok' else 0, check=name)
+        return result
+
+    @staticmethod
+    def _probe_database() -> Dict[str, Any]:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        return {}
@@ -0,0 +1,251 @@
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from file_upload.metrics import metrics
+from file_upload.models import ImageHash, UploadedFile
+from file_upload.services.backfill_service import BackfillService
+from file_upload.utils import compute_image_hashes, get_tenant
+
+try:
+    import numpy
+except ImportError:  # optional dependency
+    numpy = None
+
+BAND_MASK = (1 << ImageHash.BAND_BITS) - 1
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value: int) -> int:
+    return value & (1 << 64) - 1
+
+
+def _bands(phash: int) -> List[int]:
+    return [
+        (phash >> (ImageHash.BAND_BITS * (ImageHash.BANDS - 1 - index))) & BAND_MASK
+        for index in range(ImageHash.BANDS)
+    ]
+
+
+def _neighbours(value: int, radius: int) -> List[int]:
+    """Band values within Hamming distance `radius` of `value`"""
+    values = [value]
+    for flipped in range(1, radius + 1):
+        for bits in combinations(range(ImageHash.BAND_BITS), flipped):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            values.append(value ^ mask)
+    return values
+
+
+def _distances(target: int, hashes: List[int]) -> List[int]:
+    # Vectorized popcount for large candidate sets when NumPy is installed
+    if numpy is not None and len(hashes) > 256:
+        values = numpy.array(hashes, dtype=numpy.int64).view(numpy.uint64) ^ numpy.uint64(target)
+        return numpy.unpackbits(values.view(numpy.uint8)).reshape(-1, 64).sum(axis=1).tolist()
+    return [(_unsigned(value) ^ target).bit_count() for value in hashes]
+
+
+class ImageHashService:
+    """
+    Perceptual hashes of images and near-duplicate lookups
+
+    Every image upload gets a pHash and a dHash (see utils.compute_image_hashes),
+    indexed in ImageHash. Files match when their pHashes are within
+    `max_distance` bits and their dHashes within FILE_UPLOAD_IMAGE_HASH_MAX_DHASH_DISTANCE,
+    which filters the rare pHash collisions of unrelated images. Lookups only
+    consider files of the same tenant.
+    """
+
+    FILE_TYPES = ('image',)
+    METADATA_KEY = 'image_hash'
+
+    # Four bands searched at radius 3 cover distance 15; wider searches read most of the index
+    MAX_SEARCH_DISTANCE = ImageHash.BANDS * 4 - 1
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'FILE_UPLOAD_IMAGE_HASH_ENABLED', True)
+
+    @staticmethod
+    def default_distance() -> int:
+        return getattr(settings, 'FILE_UPLOAD_IMAGE_HASH_MAX_DISTANCE', 6)
+
+    @staticmethod
+    def describe(hashes: Tuple[int, int]) -> Dict[str, str]:
+        """metadata['image_hash'] of a file"""
+        return {'phash': f"{hashes[0]:016x}", 'dhash': f"{hashes[1]:016x}"}
+
+    @classmethod
+    def hash_upload(cls, image) -> Optional[Tuple[int, int]]:
+        """Hashes of an image upload, decoded by `utils.reduced_image`, or None if hashing is off"""
+        return compute_image_hashes(image) if cls.enabled() else None
+
+    @staticmethod
+    def entry(uploaded_file: UploadedFile, hashes: Tuple[int, int]) -> ImageHash:
+        """Unsaved index entry of a file, for bulk_create"""
+        phash, dhash = hashes
+        return ImageHash(
+            uploaded_file=uploaded_file,
+            tenant=get_tenant(uploaded_file.request_id),
+            phash=_signed(phash),
+            dhash=_signed(dhash),
+            **{f"band{index}": band for index, band in enumerate(_bands(phash))},
+        )
+
+    @classmethod
+    def index(cls, uploaded_file: UploadedFile, hashes: Tuple[int, int]) -> ImageHash:
+        entry = cls.entry(uploaded_file, hashes)
+        image_hash, _ = ImageHash.objects.update_or_create(
+            uploaded_file=uploaded_file,
+            defaults={
+                field: getattr(entry, field)
+                for field in ('tenant', 'phash', 'dhash', 'band0', 'band1', 'band2', 'band3')
+            },
+        )
+        return image_hash
+
+    @classmethod
+    def find_similar(
+            cls,
+            hashes: Tuple[int, int],
+            tenant: str = '',
+            max_distance: Optional[int] = None,
+            limit: int = 20,
+            exclude=None
+    ) -> List[Tuple[str, int]]:
+        """
+        IDs of indexed files near `hashes` and their pHash distances, nearest first
+
+        Args:
+            hashes: (pHash, dHash) to search for
+            tenant: Only match files of this tenant
+            max_distance: Largest pHash distance, at most MAX_SEARCH_DISTANCE
+            limit: Maximum number of results
+            exclude: ID of a file to leave out (the file searched for)
+        """
+        phash, dhash = hashes
+        max_distance = cls.default_distance() if max_distance is None else max_distance
+        max_dhash_distance = getattr(settings, 'FILE_UPLOAD_IMAGE_HASH_MAX_DHASH_DISTANCE', 12)
+        radius = max_distance // ImageHash.BANDS
+
+        query = Q()
+        for index, band in enumerate(_bands(phash)):
+            # The tenant goes in every branch so each one is served by its (tenant, band) index
+            query |= Q(tenant=tenant, **{f"band{index}__in": _neighbours(band, radius)})
+        candidates = ImageHash.objects.filter(query)
+        if exclude is not None:
+            candidates = candidates.exclude(uploaded_file_id=exclude)
+        rows = list(candidates.values_list('uploaded_file_id', 'phash', 'dhash'))
+        metrics.inc('file_upload_image_hash_lookups_total')
+        metrics.inc('file_upload_image_hash_candidates_total', len(rows))
+
+        phash_distances = _distances(phash, [row[1] for row in rows])
+        dhash_distances = _distances(dhash, [row[2] for row in rows])
+        matches = [
+            (row[0], distance)
+            for row, distance, dhash_distance in zip(rows, phash_distances, dhash_distances)
+            if distance <= max_distance and dhash_distance <= max_dhash_distance
+        ]
+        matches.sort(key=lambda match: match[1])
+        return matches[:limit]
+
+    @classmethod
+    def near_duplicates(
+            cls,
+            uploaded_file: UploadedFile,
+            max_distance: Optional[int] = None,
+            limit: int = 20
+    ) -> Optional[List[Tuple[UploadedFile, int]]]:
+        """
+        Files that look like `uploaded_file`, with their distances
+
+        Returns:
+            List of (UploadedFile, distance), nearest first, or None if the file has no hash
+        """
+        image_hash = ImageHash.objects.filter(uploaded_file_id=uploaded_file.pk).first()
+        if image_hash is None:
+            return None
+
+        matches = cls.find_similar(
+            (_unsigned(image_hash.phash), _unsigned(image_hash.dhash)),
+            tenant=image_hash.tenant,
+            max_distance=max_distance,
+            limit=limit,
+            exclude=uploaded_file.pk,
+        )
+        files = UploadedFile.objects.in_bulk([file_id for file_id, _ in matches])
+        return [(files[file_id], distance) for file_id, distance in matches if file_id in files]
+
+    @classmethod
+    def find_upload_duplicate(cls, hashes: Tuple[int, int], request_id: Optional[str]) -> Optional[UploadedFile]:
+        """
+        Existing file an upload can be answered with, when FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD is on
+
+        The match must be within FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE bits and
+        not expired. It gets a `near_duplicate_distance` attribute.
+        """
+        if not getattr(settings, 'FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD', False):
+            return None
+
+        matches = cls.find_similar(
+            hashes,
+            tenant=get_tenant(request_id),
+            max_distance=getattr(settings, 'FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE', 4),
+            limit=5,
+        )
+        now = timezone.now()
+        files = UploadedFile.objects.in_bulk([file_id for file_id, _ in matches])
+        for file_id, distance in matches:
+            duplicate = files.get(file_id)
+            if duplicate is not None and (duplicate.expires_at is None or duplicate.expires_at > now):
+                duplicate.near_duplicate_distance = distance
+                metrics.inc('file_upload_image_dedup_hits_total')
+                return duplicate
+        return None
+
+    @classmethod
+    def backfill(
+            cls,
+            batch_size: int = 200,
+            workers: int = 4,
+            limit: Optional[int] = None,
+            dry_run: bool = False,
+            on_file: Optional[Callable[[UploadedFile, Optional[Tuple[int, int]], Optional[str]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Hash stored images that are not in the index yet
+
+        Files are walked by id in batches and downloaded and hashed by
+        `workers` threads; results are saved from the calling thread. Files
+        whose backend fails are counted as failed, files that do not decode
+        as unreadable; both are retried by the next run.
+        """
+        queryset = UploadedFile.objects.filter(file_type__in=cls.FILE_TYPES, image_hash__isnull=True)
+
+        def record(uploaded_file, hashes):
+            if hashes is None:
+                return 'unreadable'
+            if not dry_run:
+                cls.index(uploaded_file, hashes)
+                uploaded_file.metadata = {**(uploaded_file.metadata or {}), cls.METADATA_KEY: cls.describe(hashes)}
+                uploaded_file.save(update_fields=['metadata', 'updated_at'])
+            return 'hashed'
+
+        return BackfillService.run(
+            queryset,
+            lambda uploaded_file, storage: compute_image_hashes(BackfillService.read(uploaded_file, storage)),
+            record,
+            {'hashed': 0, 'unreadable': 0, 'failed': 0},
+            batch_size=batch_size,
+            workers=workers,
+            limit=limit,
+            on_file=on_file,
+        )
@@ -0,0 +1,246 @@
+import csv
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.core.files import File
+from django.db import transaction
+
+from file_upload.models import FileEvent, ImageHash, UploadedFile
+from file_upload.services.cloudinary_service import CloudinaryNotificationService
+from file_upload.services.event_service import EventService
+from file_upload.services.file_service import FileUploadService
+from file_upload.services.image_hash_service import ImageHashService
+from file_upload.services.usage_service import UsageService
+from file_upload.storages.base_storage import StorageError
+from file_upload.utils import get_storage_backend
+
+
+class IngestError(Exception):
+    """Raised when an ingest source or checkpoint cannot be used"""
+
+
+class IngestItem(NamedTuple):
+    """A local file to ingest"""
+
+    path: str
+    # Path relative to the source directory (or as listed in the manifest)
+    name: str
+    file_type: Optional[str] = None
+    request_id: Optional[str] = None
+    ttl: Optional[int] = None
+
+
+class IngestService:
+    """
+    Bulk loading of local files: a directory tree or a CSV/JSONL manifest
+
+    Files are uploaded to the configured backend by a bounded thread pool,
+    a batch at a time, and each batch's records are inserted with
+    bulk_create in one transaction, together with their usage totals,
+    `file.created` events and image hash index entries, which signals would
+    otherwise maintain row by row. A checkpoint written after every
+    committed batch lets an interrupted ingest resume where it stopped;
+    uploads of the batch in flight when it stopped are orphaned in storage
+    (see reconcilefiles) and redone.
+    """
+
+    @staticmethod
+    def iter_directory(root: str, after: Optional[str] = None) -> Iterator[IngestItem]:
+        """
+        Files under `root`, lazily, in sorted order of their relative path
+
+        Hidden files and directories and symlinks are skipped. With `after`
+        (a relative path), only files after it are listed and directories
+        entirely before it are not read at all.
+        """
+        after_parts = tuple(after.split('/')) if after else ()
+
+        def walk(directory: str, parts: Tuple[str, ...]) -> Iterator[IngestItem]:
+            with os.scandir(directory) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                entry_parts = parts + (entry.name,)
+                if entry.is_dir(follow_symlinks=False):
+                    if entry_parts >= after_parts[:len(entry_parts)]:
+                        yield from walk(entry.path, entry_parts)
+                elif entry.is_file(follow_symlinks=False) and entry_parts > after_parts:
+                    yield IngestItem(entry.path, '/'.join(entry_parts))
+
+        yield from walk(root, ())
+
+    @classmethod
+    def iter_manifest(cls, manifest: str) -> Iterator[IngestItem]:
+        """
+        Files listed in a CSV (with a header row) or JSONL manifest
+
+        Each entry has a `path`, relative to the manifest's directory or
+        absolute, and optionally `file_type`, `request_id` and `ttl`.
+        """
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, newline='', encoding='utf-8') as f:
+            if manifest.endswith(('.jsonl', '.ndjson')):
+                rows = (json.loads(line) for line in f if line.strip())
+            else:
+                rows = csv.DictReader(f)
+            for number, row in enumerate(rows, 1):
+                if not isinstance(row, dict) or not row.get('path'):
+                    raise IngestError(f"Manifest entry {number} has no path")
+                ttl = row.get('ttl')
+                yield IngestItem(
+                    os.path.join(base, row['path']),
+                    row['path'],
+                    row.get('file_type') or None,
+                    row.get('request_id') or None,
+                    int(ttl) if ttl not in (None, '') else None,
+                )
+
+    @classmethod
+    def ingest(
+            cls,
+            source: str,
+            checkpoint: Optional[str] = None,
+            request_id: Optional[str] = None,
+            workers: int = 8,
+            batch_size: int = 200,
+            limit: Optional[int] = None,
+            on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+            on_error: Optional[Callable[[IngestItem, str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Ingest a directory or manifest, resuming from `checkpoint` if it exists
+
+        Args:
+            source: Directory to walk, or a .csv/.jsonl manifest
+            checkpoint: JSON file recording progress after each batch
+            request_id: Request ID of files the manifest gives none; defaults
+                to one new ID per ingest, kept across resumes
+            workers: Files uploaded concurrently
+            batch_size: Files uploaded and inserted per batch
+            limit: Stop after this many files in this run
+
+        Returns:
+            Progress: files, bytes, duplicates, failed and seconds of this run,
+            and the request_id and totals since the ingest started
+        """
+        source = os.path.abspath(source)
+        state = cls._load_checkpoint(checkpoint, source)
+        state.setdefault('request_id', request_id or str(uuid.uuid4()))
+
+        if os.path.isdir(source):
+            items = cls.iter_directory(source, after=state.get('last'))
+        elif os.path.isfile(source):
+            items = islice(cls.iter_manifest(source), state.get('position', 0), None)
+        else:
+            raise IngestError(f"No such directory or manifest: {source}")
+        if limit is not None:
+            items = islice(items, limit)
+
+        storage = get_storage_backend()
+        progress = {'files': 0, 'bytes': 0, 'duplicates': 0, 'failed': 0, 'batches': 0, 'seconds': 0.0}
+        started = time.monotonic()
+
+        file_types = dict(UploadedFile.FILE_TYPE_CHOICES)
+
+        def prepare(item: IngestItem):
+            if item.file_type and item.file_type not in file_types:
+                return item, None, None, f"Invalid file type: {item.file_type}"
+            try:
+                with open(item.path, 'rb') as f:
+                    file = File(f, name=os.path.basename(item.name))
+                    uploaded_file, hashes = FileUploadService.prepare_upload(
+                        file, item.request_id or state['request_id'], item.file_type, item.ttl, storage=storage
+                    )
+                if uploaded_file._state.adding:
+                    uploaded_file.metadata = {**uploaded_file.metadata, 'source_path': item.name}
+                return item, uploaded_file, hashes, None
+            except (OSError, StorageError, ValueError) as e:
+                return item, None, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(islice(items, batch_size))
+                if not batch:
+                    break
+
+                counts = {'files': 0, 'bytes': 0, 'duplicates': 0, 'failed': 0}
+                records, entries = [], []
+                for item, uploaded_file, hashes, error in executor.map(prepare, batch):
+                    if error is not None:
+                        counts['failed'] += 1
+                        if on_error:
+                            on_error(item, error)
+                    elif not uploaded_file._state.adding:
+                        counts['duplicates'] += 1
+                    else:
+                        records.append(uploaded_file)
+                        counts['files'] += 1
+                        counts['bytes'] += uploaded_file.file_size
+                        if hashes is not None:
+                            entries.append((uploaded_file, hashes))
+
+                cls._insert(records, entries)
+
+                state['position'] = state.get('position', 0) + len(batch)
+                state['last'] = batch[-1].name
+                totals = state.setdefault('totals', {})
+                for key, count in counts.items():
+                    progress[key] += count
+                    totals[key] = totals.get(key, 0) + count
+                cls._save_checkpoint(checkpoint, state)
+
+                progress['batches'] += 1
+                progress['seconds'] = time.monotonic() - started
+                if on_batch:
+                    on_batch(progress)
+
+        progress['seconds'] = time.monotonic() - started
+        progress['request_id'] = state['request_id']
+        progress['totals'] = state.get('totals', {})
+        return progress
+
+    @staticmethod
+    def _insert(records: List[UploadedFile], entries: List[Tuple[UploadedFile, Tuple[int, int]]]):
+        if not records:
+            return
+        for record in records:
+            # bulk_create bypasses save(), which maintains the search text
+            record.search_text = record.build_search_text()
+        with transaction.atomic():
+            UploadedFile.objects.bulk_create(records)
+            ImageHash.objects.bulk_create([ImageHashService.entry(record, hashes) for record, hashes in entries])
+            UsageService.record_many(records)
+            EventService.record_many(FileEvent.FILE_CREATED, records)
+            # As the post_save signal does for single uploads
+            public_ids = [
+                record.cloudinary_public_id for record in records
+                if CloudinaryNotificationService.awaits_notifications(record)
+            ]
+            if public_ids:
+                transaction.on_commit(lambda: CloudinaryNotificationService.apply_pending(public_ids))
+
+    @staticmethod
+    def _load_checkpoint(checkpoint: Optional[str], source: str) -> Dict[str, Any]:
+        if not checkpoint or not os.path.exists(checkpoint):
+            return {'source': source}
+        with open(checkpoint, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('source') != source:
+            raise IngestError(f"Checkpoint {checkpoint} belongs to {state.get('source')}, not {source}")
+        return state
+
+    @staticmethod
+    def _save_checkpoint(checkpoint: Optional[str], state: Dict[str, Any]):
+        if not checkpoint:
+            return
+        # Replaced atomically, so a crash leaves the previous checkpoint intact
+        temporary = f"{checkpoint}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,109 @@
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from file_upload.media_probe import MediaProbeError, RangeReader, probe
+from file_upload.models import UploadedFile
+from file_upload.services.backfill_service import BackfillService
+from file_upload.utils import get_storage_backend
+
+
+class MediaMetadataService:
+    """
+    Duration, codecs, dimensions and bitrate of audio and video files
+
+    Facts are read from the container headers only (see media_probe) and
+    stored under metadata['media']; a file whose headers cannot be parsed
+    gets {'error': ...} there so the backfill does not retry it forever.
+    """
+
+    FILE_TYPES = ('video', 'audio')
+    METADATA_KEY = 'media'
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'FILE_UPLOAD_MEDIA_PROBE_ENABLED', True)
+
+    @staticmethod
+    def _max_bytes() -> int:
+        return getattr(settings, 'FILE_UPLOAD_MEDIA_PROBE_MAX_BYTES', 1024 * 1024)
+
+    @classmethod
+    def probe_upload(cls, file, file_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Probe an upload before it is sent to storage
+
+        Returns None when the file is not audio or video, or is a
+        non-seekable stream; those are left to the backfill. The file
+        position is restored.
+        """
+        seekable = getattr(file, 'seekable', None)
+        if not cls.enabled() or file_type not in cls.FILE_TYPES or not (callable(seekable) and seekable()):
+            return None
+
+        position = file.tell()
+        try:
+            reader = RangeReader.from_file(file, getattr(file, 'size', None), max_bytes=cls._max_bytes())
+            return probe(reader, file.name)
+        except MediaProbeError as e:
+            return {'error': str(e)}
+        finally:
+            file.seek(position)
+
+    @classmethod
+    def probe_stored(cls, uploaded_file: UploadedFile, storage=None) -> Dict[str, Any]:
+        """
+        Probe a stored file through range reads on its backend
+
+        Raises:
+            StorageError: If the backend cannot be read, so the file can be retried later
+        """
+        storage = storage or get_storage_backend(uploaded_file.storage_backend)
+        reader = RangeReader(
+            lambda start, length: storage.read_range(uploaded_file, start, length),
+            uploaded_file.file_size,
+            max_bytes=cls._max_bytes(),
+        )
+        try:
+            return probe(reader, uploaded_file.original_filename)
+        except MediaProbeError as e:
+            return {'error': str(e)}
+
+    @classmethod
+    def backfill(
+            cls,
+            batch_size: int = 200,
+            workers: int = 4,
+            limit: Optional[int] = None,
+            force: bool = False,
+            dry_run: bool = False,
+            on_file: Optional[Callable[[UploadedFile, Optional[Dict[str, Any]], Optional[str]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Probe stored audio and video files that have no media facts yet
+
+        Files are walked by id in batches; each batch is probed by `workers`
+        threads, and the results are saved from the calling thread. Files
+        whose backend fails or cannot do range reads are counted as failed
+        and left unchanged.
+        """
+        queryset = UploadedFile.objects.filter(file_type__in=cls.FILE_TYPES)
+        if not force:
+            queryset = queryset.exclude(metadata__has_key=cls.METADATA_KEY)
+
+        def record(uploaded_file, media):
+            if not dry_run:
+                uploaded_file.metadata = {**(uploaded_file.metadata or {}), cls.METADATA_KEY: media}
+                uploaded_file.save(update_fields=['metadata', 'updated_at'])
+            return 'unparsable' if 'error' in media else 'probed'
+
+        return BackfillService.run(
+            queryset,
+            cls.probe_stored,
+            record,
+            {'probed': 0, 'unparsable': 0, 'failed': 0},
+            batch_size=batch_size,
+            workers=workers,
+            limit=limit,
+            on_file=on_file,
+        )
@@ -0,0 +1,85 @@
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from file_upload.models import UploadedFile
+from file_upload.services.backfill_service import BackfillService
+from file_upload.utils import compute_placeholder
+
+
+class PlaceholderService:
+    """
+    Low-quality image placeholders (LQIP)
+
+    Image uploads get metadata['placeholder']: a JPEG of at most
+    FILE_UPLOAD_PLACEHOLDER_SIZE pixels as a data URI, and the image's
+    dominant color and aspect ratio. Clients render it blurred while the
+    real image loads, without requesting a thumbnail. Images that cannot
+    be decoded get {'error': ...} so the backfill does not retry them.
+    """
+
+    FILE_TYPES = ('image',)
+    METADATA_KEY = 'placeholder'
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'FILE_UPLOAD_PLACEHOLDERS_ENABLED', True)
+
+    @staticmethod
+    def build(image) -> Dict[str, Any]:
+        """Placeholder of a file or of an image from `utils.reduced_image`"""
+        placeholder = compute_placeholder(
+            image,
+            size=getattr(settings, 'FILE_UPLOAD_PLACEHOLDER_SIZE', 16),
+            quality=getattr(settings, 'FILE_UPLOAD_PLACEHOLDER_QUALITY', 40),
+            max_bytes=getattr(settings, 'FILE_UPLOAD_PLACEHOLDER_MAX_BYTES', 1024),
+        )
+        return placeholder if placeholder is not None else {'error': 'Image could not be decoded'}
+
+    @staticmethod
+    def public(metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The placeholder clients get, or None"""
+        placeholder = (metadata or {}).get(PlaceholderService.METADATA_KEY)
+        if not placeholder or 'error' in placeholder:
+            return None
+        return placeholder
+
+    @classmethod
+    def backfill(
+            cls,
+            batch_size: int = 200,
+            workers: int = 4,
+            limit: Optional[int] = None,
+            force: bool = False,
+            dry_run: bool = False,
+            on_file: Optional[Callable[[UploadedFile, Optional[Dict[str, Any]], Optional[str]], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Compute placeholders of stored images that have none yet
+
+        Files are walked by id in batches; each batch is downloaded and
+        decoded by `workers` threads (Pillow releases the GIL while
+        decoding), and the results are saved from the calling thread.
+        Files whose backend fails are counted as failed and left unchanged.
+        """
+        queryset = UploadedFile.objects.filter(file_type__in=cls.FILE_TYPES)
+        if not force:
+            queryset = queryset.exclude(metadata__has_key=cls.METADATA_KEY)
+
+        def record(uploaded_file, placeholder):
+            if not dry_run:
+                uploaded_file.metadata = {**(uploaded_file.metadata or {}), cls.METADATA_KEY: placeholder}
+                # updated_at changes the ETag, so clients see the new placeholder
+                uploaded_file.save(update_fields=['metadata', 'updated_at'])
+            return 'unreadable' if 'error' in placeholder else 'created'
+
+        return BackfillService.run(
+            queryset,
+            lambda uploaded_file, storage: cls.build(BackfillService.read(uploaded_file, storage)),
+            record,
+            {'created': 0, 'unreadable': 0, 'failed': 0},
+            batch_size=batch_size,
+            workers=workers,
+            limit=limit,
+            on_file=on_file,
+        )
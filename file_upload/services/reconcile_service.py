@@ -0,0 +1,160 @@
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from file_upload.models import ArchivedFile, UploadedFile
+from file_upload.utils import get_storage_backend
+
+
+class ReconcileError(Exception):
+    """Raised when a listing is not in key order, so the merge join cannot be trusted"""
+
+
+@dataclass
+class ReconcileReport:
+    scanned_objects: int = 0
+    scanned_records: int = 0
+    matched: int = 0
+    storage_orphans: int = 0
+    record_orphans: int = 0
+    deleted_objects: int = 0
+    deleted_records: int = 0
+    skipped_recent: int = 0
+    samples: List[str] = field(default_factory=list)
+
+
+class ReconcileService:
+    """
+    Finds storage objects without a record and records without a storage object
+
+    The backend listing and the database keys are both streamed in ascending key
+    order and merge-joined, so memory stays bounded by the fix batch size
+    whatever the number of objects. Objects and records newer than `min_age` are
+    left alone because an upload may still be between the storage write and
+    the row insert.
+    """
+
+    def __init__(
+            self,
+            backend: str,
+            fix_storage: bool = False,
+            fix_records: bool = False,
+            min_age: timedelta = timedelta(hours=1),
+            batch_size: int = 500,
+            on_orphan: Optional[Callable[[str, str], None]] = None
+    ):
+        self.backend = backend
+        self.key_field = UploadedFile.STORAGE_KEY_FIELDS[backend]
+        self.storage = get_storage_backend(backend)
+        self.fix_storage = fix_storage
+        self.fix_records = fix_records
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.on_orphan = on_orphan
+
+    def reconcile(self, prefix: str = '') -> ReconcileReport:
+        report = ReconcileReport()
+        cutoff = timezone.now() - self.min_age
+        orphan_keys, orphan_ids = [], []
+
+        objects = self._ordered(self.storage.list_files(prefix), lambda obj: obj.key, 'storage listing')
+        records = self._ordered(self._records(prefix), lambda rec: rec[0], 'database')
+
+        obj = next(objects, None)
+        record = next(records, None)
+        object_matched = False
+
+        while obj is not None or record is not None:
+            if record is None or (obj is not None and obj.key < record[0]):
+                report.scanned_objects += 1
+                if not object_matched:
+                    if self._is_recent(obj.modified_at, cutoff):
+                        report.skipped_recent += 1
+                    else:
+                        report.storage_orphans += 1
+                        self._report(report, 'storage', obj.key)
+                        orphan_keys.append(obj.key)
+                obj = next(objects, None)
+                object_matched = False
+            elif obj is None or record[0] < obj.key:
+                report.scanned_records += 1
+                key, record_id, created_at = record
+                if self._is_recent(created_at, cutoff):
+                    report.skipped_recent += 1
+                else:
+                    report.record_orphans += 1
+                    self._report(report, 'record', f"{record_id} {key}")
+                    orphan_ids.append(record_id)
+                record = next(records, None)
+            else:
+                # Several records may point at the same object; keep the object
+                # until the record keys move past it
+                report.scanned_records += 1
+                report.matched += 1
+                object_matched = True
+                record = next(records, None)
+
+            if len(orphan_keys) >= self.batch_size:
+                self._delete_objects(orphan_keys, report)
+            if len(orphan_ids) >= self.batch_size:
+                self._delete_records(orphan_ids, report)
+
+        self._delete_objects(orphan_keys, report)
+        self._delete_records(orphan_ids, report)
+        return report
+
+    def _records(self, prefix: str):
+        """Keys of hot and archived files, merged in key order"""
+        return heapq.merge(
+            self._keys(UploadedFile, self.key_field, prefix),
+            self._keys(ArchivedFile, 'storage_key', prefix),
+            key=lambda record: record[0],
+        )
+
+    def _keys(self, model, key_field: str, prefix: str):
+        key = F(key_field)
+        if connection.vendor == 'postgresql':
+            # Match the byte order of the storage listings regardless of the database collation
+            key = Collate(key, 'C')
+
+        return model.objects.filter(
+            storage_backend=self.backend,
+            **{f'{key_field}__isnull': False, f'{key_field}__startswith': prefix}
+        ).order_by(key).values_list(key_field, 'id', 'created_at').iterator(chunk_size=2000)
+
+    @staticmethod
+    def _ordered(items, get_key, source):
+        previous = None
+        for item in items:
+            key = get_key(item)
+            if previous is not None and key < previous:
+                raise ReconcileError(f"{source} is not sorted: {key!r} after {previous!r}")
+            previous = key
+            yield item
+
+    @staticmethod
+    def _is_recent(timestamp: Optional[datetime], cutoff: datetime) -> bool:
+        return timestamp is None or timestamp > cutoff
+
+    def _report(self, report: ReconcileReport, kind: str, description: str):
+        if len(report.samples) < 100:
+            report.samples.append(f"{kind}: {description}")
+        if self.on_orphan:
+            self.on_orphan(kind, description)
+
+    def _delete_objects(self, keys: List[str], report: ReconcileReport):
+        if keys and self.fix_storage:
+            report.deleted_objects += len(self.storage.delete_keys(list(keys)))
+        keys.clear()
+
+    def _delete_records(self, ids: List, report: ReconcileReport):
+        if ids and self.fix_records:
+            report.deleted_records += UploadedFile.objects.filter(id__in=ids).delete()[0]
+            report.deleted_records += ArchivedFile.objects.filter(id__in=ids).delete()[0]
+        ids.clear()
@@ -0,0 +1,147 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+
+from file_upload.metrics import metrics
+from file_upload.models import UploadedFile
+from file_upload.utils import get_storage_backend, get_tenant
+
+
+class RetentionService:
+    """Retention policies and the batched purge of expired files"""
+
+    PROGRESS_KEY = 'file_upload:purge:progress'
+
+    @staticmethod
+    def expiry_for(file_type: str, request_id: Optional[str] = None, ttl: Optional[int] = None) -> Optional[datetime]:
+        """
+        Expiry timestamp for a new upload
+
+        An explicit `ttl` wins over the tenant policy, which wins over the
+        file type policy and then the default TTL. Returns None if the file
+        never expires.
+        """
+        if ttl is None:
+            ttl = getattr(settings, 'FILE_UPLOAD_RETENTION_TENANT_TTLS', {}).get(get_tenant(request_id))
+        if ttl is None:
+            ttl = getattr(settings, 'FILE_UPLOAD_RETENTION_FILE_TYPE_TTLS', {}).get(file_type)
+        if ttl is None:
+            ttl = getattr(settings, 'FILE_UPLOAD_RETENTION_DEFAULT_TTL', None)
+        if ttl is None:
+            return None
+        return timezone.now() + timedelta(seconds=ttl)
+
+    @classmethod
+    def purge(
+            cls,
+            batch_size: Optional[int] = None,
+            max_batches: Optional[int] = None,
+            dry_run: bool = False,
+            on_batch: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Delete expired files in bounded batches
+
+        Each batch deletes the storage objects through the backends' bulk
+        delete APIs, then the rows whose objects are gone. Rows whose object
+        could not be deleted are kept for the next run, and the keyset cursor
+        moves past them so one bad object cannot stall the purge. Between
+        batches the worker sleeps FILE_UPLOAD_PURGE_YIELD_RATIO times the
+        duration of the batch, to leave capacity to foreground traffic.
+        """
+        batch_size = batch_size or getattr(settings, 'FILE_UPLOAD_PURGE_BATCH_SIZE', 500)
+        yield_ratio = getattr(settings, 'FILE_UPLOAD_PURGE_YIELD_RATIO', 1.0)
+        lifecycle_expiry = getattr(settings, 'FILE_UPLOAD_S3_LIFECYCLE_EXPIRY', False)
+        now = timezone.now()
+
+        progress = {
+            'started_at': now.isoformat(),
+            'updated_at': now.isoformat(),
+            'finished': False,
+            'batches': 0,
+            'deleted_records': 0,
+            'deleted_objects': 0,
+            'failed_objects': 0,
+        }
+        cursor = None
+
+        while max_batches is None or progress['batches'] < max_batches:
+            started = time.monotonic()
+
+            queryset = UploadedFile.objects.filter(expires_at__lte=now)
+            if cursor:
+                queryset = queryset.filter(
+                    Q(expires_at__gt=cursor[0]) | Q(expires_at=cursor[0], id__gt=cursor[1])
+                )
+            batch = list(
+                queryset.order_by('expires_at', 'id').only(
+                    'id', 'expires_at', 'storage_backend', *UploadedFile.STORAGE_KEY_FIELDS.values()
+                )[:batch_size]
+            )
+            if not batch:
+                progress['finished'] = True
+                break
+            cursor = (batch[-1].expires_at, batch[-1].id)
+
+            by_backend = defaultdict(list)
+            for uploaded_file in batch:
+                by_backend[uploaded_file.storage_backend].append(uploaded_file)
+
+            purgeable_ids = []
+            for backend, files in by_backend.items():
+                key_field = UploadedFile.STORAGE_KEY_FIELDS.get(backend)
+                keys = [getattr(f, key_field) for f in files if key_field and getattr(f, key_field)]
+
+                if dry_run or not keys or (backend == 's3' and lifecycle_expiry):
+                    gone = set(keys)
+                else:
+                    try:
+                        gone = set(get_storage_backend(backend).delete_keys(keys))
+                    except Exception as e:
+                        print(f"Purge of {backend} objects failed: {str(e)}")
+                        gone = set()
+                    progress['deleted_objects'] += len(gone)
+
+                for uploaded_file in files:
+                    key = getattr(uploaded_file, key_field) if key_field else None
+                    if not key or key in gone:
+                        purgeable_ids.append(uploaded_file.id)
+                    else:
+                        progress['failed_objects'] += 1
+
+            if not dry_run and purgeable_ids:
+                UploadedFile.objects.filter(id__in=purgeable_ids).delete()
+            progress['deleted_records'] += len(purgeable_ids)
+            progress['batches'] += 1
+            progress['updated_at'] = timezone.now().isoformat()
+
+            if not dry_run:
+                cls._record_progress(progress)
+                metrics.inc('file_upload_purged_records_total', len(purgeable_ids))
+            if on_batch:
+                on_batch(progress)
+
+            time.sleep((time.monotonic() - started) * yield_ratio)
+
+        if not dry_run:
+            cls._record_progress(progress)
+        return progress
+
+    @classmethod
+    def progress(cls) -> Optional[Dict[str, Any]]:
+        """Progress of the last (or running) purge"""
+        return cls._cache().get(cls.PROGRESS_KEY)
+
+    @classmethod
+    def _record_progress(cls, progress: Dict[str, Any]):
+        cls._cache().set(cls.PROGRESS_KEY, dict(progress), None)
+
+    @staticmethod
+    def _cache():
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
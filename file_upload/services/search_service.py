@@ -0,0 +1,114 @@
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+
+from file_upload.models import UploadedFile
+
+TABLE = 'file_upload_uploadedfile'
+FTS_TABLE = 'file_upload_uploadedfile_fts'
+
+SQLITE_INDEX_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    # External content table over the implicit rowid: the index stores no copy of the text
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        search_text, content='{TABLE}', content_rowid='rowid', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.rowid, new.search_text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.rowid, old.search_text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_text ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.rowid, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.rowid, new.search_text);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_search_trgm ON {TABLE} USING gin (search_text gin_trgm_ops)",
+]
+
+
+def install_search_index(schema_editor):
+    """
+    Create (or re-create) the search index for the database engine
+
+    On SQLite, migrations that alter UploadedFile may rebuild its table, which
+    drops the FTS triggers and renumbers rowids; such migrations must call
+    this again. It is idempotent and rebuilds the index contents.
+    """
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_INDEX_SQL, 'postgresql': POSTGRES_INDEX_SQL}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def remove_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_INDEX_SQL[:4]:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {TABLE}_search_trgm")
+
+
+class SearchService:
+    """
+    Ranked search over `original_filename` and the indexed metadata keys
+
+    SQLite uses an FTS5 trigram index and Postgres a pg_trgm GIN index, both of
+    which serve substring and prefix matches without scanning the table. Other
+    engines fall back to an unindexed `icontains`.
+    """
+
+    MODES = ('substring', 'prefix')
+
+    @staticmethod
+    def search(query: str, queryset: QuerySet = None, mode: str = 'substring') -> QuerySet:
+        queryset = UploadedFile.objects.all() if queryset is None else queryset
+        query = query.strip()
+        if not query:
+            return queryset
+
+        vendor = connection.vendor
+        if vendor == 'sqlite' and len(query) >= 3:
+            queryset = SearchService._sqlite_search(queryset, query)
+        elif vendor == 'postgresql':
+            # ILIKE rather than icontains, whose UPPER() cannot use the trigram index
+            pattern = '%%%s%%' % query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            queryset = queryset.extra(where=[f'{TABLE}.search_text ILIKE %s'], params=[pattern]).annotate(
+                search_rank=RawSQL(f'-similarity({TABLE}.search_text, %s)', (query,))
+            )
+        else:
+            queryset = queryset.filter(search_text__icontains=query).annotate(
+                search_rank=RawSQL('0', ())
+            )
+
+        if mode == 'prefix':
+            queryset = queryset.filter(original_filename__istartswith=query)
+
+        return queryset.order_by('search_rank', '-created_at')
+
+    @staticmethod
+    def _sqlite_search(queryset: QuerySet, query: str) -> QuerySet:
+        # A quoted phrase: trigram matching makes it a substring search
+        match = '"%s"' % query.replace('"', '""')
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT u.id FROM {FTS_TABLE} f JOIN {TABLE} u ON u.rowid = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s",
+                (match,)
+            )
+        ).annotate(
+            # bm25 rank, lower is better
+            search_rank=RawSQL(
+                f"SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {TABLE}.rowid",
+                (match,)
+            )
+        )
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import UTC, date
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from file_upload.models import StorageUsage, UploadedFile
+from file_upload.utils import get_tenant
+
+
+class UsageBucket(NamedTuple):
+    tenant: str
+    storage_backend: str
+    file_type: str
+    day: date
+
+
+class UsageService:
+    """Incremental storage usage statistics, see StorageUsage"""
+
+    FIELDS = ('request_id', 'storage_backend', 'file_type', 'file_size', 'created_at')
+
+    @staticmethod
+    def bucket(values: Dict[str, Any]) -> Optional[UsageBucket]:
+        if any(values.get(field) is None for field in ('storage_backend', 'file_type', 'created_at')):
+            return None
+        return UsageBucket(
+            get_tenant(values.get('request_id')),
+            values['storage_backend'],
+            values['file_type'],
+            values['created_at'].astimezone(UTC).date(),
+        )
+
+    @staticmethod
+    def current_values(instance: UploadedFile) -> Optional[Dict[str, Any]]:
+        """Usage fields of an instance, or None if some of them were not loaded"""
+        if instance.get_deferred_fields() & set(UsageService.FIELDS):
+            return None
+        return {field: getattr(instance, field) for field in UsageService.FIELDS}
+
+    @staticmethod
+    def loaded_values(instance: UploadedFile) -> Optional[Dict[str, Any]]:
+        """Usage fields as last loaded from or saved to the database"""
+        loaded = getattr(instance, '_loaded_values', None)
+        if loaded is None or not set(UsageService.FIELDS) <= loaded.keys():
+            return None
+        return {field: loaded[field] for field in UsageService.FIELDS}
+
+    @staticmethod
+    def record(values: Dict[str, Any], sign: int):
+        """Add (sign=1) or remove (sign=-1) one file from its usage bucket"""
+        bucket = UsageService.bucket(values)
+        if bucket is not None:
+            UsageService._add(bucket, sign, sign * (values.get('file_size') or 0))
+
+    @staticmethod
+    def record_many(instances: Iterable[UploadedFile]):
+        """Add files inserted without signals (bulk_create), one update per bucket"""
+        deltas = defaultdict(lambda: [0, 0])
+        for instance in instances:
+            bucket = UsageService.bucket(UsageService.current_values(instance))
+            if bucket is not None:
+                deltas[bucket][0] += 1
+                deltas[bucket][1] += instance.file_size or 0
+        for bucket, (count_delta, bytes_delta) in deltas.items():
+            UsageService._add(bucket, count_delta, bytes_delta)
+
+    @staticmethod
+    def _add(bucket: UsageBucket, count_delta: int, bytes_delta: int):
+        updated = StorageUsage.objects.filter(**bucket._asdict()).update(
+            file_count=F('file_count') + count_delta,
+            total_bytes=F('total_bytes') + bytes_delta,
+        )
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                StorageUsage.objects.create(**bucket._asdict(), file_count=count_delta, total_bytes=bytes_delta)
+        except IntegrityError:
+            # A concurrent transaction created the bucket first
+            StorageUsage.objects.filter(**bucket._asdict()).update(
+                file_count=F('file_count') + count_delta,
+                total_bytes=F('total_bytes') + bytes_delta,
+            )
+
+    @staticmethod
+    def totals(
+            tenant: Optional[str] = None,
+            storage_backend: Optional[str] = None,
+            file_type: Optional[str] = None,
+            since: Optional[date] = None,
+            until: Optional[date] = None
+    ) -> Dict[str, Any]:
+        # Buckets emptied by deletes are kept rather than removed under concurrent updates
+        queryset = StorageUsage.objects.exclude(file_count=0)
+        if tenant is not None:
+            queryset = queryset.filter(tenant=tenant)
+        if storage_backend:
+            queryset = queryset.filter(storage_backend=storage_backend)
+        if file_type:
+            queryset = queryset.filter(file_type=file_type)
+        if since:
+            queryset = queryset.filter(day__gte=since)
+        if until:
+            queryset = queryset.filter(day__lte=until)
+
+        totals = queryset.aggregate(file_count=Sum('file_count'), total_bytes=Sum('total_bytes'))
+        result = {
+            'file_count': totals['file_count'] or 0,
+            'total_bytes': totals['total_bytes'] or 0,
+        }
+        for group in ('storage_backend', 'file_type'):
+            result[f'by_{group}'] = {
+                row[group]: {'file_count': row['file_count'], 'total_bytes': row['total_bytes']}
+                for row in queryset.order_by().values(group).annotate(
+                    file_count=Sum('file_count'), total_bytes=Sum('total_bytes')
+                )
+            }
+        return result
+
+    @staticmethod
+    def compute() -> Dict[UsageBucket, list]:
+        """Recompute usage from UploadedFile; memory grows with the number of buckets, not files"""
+        buckets = defaultdict(lambda: [0, 0])
+        for values in UploadedFile.objects.order_by().values(*UsageService.FIELDS).iterator(chunk_size=5000):
+            bucket = UsageService.bucket(values)
+            buckets[bucket][0] += 1
+            buckets[bucket][1] += values['file_size']
+        return buckets
+
+    @staticmethod
+    def drift(computed: Dict[UsageBucket, list]) -> Dict[UsageBucket, Dict[str, int]]:
+        """Buckets whose stored totals differ from `computed`"""
+        stored = {
+            UsageBucket(row.tenant, row.storage_backend, row.file_type, row.day): [row.file_count, row.total_bytes]
+            for row in StorageUsage.objects.iterator()
+        }
+        drift = {}
+        for bucket in computed.keys() | stored.keys():
+            expected = computed.get(bucket, [0, 0])
+            actual = stored.get(bucket, [0, 0])
+            if expected != actual:
+                drift[bucket] = {
+                    'file_count': actual[0] - expected[0],
+                    'total_bytes': actual[1] - expected[1],
+                }
+        return drift
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(computed: Dict[UsageBucket, list]):
+        StorageUsage.objects.all().delete()
+        StorageUsage.objects.bulk_create(
+            [
+                StorageUsage(**bucket._asdict(), file_count=count, total_bytes=size)
+                for bucket, (count, size) in computed.items()
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from file_upload.models import ArchivedFile, FileEvent, UploadedFile
+from file_upload.services.cache_service import FileCacheService
+from file_upload.services.cloudinary_service import CloudinaryNotificationService
+from file_upload.services.event_service import EventService
+from file_upload.services.usage_service import UsageService
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_file_cache(sender, instance, **kwargs):
+    FileCacheService.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=UploadedFile)
+def track_usage_on_save(sender, instance, created, **kwargs):
+    current = UsageService.current_values(instance)
+    previous = None if created else UsageService.loaded_values(instance)
+
+    if current is None or (previous is None and not created):
+        # Partially loaded instance; rebuildusage picks up any change
+        return
+
+    if previous != current:
+        if previous is not None:
+            UsageService.record(previous, -1)
+        UsageService.record(current, 1)
+
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **current}
+
+
+@receiver(post_delete, sender=UploadedFile)
+def track_usage_on_delete(sender, instance, **kwargs):
+    values = UsageService.loaded_values(instance) or UsageService.current_values(instance)
+    if values is not None:
+        UsageService.record(values, -1)
+
+
+@receiver(post_save, sender=UploadedFile)
+def record_created_event(sender, instance, created, **kwargs):
+    if created:
+        EventService.record(FileEvent.FILE_CREATED, instance)
+
+
+@receiver(post_save, sender=UploadedFile)
+def apply_early_cloudinary_notifications(sender, instance, created, **kwargs):
+    # Cloudinary may have reported an asynchronous upload before its row was inserted
+    if created and CloudinaryNotificationService.awaits_notifications(instance):
+        public_id = instance.cloudinary_public_id
+        transaction.on_commit(lambda: CloudinaryNotificationService.apply_pending([public_id]))
+
+
+@receiver(post_delete, sender=UploadedFile)
+def record_deleted_event(sender, instance, **kwargs):
+    EventService.record(FileEvent.FILE_DELETED, instance)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def forget_archived_file(sender, instance, **kwargs):
+    # Also for instances cached before the file was archived
+    ArchivedFile.objects.filter(pk=instance.pk).delete()
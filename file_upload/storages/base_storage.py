@@ -1,10 +1,40 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional
+
+
+class StorageError(Exception):
+    """
+    Raised by storage backends when a call to the provider fails
+
+    Args:
+        message: Human readable description
+        retryable: Whether the failure is transient (throttling, timeouts,
+            5xx responses) and the call may succeed if repeated
+    """
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class StoredObject(NamedTuple):
+    """An object found in a storage backend listing"""
+
+    key: str
+    size: int
+    modified_at: Optional[datetime]
 
 
 class BaseStorage(ABC):
     """Abstract base class for all storage backends"""
 
+    name = None
+
+    # Whether upload_file can consume a non-seekable stream chunk by chunk;
+    # otherwise callers spool the content to a temporary file first
+    accepts_streams = False
+
     @abstractmethod
     def upload_file(self, file, filename: str, file_type: str, **kwargs) -> Dict[str, Any]:
         """
@@ -51,3 +81,65 @@ class BaseStorage(ABC):
             str: URL to access the file
         """
         pass
+
+    def open_file(self, uploaded_file):
+        """
+        Open a file for reading from the storage backend
+
+        Args:
+            uploaded_file: UploadedFile instance
+
+        Returns:
+            A binary file-like object; the caller is responsible for closing it
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support reading files")
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        """
+        Read part of a file without downloading the rest
+
+        Args:
+            uploaded_file: UploadedFile instance
+            start: Offset of the first byte
+            length: Number of bytes to read; fewer are returned at the end of the file
+
+        Returns:
+            bytes: The requested range
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support range reads")
+
+    def probe(self) -> Dict[str, Any]:
+        """
+        Run a cheap operation against the backend to check it is reachable
+
+        Returns:
+            Dict with backend specific details about the probe
+
+        Raises:
+            StorageError: If the backend is not usable
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support health probes")
+
+    def list_files(self, prefix: str = '') -> Iterator[StoredObject]:
+        """
+        Stream the objects stored in the backend
+
+        Args:
+            prefix: Only list keys starting with this prefix
+
+        Returns:
+            Iterator of StoredObject, in ascending order of key (by code point)
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support listing files")
+
+    def delete_keys(self, keys: List[str]) -> List[str]:
+        """
+        Delete objects by storage key, using the provider's bulk API where available
+
+        Args:
+            keys: Storage keys (the `storage_id` returned by upload_file)
+
+        Returns:
+            List of keys that no longer exist in the backend (deleted, or already missing)
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support deleting by key")
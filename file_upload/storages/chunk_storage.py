@@ -0,0 +1,450 @@
+import bisect
+import hashlib
+import io
+import json
+import math
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from django.conf import settings
+
+from file_upload.signing import sign_url
+from file_upload.storages.base_storage import BaseStorage, StorageError, StoredObject
+
+CHUNK_PREFIX = 'chunks/'
+MANIFEST_PREFIX = 'manifests/'
+
+MASK64 = (1 << 64) - 1
+
+# Gear table of the rolling hash; derived deterministically so that every
+# process cuts the same content at the same boundaries
+GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:8], 'big') for value in range(256)]
+
+
+class ContentDefinedChunker:
+    """
+    Splits a stream at content-defined boundaries (FastCDC)
+
+    A gear hash rolls over the bytes and a chunk ends where its top bits
+    are zero, so an insertion or deletion only changes the chunks around
+    it and the rest of the file still deduplicates against earlier
+    versions. A stricter mask before `avg_size` and a looser one after it
+    keep chunk sizes close to the average.
+    """
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError('Chunk sizes must satisfy 0 < min_size <= avg_size <= max_size')
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = max(int(round(math.log2(avg_size))), 2)
+        # Top bits: each depends on the last 64 bytes, the effective window
+        self.mask_small = ((1 << (bits + 1)) - 1) << (64 - bits - 1)
+        self.mask_large = ((1 << (bits - 1)) - 1) << (64 - bits + 1)
+
+    def split(self, stream, read_size: int = 1024 * 1024) -> Iterator[bytes]:
+        buffer = bytearray()
+        while True:
+            data = stream.read(read_size)
+            if data:
+                buffer += data
+            # A boundary can only be decided once max_size bytes (or the end) are in
+            while len(buffer) >= self.max_size or (not data and buffer):
+                cut = self._boundary(buffer)
+                yield bytes(buffer[:cut])
+                del buffer[:cut]
+            if not data:
+                return
+
+    def _boundary(self, data: bytearray) -> int:
+        length = min(len(data), self.max_size)
+        if length <= self.min_size:
+            return length
+
+        gear, mask_small, mask_large = GEAR, self.mask_small, self.mask_large
+        fingerprint = 0
+        normal = min(self.avg_size, length)
+        view = memoryview(data)
+        for offset, byte in enumerate(view[self.min_size:normal], self.min_size):
+            fingerprint = ((fingerprint << 1) + gear[byte]) & MASK64
+            if not fingerprint & mask_small:
+                return offset + 1
+        for offset, byte in enumerate(view[normal:length], normal):
+            fingerprint = ((fingerprint << 1) + gear[byte]) & MASK64
+            if not fingerprint & mask_large:
+                return offset + 1
+        return length
+
+
+class LocalBlobStore:
+    """Chunks and manifests as files under FILE_UPLOAD_CHUNK_STORE_ROOT"""
+
+    def __init__(self):
+        self.root = getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_ROOT', None) or \
+            os.path.join(settings.BASE_DIR, 'chunkstore')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see a partial chunk
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.tmp-', delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def touch(self, key: str):
+        os.utime(self._path(key))
+
+    def delete(self, keys: List[str]) -> List[str]:
+        deleted = []
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            deleted.append(key)
+        return deleted
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        base = self._path(prefix.rstrip('/'))
+        for directory, subdirectories, filenames in os.walk(base):
+            subdirectories.sort()
+            relative = os.path.relpath(directory, self.root).replace(os.sep, '/')
+            for filename in sorted(filenames):
+                if filename.startswith('.tmp-'):
+                    continue
+                stat = os.stat(os.path.join(directory, filename))
+                yield StoredObject(f"{relative}/{filename}", stat.st_size, datetime.fromtimestamp(stat.st_mtime, UTC))
+
+    def probe(self) -> Dict[str, Any]:
+        os.makedirs(self.root, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix='.tmp-probe-') as probe_file:
+            probe_file.write(b'ok')
+        return {'root': self.root}
+
+
+class S3BlobStore:
+    """Chunks and manifests under FILE_UPLOAD_CHUNK_STORE_PREFIX in the S3 bucket"""
+
+    def __init__(self):
+        from file_upload.storages.s3_storage import S3Storage
+
+        self.s3 = S3Storage()
+        self.prefix = getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_PREFIX', 'chunkstore/')
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.s3.s3_client.head_object(Bucket=self.s3.bucket_name, Key=f"{self.prefix}{key}")
+            return True
+        except ClientError as e:
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+                return False
+            raise
+
+    def put(self, key: str, data: bytes):
+        self.s3.s3_client.put_object(Bucket=self.s3.bucket_name, Key=f"{self.prefix}{key}", Body=data)
+
+    def get(self, key: str) -> bytes:
+        return self.s3.s3_client.get_object(Bucket=self.s3.bucket_name, Key=f"{self.prefix}{key}")['Body'].read()
+
+    def touch(self, key: str):
+        # Copying an object onto itself refreshes LastModified without transferring it
+        full_key = f"{self.prefix}{key}"
+        self.s3.s3_client.copy_object(
+            Bucket=self.s3.bucket_name, Key=full_key, MetadataDirective='REPLACE',
+            CopySource={'Bucket': self.s3.bucket_name, 'Key': full_key}
+        )
+
+    def delete(self, keys: List[str]) -> List[str]:
+        deleted = self.s3.delete_keys([f"{self.prefix}{key}" for key in keys])
+        return [key[len(self.prefix):] for key in deleted]
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        for obj in self.s3.list_files(f"{self.prefix}{prefix}"):
+            yield obj._replace(key=obj.key[len(self.prefix):])
+
+    def probe(self) -> Dict[str, Any]:
+        return self.s3.probe()
+
+
+class ChunkReader(io.RawIOBase):
+    """Reassembles a file from its manifest, fetching one chunk ahead of the reader"""
+
+    def __init__(self, storage: 'ChunkStorage', manifest: Dict[str, Any], start: int = 0):
+        super().__init__()
+        self.storage = storage
+        self.chunks = manifest['chunks']
+        self.offsets = _offsets(self.chunks)
+        self.index = max(bisect.bisect_right(self.offsets, start) - 1, 0)
+        self.skip = start - self.offsets[self.index] if self.chunks else 0
+        self.current = b''
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.next = self._fetch(self.index)
+
+    def _fetch(self, index: int):
+        if index >= len(self.chunks):
+            return None
+        return self.executor.submit(self.storage.read_chunk, self.chunks[index][0])
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.current:
+            if self.next is None:
+                return 0
+            self.current = self.next.result()[self.skip:]
+            self.skip = 0
+            self.index += 1
+            self.next = self._fetch(self.index)
+        size = min(len(buffer), len(self.current))
+        buffer[:size] = self.current[:size]
+        self.current = self.current[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        super().close()
+
+
+class ChunkStorage(BaseStorage):
+    """
+    Content-addressed storage of deduplicated chunks
+
+    Uploads are split with ContentDefinedChunker; each unique chunk is
+    stored once under its SHA-256, locally or in S3
+    (FILE_UPLOAD_CHUNK_STORE_BACKEND), and the file is a JSON manifest of
+    chunk digests, which is its storage key. A new version of a file only
+    writes the chunks that changed. Deleting a file deletes its manifest;
+    `gcchunks` then removes the chunks no manifest references.
+    """
+
+    name = 'chunks'
+    accepts_streams = True
+
+    def __init__(self):
+        backend = getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_BACKEND', 'local')
+        self.blobs = S3BlobStore() if backend == 's3' else LocalBlobStore()
+        self.chunker = ContentDefinedChunker(
+            getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_MIN_SIZE', 256 * 1024),
+            getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_AVG_SIZE', 1024 * 1024),
+            getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_MAX_SIZE', 4 * 1024 * 1024),
+        )
+        self.workers = getattr(settings, 'FILE_UPLOAD_CHUNK_STORE_WORKERS', 4)
+
+    @staticmethod
+    def _chunk_key(digest: str) -> str:
+        return f"{CHUNK_PREFIX}{digest[:2]}/{digest}"
+
+    @staticmethod
+    def _manifest_key(key: str) -> str:
+        return f"{MANIFEST_PREFIX}{key}.json"
+
+    def upload_file(self, file, filename: str, file_type: str, **kwargs) -> Dict[str, Any]:
+        """
+        Store the new chunks of `file` and its manifest
+
+        Chunks of the `previous` version (an UploadedFile in this backend)
+        are known to exist and are only touched; other chunks are checked
+        and written. Up to FILE_UPLOAD_CHUNK_STORE_WORKERS requests are in
+        flight. Every chunk is touched or written before the manifest, so a
+        concurrent `gcchunks` does not remove them while no manifest
+        references them, even if the previous version is deleted meanwhile.
+        """
+        key = f"{file_type}s/{uuid.uuid4()}{os.path.splitext(filename)[1]}"
+        previous = self._previous_digests(kwargs.get('previous'))
+        known = set()
+        file_hash = hashlib.sha256()
+        chunks, pending = [], []
+        stats = {'chunks': 0, 'new_chunks': 0, 'new_bytes': 0}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for data in self.chunker.split(file):
+                    digest = hashlib.sha256(data).hexdigest()
+                    file_hash.update(data)
+                    chunks.append([digest, len(data)])
+                    if digest not in known:
+                        known.add(digest)
+                        store = self._reuse_chunk if digest in previous else self._store_chunk
+                        pending.append(executor.submit(store, digest, data))
+                    # Bounds the chunks held in memory by in-flight writes
+                    while len(pending) >= self.workers * 2:
+                        self._collect(pending.pop(0), stats)
+                for future in pending:
+                    self._collect(future, stats)
+
+            manifest = {
+                'size': sum(size for _, size in chunks),
+                'sha256': file_hash.hexdigest(),
+                'chunks': chunks,
+            }
+            self.blobs.put(self._manifest_key(key), json.dumps(manifest, separators=(',', ':')).encode())
+        except StorageError:
+            raise
+        except Exception as e:
+            raise StorageError(f"Chunk store upload failed: {str(e)}", retryable=True) from e
+
+        stats['chunks'] = len(chunks)
+        url = sign_url(self.name, key)
+        return {
+            'public_url': url,
+            'secure_url': url,
+            'storage_id': key,
+            'metadata': {'chunk_store': {**stats, 'sha256': manifest['sha256']}},
+        }
+
+    def _store_chunk(self, digest: str, data: bytes) -> int:
+        chunk_key = self._chunk_key(digest)
+        if self.blobs.exists(chunk_key):
+            self.blobs.touch(chunk_key)
+            return 0
+        self.blobs.put(chunk_key, data)
+        return len(data)
+
+    def _reuse_chunk(self, digest: str, data: bytes) -> int:
+        """Refresh a chunk of the previous version, writing it again if it was removed since"""
+        try:
+            self.blobs.touch(self._chunk_key(digest))
+            return 0
+        except Exception:
+            return self._store_chunk(digest, data)
+
+    @staticmethod
+    def _collect(future, stats: Dict[str, int]):
+        written = future.result()
+        if written:
+            stats['new_chunks'] += 1
+            stats['new_bytes'] += written
+
+    def _previous_digests(self, previous) -> Set[str]:
+        if previous is None or previous.storage_backend != self.name or not previous.manifest_key:
+            return set()
+        try:
+            return {digest for digest, _ in self.read_manifest(previous.manifest_key)['chunks']}
+        except StorageError as e:
+            print(f"Chunk store could not read the previous version's manifest: {str(e)}")
+            return set()
+
+    def read_manifest(self, key: str) -> Dict[str, Any]:
+        try:
+            return json.loads(self.blobs.get(self._manifest_key(key)))
+        except Exception as e:
+            raise StorageError(f"Chunk store manifest read failed: {str(e)}", retryable=not isinstance(e, (FileNotFoundError, ValueError))) from e
+
+    def read_chunk(self, digest: str) -> bytes:
+        try:
+            data = self.blobs.get(self._chunk_key(digest))
+        except Exception as e:
+            raise StorageError(f"Chunk store chunk read failed: {str(e)}", retryable=not isinstance(e, FileNotFoundError)) from e
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise StorageError(f"Chunk {digest} is corrupt")
+        return data
+
+    def delete_file(self, uploaded_file) -> bool:
+        if not uploaded_file.manifest_key:
+            return False
+        return bool(self.delete_keys([uploaded_file.manifest_key]))
+
+    def get_file_url(self, uploaded_file, **kwargs) -> str:
+        if not uploaded_file.manifest_key:
+            return uploaded_file.public_url
+        return sign_url(self.name, uploaded_file.manifest_key, kwargs.get('expires_in'))
+
+    def open_file(self, uploaded_file):
+        return ChunkReader(self, self.read_manifest(uploaded_file.manifest_key))
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        manifest = self.read_manifest(uploaded_file.manifest_key)
+        offsets = _offsets(manifest['chunks'])
+        first = max(bisect.bisect_right(offsets, start) - 1, 0)
+        data = bytearray()
+        for index in range(first, len(manifest['chunks'])):
+            if offsets[index] >= start + length:
+                break
+            data += self.read_chunk(manifest['chunks'][index][0])
+        skip = start - offsets[first] if manifest['chunks'] else 0
+        return bytes(data[skip:skip + length])
+
+    def probe(self) -> Dict[str, Any]:
+        try:
+            return self.blobs.probe()
+        except Exception as e:
+            raise StorageError(f"Chunk store probe failed: {str(e)}", retryable=True) from e
+
+    def list_files(self, prefix: str = '') -> Iterator[StoredObject]:
+        try:
+            for obj in self.blobs.list(f"{MANIFEST_PREFIX}{prefix}"):
+                if obj.key.endswith('.json'):
+                    yield obj._replace(key=obj.key[len(MANIFEST_PREFIX):-len('.json')])
+        except Exception as e:
+            raise StorageError(f"Chunk store listing failed: {str(e)}", retryable=True) from e
+
+    def delete_keys(self, keys: List[str]) -> List[str]:
+        try:
+            deleted = self.blobs.delete([self._manifest_key(key) for key in keys])
+        except Exception as e:
+            raise StorageError(f"Chunk store delete failed: {str(e)}", retryable=True) from e
+        return [key[len(MANIFEST_PREFIX):-len('.json')] for key in deleted]
+
+    def collect_garbage(self, grace_seconds: float, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Delete chunks that no manifest references
+
+        Chunks modified within `grace_seconds` are kept: they may belong to
+        an upload whose manifest is not written yet.
+        """
+        referenced = set()
+        manifests = 0
+        for obj in self.blobs.list(MANIFEST_PREFIX):
+            manifest = json.loads(self.blobs.get(obj.key))
+            referenced.update(bytes.fromhex(digest) for digest, _ in manifest['chunks'])
+            manifests += 1
+
+        cutoff = datetime.now(UTC).timestamp() - grace_seconds
+        result = {'manifests': manifests, 'chunks': 0, 'deleted_chunks': 0, 'deleted_bytes': 0}
+        batch = []
+        for obj in self.blobs.list(CHUNK_PREFIX):
+            result['chunks'] += 1
+            digest = obj.key.rsplit('/', 1)[-1]
+            if bytes.fromhex(digest) in referenced:
+                continue
+            if obj.modified_at is not None and obj.modified_at.timestamp() > cutoff:
+                continue
+            result['deleted_chunks'] += 1
+            result['deleted_bytes'] += obj.size
+            batch.append(obj.key)
+            if len(batch) >= 1000:
+                self._delete_chunks(batch, dry_run)
+                batch = []
+        self._delete_chunks(batch, dry_run)
+        return result
+
+    def _delete_chunks(self, keys: Iterable[str], dry_run: bool):
+        if keys and not dry_run:
+            self.blobs.delete(list(keys))
+
+
+def _offsets(chunks: List[List[Any]]) -> List[int]:
+    offsets, position = [], 0
+    for _, size in chunks:
+        offsets.append(position)
+        position += size
+    return offsets
@@ -1,13 +1,32 @@
 import cloudinary
+import cloudinary.exceptions
 import cloudinary.uploader
 import cloudinary.api
-from typing import Dict, Any
+import cloudinary.search
+import cloudinary.utils
+import requests
+from datetime import datetime
+from django.conf import settings
+from typing import Dict, Any, Iterator, List
 import os
 
-from file_upload.storages.base_storage import BaseStorage
+from file_upload.storages.base_storage import BaseStorage, StorageError, StoredObject
+
+RESOURCE_TYPES = ['image', 'video', 'raw']
+
+# Cloudinary resource type per file type; async uploads cannot use 'auto'
+# because the delivery URL is built before Cloudinary has seen the file
+FILE_TYPE_RESOURCE_TYPES = {'image': 'image', 'video': 'video', 'audio': 'video'}
 
 
 class CloudinaryStorage(BaseStorage):
+    name = 'cloudinary'
+
+    # metadata['processing'] of asynchronous uploads
+    PROCESSING_PENDING = 'pending'
+    PROCESSING_COMPLETE = 'complete'
+    PROCESSING_FAILED = 'failed'
+
     def upload_file(self, file, filename: str, file_type: str, **kwargs) -> Dict[str, Any]:
         try:
             name_without_ext = os.path.splitext(filename)[0]
@@ -28,6 +47,9 @@ class CloudinaryStorage(BaseStorage):
                     ]
                 })
 
+            if self._uploads_async(file):
+                return self._upload_async(file, file_type, upload_params)
+
             result = cloudinary.uploader.upload(file, **upload_params)
 
             return {
@@ -45,7 +67,51 @@ class CloudinaryStorage(BaseStorage):
             }
 
         except Exception as e:
-            raise Exception(f"Cloudinary upload failed: {str(e)}")
+            raise StorageError(f"Cloudinary upload failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    @staticmethod
+    def _uploads_async(file) -> bool:
+        if not getattr(settings, 'FILE_UPLOAD_CLOUDINARY_ASYNC', False):
+            return False
+        if not getattr(settings, 'FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL', ''):
+            return False
+        return (getattr(file, 'size', None) or 0) >= getattr(settings, 'FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE', 0)
+
+    def _upload_async(self, file, file_type: str, upload_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Upload without waiting for Cloudinary to process the file
+
+        Cloudinary answers as soon as it has the bytes and reports the
+        processed resource, then each eager transformation, to the
+        notification URL, where CloudinaryNotificationService records them.
+        """
+        notification_url = settings.FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL
+        resource_type = FILE_TYPE_RESOURCE_TYPES.get(file_type, 'raw')
+        params = {
+            **upload_params,
+            'resource_type': resource_type,
+            'async': True,
+            'notification_url': notification_url,
+        }
+        eager = getattr(settings, 'FILE_UPLOAD_CLOUDINARY_EAGER', {}).get(file_type)
+        if eager:
+            params.update({'eager': eager, 'eager_async': True, 'eager_notification_url': notification_url})
+
+        result = cloudinary.uploader.upload(file, **params)
+        public_id = result.get('public_id') or upload_params['public_id']
+        url, _ = cloudinary.utils.cloudinary_url(public_id, resource_type=resource_type, secure=True)
+
+        return {
+            'public_url': url,
+            'secure_url': url,
+            'storage_id': public_id,
+            'metadata': {
+                'resource_type': resource_type,
+                'processing': self.PROCESSING_PENDING,
+                'eager_pending': bool(eager),
+                'cloudinary_batch_id': result.get('batch_id'),
+            }
+        }
 
     def delete_file(self, uploaded_file) -> bool:
         try:
@@ -59,6 +125,8 @@ class CloudinaryStorage(BaseStorage):
             return result.get('result') == 'ok'
 
         except Exception as e:
+            if self._is_retryable(e):
+                raise StorageError(f"Cloudinary delete failed: {str(e)}", retryable=True) from e
             print(f"Cloudinary delete failed: {str(e)}")
             return False
 
@@ -97,4 +165,92 @@ class CloudinaryStorage(BaseStorage):
 
         except Exception as e:
             print(f"Cloudinary URL generation failed: {str(e)}")
-            return uploaded_file.public_url
\ No newline at end of file
+            return uploaded_file.public_url
+
+    def open_file(self, uploaded_file):
+        try:
+            response = requests.get(uploaded_file.secure_url or uploaded_file.public_url, stream=True, timeout=30)
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return response.raw
+        except requests.RequestException as e:
+            raise StorageError(f"Cloudinary download failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        try:
+            response = requests.get(
+                uploaded_file.secure_url or uploaded_file.public_url,
+                headers={'Range': f'bytes={start}-{start + length - 1}'},
+                timeout=30
+            )
+            response.raise_for_status()
+            # A server ignoring the range answers 200 with the whole file
+            return response.content if response.status_code == 206 else response.content[start:start + length]
+        except requests.RequestException as e:
+            raise StorageError(f"Cloudinary download failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def list_files(self, prefix: str = '') -> Iterator[StoredObject]:
+        next_cursor = None
+        try:
+            while True:
+                # The Search API is the only listing that can be sorted by public_id
+                search = cloudinary.search.Search().sort_by('public_id', 'asc').max_results(500)
+                if prefix:
+                    search = search.expression(f'public_id:{prefix}*')
+                if next_cursor:
+                    search = search.next_cursor(next_cursor)
+                result = search.execute()
+
+                for resource in result.get('resources', []):
+                    created_at = resource.get('created_at')
+                    yield StoredObject(
+                        resource['public_id'],
+                        resource.get('bytes') or 0,
+                        datetime.fromisoformat(created_at.replace('Z', '+00:00')) if created_at else None
+                    )
+
+                next_cursor = result.get('next_cursor')
+                if not next_cursor:
+                    break
+        except Exception as e:
+            raise StorageError(f"Cloudinary listing failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def delete_keys(self, keys: List[str]) -> List[str]:
+        deleted = []
+        try:
+            # Resources must be deleted per resource type, at most 100 per request
+            for start in range(0, len(keys), 100):
+                remaining = keys[start:start + 100]
+                not_found = set(remaining)
+                for resource_type in RESOURCE_TYPES:
+                    if not remaining:
+                        break
+                    result = cloudinary.api.delete_resources(remaining, resource_type=resource_type)
+                    states = result.get('deleted', {})
+                    found = [key for key in remaining if states.get(key) == 'deleted']
+                    deleted.extend(found)
+                    not_found &= {key for key in remaining if states.get(key) == 'not_found'}
+                    remaining = [key for key in remaining if key not in found]
+                # Keys unknown under every resource type are already gone
+                deleted.extend(key for key in remaining if key in not_found)
+        except Exception as e:
+            raise StorageError(f"Cloudinary bulk delete failed: {str(e)}", retryable=self._is_retryable(e)) from e
+        return deleted
+
+    def probe(self) -> Dict[str, Any]:
+        try:
+            cloudinary.api.ping()
+            return {'cloud_name': cloudinary.config().cloud_name}
+        except Exception as e:
+            raise StorageError(f"Cloudinary probe failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    @staticmethod
+    def _is_retryable(exc: Exception) -> bool:
+        if isinstance(exc, requests.HTTPError):
+            return exc.response is not None and (exc.response.status_code >= 500 or exc.response.status_code == 429)
+        if isinstance(exc, requests.RequestException):
+            return True
+        # The SDK raises the bare Error class for socket and unexpected HTTP
+        # failures, and dedicated subclasses for the 4xx responses.
+        return isinstance(exc, (cloudinary.exceptions.RateLimited, cloudinary.exceptions.GeneralError)) or \
+            type(exc) is cloudinary.exceptions.Error
@@ -1,15 +1,23 @@
 import os
+import shutil
+import tempfile
 import uuid
 from django.conf import settings
 from django.core.files.storage import default_storage
-from typing import Dict, Any
+from datetime import datetime, UTC
+from typing import Dict, Any, Iterator, List
 
-from file_upload.storages.base_storage import BaseStorage
+from file_upload import compression
+from file_upload.signing import sign_url, signs_by_default
+from file_upload.storages.base_storage import BaseStorage, StorageError, StoredObject
 
 
 class LocalStorage(BaseStorage):
     """Local file system storage backend implementation"""
 
+    name = 'local'
+    accepts_streams = True
+
     def __init__(self):
         self.media_root = getattr(settings, 'MEDIA_ROOT', os.path.join(settings.BASE_DIR, 'media'))
         self.media_url = getattr(settings, 'MEDIA_URL', '/media/')
@@ -22,25 +30,33 @@ class LocalStorage(BaseStorage):
             unique_filename = f"{uuid.uuid4()}{file_ext}"
             relative_path = f"{file_type}s/{unique_filename}"
 
+            file, encoding = compression.prepare(file, filename)
+            if encoding:
+                file = compression.CompressingReader(file, encoding)
+
             # Save file
-            saved_path = default_storage.save(relative_path, file)
+            saved_path = default_storage.save(compression.stored_key(relative_path, encoding), file)
             full_path = os.path.join(self.media_root, saved_path)
 
             # Generate URL
             public_url = f"{self.media_url}{saved_path}"
 
+            metadata = {
+                'full_path': full_path,
+                'relative_path': saved_path,
+            }
+            if encoding:
+                metadata['compression'] = file.summary()
+
             return {
                 'public_url': public_url,
                 'secure_url': public_url,
                 'storage_id': saved_path,
-                'metadata': {
-                    'full_path': full_path,
-                    'relative_path': saved_path,
-                }
+                'metadata': metadata,
             }
 
         except Exception as e:
-            raise Exception(f"Local storage upload failed: {str(e)}")
+            raise StorageError(f"Local storage upload failed: {str(e)}") from e
 
     def delete_file(self, uploaded_file) -> bool:
         """Delete file from local storage"""
@@ -58,5 +74,82 @@ class LocalStorage(BaseStorage):
             return False
 
     def get_file_url(self, uploaded_file, **kwargs) -> str:
-        """Get local file URL"""
-        return uploaded_file.public_url
\ No newline at end of file
+        """
+        Get local file URL, signed unless FILE_UPLOAD_LOCAL_SIGNED_URLS is off
+
+        Compressed files are always signed: only the signed URL view decodes
+        them for clients that do not accept their encoding.
+        """
+        if not uploaded_file.local_path:
+            return uploaded_file.public_url
+        encoding = compression.encoding_for(uploaded_file)
+        if 'expires_in' in kwargs or encoding or signs_by_default(self.name):
+            return sign_url(self.name, uploaded_file.local_path, kwargs.get('expires_in'), encoding)
+        return uploaded_file.public_url
+
+    def open_file(self, uploaded_file):
+        """Open local file for reading"""
+        try:
+            return default_storage.open(uploaded_file.local_path, 'rb')
+        except (OSError, TypeError) as e:
+            raise StorageError(f"Local storage read failed: {str(e)}") from e
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        try:
+            with default_storage.open(uploaded_file.local_path, 'rb') as f:
+                f.seek(start)
+                return f.read(length)
+        except (OSError, TypeError) as e:
+            raise StorageError(f"Local storage read failed: {str(e)}") from e
+
+    def probe(self) -> Dict[str, Any]:
+        """Check the media root is writable and has enough free space"""
+        try:
+            os.makedirs(self.media_root, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.media_root, prefix='.probe-') as probe_file:
+                probe_file.write(b'ok')
+                probe_file.flush()
+            free_bytes = shutil.disk_usage(self.media_root).free
+        except OSError as e:
+            raise StorageError(f"Local storage probe failed: {str(e)}") from e
+
+        min_free_bytes = getattr(settings, 'FILE_UPLOAD_LOCAL_MIN_FREE_BYTES', 0)
+        if free_bytes < min_free_bytes:
+            raise StorageError(f"Local storage has {free_bytes} bytes free, below {min_free_bytes}")
+
+        return {'free_bytes': free_bytes}
+
+    def list_files(self, prefix: str = '') -> Iterator[StoredObject]:
+        """Walk the media root lazily, in key order"""
+        yield from self._walk(self.media_root, '', prefix)
+
+    def _walk(self, directory: str, relative_dir: str, prefix: str) -> Iterator[StoredObject]:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+
+        # Sorting directories as "name/" makes the depth-first walk emit keys
+        # in plain string order ("a.txt" before "a/b.txt")
+        entries.sort(key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name)
+
+        for entry in entries:
+            key = f"{relative_dir}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                key += '/'
+                if key.startswith(prefix) or prefix.startswith(key):
+                    yield from self._walk(entry.path, key, prefix)
+            elif key.startswith(prefix) and not entry.name.startswith('.probe-'):
+                stat = entry.stat()
+                yield StoredObject(key, stat.st_size, datetime.fromtimestamp(stat.st_mtime, UTC))
+
+    def delete_keys(self, keys: List[str]) -> List[str]:
+        deleted = []
+        for key in keys:
+            try:
+                if default_storage.exists(key):
+                    default_storage.delete(key)
+                deleted.append(key)
+            except OSError as e:
+                print(f"Local storage delete failed for {key}: {str(e)}")
+        return deleted
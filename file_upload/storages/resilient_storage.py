@@ -0,0 +1,325 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from file_upload.metrics import metrics
+from file_upload.storages.base_storage import BaseStorage, StorageError
+
+
+class CircuitOpenError(StorageError):
+    """Raised without calling the backend while its circuit breaker is open"""
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for idempotent storage calls"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_settings(cls) -> 'RetryPolicy':
+        return cls(
+            max_attempts=getattr(settings, 'FILE_UPLOAD_RETRY_ATTEMPTS', 3),
+            base_delay=getattr(settings, 'FILE_UPLOAD_RETRY_BASE_DELAY', 0.1),
+            max_delay=getattr(settings, 'FILE_UPLOAD_RETRY_MAX_DELAY', 2.0),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (starting at 1)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker
+
+    After `failure_threshold` consecutive transient failures the circuit opens
+    and calls fail fast for `reset_timeout` seconds. A single trial call is then
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+                metrics.inc('file_upload_storage_circuit_rejections_total', backend=self.name)
+                raise CircuitOpenError(f"Storage backend '{self.name}' is unavailable (circuit open)", retryable=False)
+            if state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_inconclusive(self):
+        """A call that says nothing about the backend's health, e.g. a missing file"""
+        with self._lock:
+            # Lets the next call try the half-open circuit instead
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self._current_state(), 'consecutive_failures': self._failures}
+
+
+class LatencyTracker:
+    """Rolling window of call latencies, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+_registry_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[tuple, LatencyTracker] = {}
+_hedge_executor = None
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=getattr(settings, 'FILE_UPLOAD_BREAKER_FAILURE_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'FILE_UPLOAD_BREAKER_RESET_TIMEOUT', 30),
+            )
+        return _breakers[name]
+
+
+def circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def _get_latency_tracker(backend: str, operation: str) -> LatencyTracker:
+    with _registry_lock:
+        key = (backend, operation)
+        if key not in _latencies:
+            _latencies[key] = LatencyTracker()
+        return _latencies[key]
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _registry_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'FILE_UPLOAD_HEDGE_MAX_WORKERS', 8),
+                thread_name_prefix='storage-hedge',
+            )
+        return _hedge_executor
+
+
+def _collect_breaker_metrics():
+    for name, snapshot in circuit_breaker_states().items():
+        yield 'file_upload_storage_circuit_state', {'backend': name}, CircuitBreaker.STATE_VALUES[snapshot['state']]
+
+
+metrics.register_collector(_collect_breaker_metrics)
+
+
+class ResilientStorage(BaseStorage):
+    """
+    Wraps a storage backend with retries, a circuit breaker and hedged reads
+
+    Only idempotent operations (delete, URL generation, reads) are retried;
+    uploads pick a new storage key on every call, so they only go through the
+    breaker. Reads and URL generation are hedged: when the first call is slower
+    than the configured latency percentile a duplicate is issued and the first
+    result wins.
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self.name = storage.name
+        self.accepts_streams = storage.accepts_streams
+        self.breaker = get_circuit_breaker(storage.name)
+        self.retry_policy = RetryPolicy.from_settings()
+
+    def __getattr__(self, item):
+        return getattr(self.storage, item)
+
+    def upload_file(self, file, filename: str, file_type: str, **kwargs) -> Dict[str, Any]:
+        return self._call('upload_file', self.storage.upload_file, file, filename, file_type, **kwargs)
+
+    def delete_file(self, uploaded_file) -> bool:
+        try:
+            return self._call('delete_file', self.storage.delete_file, uploaded_file, idempotent=True)
+        except StorageError as e:
+            print(f"Storage delete failed: {str(e)}")
+            return False
+
+    def get_file_url(self, uploaded_file, **kwargs) -> str:
+        try:
+            return self._call(
+                'get_file_url', self.storage.get_file_url, uploaded_file, idempotent=True, hedge=True, **kwargs
+            )
+        except StorageError as e:
+            print(f"Storage URL generation failed: {str(e)}")
+            return uploaded_file.public_url
+
+    def open_file(self, uploaded_file):
+        return self._call(
+            'open_file', self.storage.open_file, uploaded_file, idempotent=True, hedge=True, cleanup=_close_quietly
+        )
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        return self._call(
+            'read_range', self.storage.read_range, uploaded_file, start, length, idempotent=True, hedge=True
+        )
+
+    def list_files(self, prefix: str = ''):
+        # A generator, so the breaker records how the listing went, not that it was created
+        self.breaker.before_call()
+        recorded = False
+        try:
+            yield from self.storage.list_files(prefix)
+        except StorageError as e:
+            if e.retryable:
+                recorded = True
+                self.breaker.record_failure()
+                metrics.inc('file_upload_storage_failures_total', backend=self.name, operation='list_files')
+            raise
+        else:
+            recorded = True
+            self.breaker.record_success()
+        finally:
+            # Non-retryable errors, other exceptions and abandoned listings
+            if not recorded:
+                self.breaker.record_inconclusive()
+
+    def delete_keys(self, keys):
+        return self._call('delete_keys', self.storage.delete_keys, keys, idempotent=True)
+
+    def collect_garbage(self, grace_seconds: float, dry_run: bool = False) -> Dict[str, int]:
+        return self._call('collect_garbage', self.storage.collect_garbage, grace_seconds, dry_run, idempotent=True)
+
+    def probe(self) -> Dict[str, Any]:
+        # Probes bypass the breaker so health checks report the real backend state
+        return self.storage.probe()
+
+    def _call(self, operation, func, *args, idempotent=False, hedge=False, cleanup=None, **kwargs):
+        attempts = self.retry_policy.max_attempts if idempotent else 1
+
+        for attempt in range(1, attempts + 1):
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                if hedge:
+                    result = self._hedged(operation, lambda: func(*args, **kwargs), cleanup)
+                else:
+                    result = func(*args, **kwargs)
+            except StorageError as e:
+                if not e.retryable:
+                    self.breaker.record_inconclusive()
+                    raise
+                self.breaker.record_failure()
+                metrics.inc('file_upload_storage_failures_total', backend=self.name, operation=operation)
+                if attempt == attempts:
+                    raise
+                metrics.inc('file_upload_storage_retries_total', backend=self.name, operation=operation)
+                time.sleep(self.retry_policy.backoff(attempt))
+            except Exception:
+                # Backends report their failures as StorageError; anything else is a bug or unsupported call
+                self.breaker.record_inconclusive()
+                raise
+            else:
+                self.breaker.record_success()
+                _get_latency_tracker(self.name, operation).record(time.monotonic() - started)
+                return result
+
+    def _hedged(self, operation, call, cleanup=None):
+        delay = _get_latency_tracker(self.name, operation).percentile(
+            getattr(settings, 'FILE_UPLOAD_HEDGE_PERCENTILE', 95),
+            getattr(settings, 'FILE_UPLOAD_HEDGE_MIN_SAMPLES', 20),
+        )
+        if delay is None or not getattr(settings, 'FILE_UPLOAD_HEDGE_ENABLED', True):
+            return call()
+
+        executor = _get_hedge_executor()
+        primary = executor.submit(call)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        metrics.inc('file_upload_storage_hedged_requests_total', backend=self.name, operation=operation)
+        hedge = executor.submit(call)
+        pending = {primary, hedge}
+        error = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if cleanup:
+                        for other in pending:
+                            other.add_done_callback(lambda f: f.exception() is None and cleanup(f.result()))
+                    return future.result()
+                error = future.exception()
+
+        raise error
+
+
+def _close_quietly(stream):
+    try:
+        stream.close()
+    except Exception:
+        pass
@@ -1,14 +1,26 @@
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError, ConnectionError as BotoConnectionError, HTTPClientError
 from django.conf import settings
-from typing import Dict, Any
+from django.utils import timezone
+from typing import Dict, Any, Iterator, List
+import math
 import uuid
 import os
 
-from file_upload.storages.base_storage import BaseStorage
+from file_upload import compression
+from file_upload.signing import sign_url
+from file_upload.storages.base_storage import BaseStorage, StorageError, StoredObject
+
+RETRYABLE_ERROR_CODES = {
+    'InternalError', 'RequestTimeout', 'RequestTimeTooSkewed', 'ServiceUnavailable',
+    'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+}
 
 
 class S3Storage(BaseStorage):
+    name = 's3'
+    accepts_streams = True
+
     def __init__(self):
         self.s3_client = boto3.client(
             's3',
@@ -23,7 +35,13 @@ class S3Storage(BaseStorage):
         try:
             file_ext = os.path.splitext(filename)[1]
             unique_filename = f"{uuid.uuid4()}{file_ext}"
-            s3_key = f"{file_type}s/{unique_filename}"
+            file, encoding = compression.prepare(file, filename)
+            if encoding:
+                # No ContentEncoding: S3 would send it to every client, including
+                # those that cannot decode it. URLs of compressed objects go
+                # through the signed URL view, which negotiates (see get_file_url).
+                file = compression.CompressingReader(file, encoding)
+            s3_key = compression.stored_key(f"{file_type}s/{unique_filename}", encoding)
 
             self.s3_client.upload_fileobj(
                 file,
@@ -36,25 +54,30 @@ class S3Storage(BaseStorage):
                         'original-filename': filename,
                         'file-type': file_type,
                         'uploaded-by': str(kwargs.get('request_id', 'anonymous'))
-                    }
+                    },
+                    **self._retention_tagging(kwargs.get('expires_at'))
                 }
             )
 
             public_url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{s3_key}"
 
+            metadata = {
+                'bucket': self.bucket_name,
+                'region': self.region,
+                's3_key': s3_key,
+            }
+            if encoding:
+                metadata['compression'] = file.summary()
+
             return {
                 'public_url': public_url,
                 'secure_url': public_url,
                 'storage_id': s3_key,
-                'metadata': {
-                    'bucket': self.bucket_name,
-                    'region': self.region,
-                    's3_key': s3_key,
-                }
+                'metadata': metadata,
             }
 
-        except ClientError as e:
-            raise Exception(f"S3 upload failed: {str(e)}")
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 upload failed: {str(e)}", retryable=self._is_retryable(e)) from e
 
     def delete_file(self, uploaded_file) -> bool:
         try:
@@ -67,7 +90,9 @@ class S3Storage(BaseStorage):
             )
             return True
 
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
+            if self._is_retryable(e):
+                raise StorageError(f"S3 delete failed: {str(e)}", retryable=True) from e
             print(f"S3 delete failed: {str(e)}")
             return False
 
@@ -75,6 +100,14 @@ class S3Storage(BaseStorage):
         if not uploaded_file.s3_key:
             return uploaded_file.public_url
 
+        encoding = compression.encoding_for(uploaded_file)
+        if encoding:
+            # Served through this app, which decodes them for clients not accepting the encoding
+            return sign_url(self.name, uploaded_file.s3_key, kwargs.get('expires_in'), encoding)
+        if 'expires_in' in kwargs and getattr(settings, 'FILE_UPLOAD_S3_URL_MODE', 'presign') == 'proxy':
+            # Served through this app, so signing needs no AWS credentials or round trip
+            return sign_url(self.name, uploaded_file.s3_key, kwargs['expires_in'])
+
         try:
             if 'expires_in' in kwargs:
                 url = self.s3_client.generate_presigned_url(
@@ -86,10 +119,79 @@ class S3Storage(BaseStorage):
             else:
                 return uploaded_file.public_url
 
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
+            if self._is_retryable(e):
+                raise StorageError(f"S3 URL generation failed: {str(e)}", retryable=True) from e
             print(f"S3 URL generation failed: {str(e)}")
             return uploaded_file.public_url
 
+    def open_file(self, uploaded_file):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=uploaded_file.s3_key)
+            return response['Body']
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 download failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def read_range(self, uploaded_file, start: int, length: int) -> bytes:
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=uploaded_file.s3_key,
+                Range=f'bytes={start}-{start + length - 1}'
+            )
+            return response['Body'].read()
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 download failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def list_files(self, prefix: str = '') -> Iterator[StoredObject]:
+        try:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for item in page.get('Contents', []):
+                    yield StoredObject(item['Key'], item['Size'], item['LastModified'])
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 listing failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    def delete_keys(self, keys: List[str]) -> List[str]:
+        deleted = []
+        try:
+            # DeleteObjects accepts at most 1000 keys per request
+            for start in range(0, len(keys), 1000):
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': False}
+                )
+                deleted.extend(item['Key'] for item in response.get('Deleted', []))
+                for error in response.get('Errors', []):
+                    print(f"S3 delete failed for {error.get('Key')}: {error.get('Message')}")
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 bulk delete failed: {str(e)}", retryable=self._is_retryable(e)) from e
+        return deleted
+
+    def probe(self) -> Dict[str, Any]:
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket_name)
+            return {'bucket': self.bucket_name}
+        except (ClientError, BotoCoreError) as e:
+            raise StorageError(f"S3 probe failed: {str(e)}", retryable=self._is_retryable(e)) from e
+
+    @staticmethod
+    def _is_retryable(exc: Exception) -> bool:
+        if isinstance(exc, ClientError):
+            error = exc.response.get('Error', {})
+            status_code = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+            return error.get('Code') in RETRYABLE_ERROR_CODES or status_code >= 500
+        # Connection resets, read timeouts and endpoint errors
+        return isinstance(exc, (BotoConnectionError, HTTPClientError))
+
+    @staticmethod
+    def _retention_tagging(expires_at) -> Dict[str, str]:
+        """Tag expiring objects so a bucket lifecycle rule can expire them"""
+        if not expires_at:
+            return {}
+        days = max(1, math.ceil((expires_at - timezone.now()).total_seconds() / 86400))
+        return {'Tagging': f'retention-days={days}'}
+
     @staticmethod
     def _get_content_type(file_ext: str) -> str:
         content_types = {
@@ -0,0 +1,65 @@
+import io
+
+
+class IncompleteBodyError(IOError):
+    """Raised when the client sends fewer bytes than its Content-Length"""
+
+
+class RequestBodyStream(io.RawIOBase):
+    """
+    Read-only, non-seekable file-like view over a raw request body
+
+    Exposes the `name`, `size` and `chunks()` attributes the storage backends
+    and FileUploadService expect from an uploaded file, but reads straight from
+    the request in fixed-size pieces instead of spooling the body first.
+    """
+
+    def __init__(self, request, name: str, size: int, chunk_size: int = 64 * 1024, progress=None):
+        super().__init__()
+        self._request = request
+        self.name = name
+        self.size = size
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.size - self._remaining
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+
+        data = self._request.read(size)
+        if not data:
+            raise IncompleteBodyError(
+                f"Request body ended after {self.tell()} of {self.size} bytes"
+            )
+        self._remaining -= len(data)
+        if self.progress:
+            self.progress.advance(len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def chunks(self, chunk_size: int = None):
+        while True:
+            data = self.read(chunk_size or self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    @property
+    def complete(self) -> bool:
+        return self._remaining == 0
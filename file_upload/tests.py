@@ -1,9 +1,58 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import struct
+import os
+import random
 import tempfile
-from django.test import TestCase, override_settings
+import threading
+import time
+import uuid
+import wave
+import zipfile
+import cloudinary
+import cloudinary.utils
+from datetime import date, datetime, timedelta, UTC
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch
-from .models import UploadedFile
+from PIL import Image, ImageDraw
+from . import compression, signing
+from .admission import AdmissionRejected, MemoryBudget, get_memory_budget
+from .db_router import ReplicaPinMiddleware, ReplicaRouter, replica_health
+from .idempotency import fingerprint, scoped_key
+from .media_probe import RangeReader, probe
+from .metrics import metrics
+from .progress import ProgressTracker, get_progress
+from .models import ArchivedFile, CloudinaryNotification, FileEvent, IdempotencyKey, ImageHash, StorageUsage, UploadedFile
+from .services.cache_service import FileCacheService, check_shared_cache
+from .services.cold_archive_service import ColdArchiveService
+from .services.event_service import EventService
 from .services.file_service import FileUploadService
+from .services.media_service import MediaMetadataService
+from .services.placeholder_service import PlaceholderService
+from .services.health_service import HealthService
+from .services.image_hash_service import ImageHashService
+from .services.ingest_service import IngestService
+from .services.reconcile_service import ReconcileService
+from .services.retention_service import RetentionService
+from .services.search_service import SearchService
+from .services.usage_service import UsageService
+from .storages import resilient_storage
+from .storages.base_storage import BaseStorage, StorageError
+from .storages.chunk_storage import ChunkStorage
+from .storages.cloudinary_storage import CloudinaryStorage
+from .storages.local_storage import LocalStorage
+from .storages.resilient_storage import CircuitBreaker, CircuitOpenError, ResilientStorage
+from .throttling import FairScheduler, MemoryRateLimitStore, Throttled, check_rate_limit_store
+from .utils import compute_image_hashes, compute_placeholder, max_file_size
 
 
 class FileUploadServiceTest(TestCase):
@@ -77,3 +126,1718 @@ class FileUploadServiceTest(TestCase):
                 self.assertEqual(uploaded_file.storage_backend, 'local')
                 self.assertIsNotNone(uploaded_file.local_path)
                 self.assertTrue(uploaded_file.public_url.startswith('/media/'))
+
+
+class FlakyStorage(BaseStorage):
+    name = 'flaky'
+
+    def __init__(self, failures=0, retryable=True):
+        self.failures = failures
+        self.retryable = retryable
+        self.calls = 0
+
+    def upload_file(self, file, filename, file_type, **kwargs):
+        self.calls += 1
+        raise StorageError("upload failed", retryable=self.retryable)
+
+    def delete_file(self, uploaded_file):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise StorageError("delete failed", retryable=self.retryable)
+        return True
+
+    def get_file_url(self, uploaded_file, **kwargs):
+        return uploaded_file.public_url
+
+
+@override_settings(FILE_UPLOAD_RETRY_BASE_DELAY=0, FILE_UPLOAD_BREAKER_FAILURE_THRESHOLD=2)
+class ResilientStorageTest(TestCase):
+    def setUp(self):
+        resilient_storage._breakers.clear()
+
+    def test_idempotent_call_is_retried(self):
+        backend = FlakyStorage(failures=1)
+        storage = ResilientStorage(backend)
+
+        self.assertTrue(storage.delete_file(object()))
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(storage.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_upload_is_not_retried(self):
+        backend = FlakyStorage()
+        storage = ResilientStorage(backend)
+
+        with self.assertRaises(StorageError):
+            storage.upload_file(object(), 'a.jpg', 'image')
+        self.assertEqual(backend.calls, 1)
+
+    def test_non_retryable_error_is_not_retried(self):
+        backend = FlakyStorage(failures=5, retryable=False)
+        storage = ResilientStorage(backend)
+
+        self.assertFalse(storage.delete_file(object()))
+        self.assertEqual(backend.calls, 1)
+
+    def test_non_retryable_error_leaves_the_breaker_untouched(self):
+        backend = FlakyStorage()
+        storage = ResilientStorage(backend)
+
+        with self.assertRaises(StorageError):
+            storage.upload_file(object(), 'a.jpg', 'image')
+        backend.retryable = False
+        with self.assertRaises(StorageError):
+            storage.upload_file(object(), 'a.jpg', 'image')
+        self.assertEqual(storage.breaker.snapshot()['consecutive_failures'], 1)
+
+        backend.retryable = True
+        with self.assertRaises(StorageError):
+            storage.upload_file(object(), 'a.jpg', 'image')
+        self.assertEqual(storage.breaker.state, CircuitBreaker.OPEN)
+
+    @override_settings(FILE_UPLOAD_BREAKER_RESET_TIMEOUT=0)
+    def test_half_open_trial_is_released_by_listings_and_unsupported_calls(self):
+        backend = FlakyStorage()
+        storage = ResilientStorage(backend)
+        for _ in range(2):
+            with self.assertRaises(StorageError):
+                storage.upload_file(object(), 'a.jpg', 'image')
+        self.assertEqual(storage.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        for _ in range(2):
+            with self.assertRaises(NotImplementedError):
+                list(storage.list_files())
+        for _ in range(2):
+            with self.assertRaises(NotImplementedError):
+                storage.read_range(object(), 0, 10)
+
+        self.assertEqual(storage.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(storage.breaker.snapshot()['consecutive_failures'], 2)
+
+    def test_circuit_opens_and_fails_fast(self):
+        backend = FlakyStorage()
+        storage = ResilientStorage(backend)
+
+        for _ in range(2):
+            with self.assertRaises(StorageError):
+                storage.upload_file(object(), 'a.jpg', 'image')
+
+        self.assertEqual(storage.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            storage.upload_file(object(), 'a.jpg', 'image')
+        self.assertEqual(backend.calls, 2)
+        self.assertIn('file_upload_storage_circuit_state{backend="flaky"} 2', metrics.render())
+
+
+class ReadinessCheckTest(TestCase):
+    def setUp(self):
+        HealthService.reset()
+
+    def test_local_backend_ready(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with override_settings(
+                    MEDIA_ROOT=temp_dir,
+                    FILE_UPLOAD_HEALTH_BACKENDS=['local'],
+                    FILE_UPLOAD_LOCAL_MIN_FREE_BYTES=0
+            ):
+                response = self.client.get('/health/ready/')
+
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()['checks']
+        self.assertEqual(checks['database']['status'], 'ok')
+        self.assertIn('latency_ms', checks['storage:local'])
+
+    def test_failed_probe_is_cached(self):
+        with override_settings(FILE_UPLOAD_HEALTH_BACKENDS=['s3'], FILE_UPLOAD_HEALTH_CACHE_SECONDS=60):
+            with patch('file_upload.services.health_service.get_storage_backend') as mock_backend:
+                mock_backend.return_value.probe.side_effect = StorageError("bucket not found")
+                first = self.client.get('/health/ready/')
+                second = self.client.get('/health/ready/')
+
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second.status_code, 503)
+        self.assertEqual(mock_backend.return_value.probe.call_count, 1)
+        self.assertEqual(self.client.get('/health/live/').status_code, 200)
+
+
+class FileMetadataCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.uploaded_file = UploadedFile.objects.create(
+            request_id='test_request_id',
+            original_filename='report.pdf',
+            file_type='document',
+            file_size=1024,
+            storage_backend='local',
+            local_path='documents/report.pdf',
+            public_url='http://testserver/media/documents/report.pdf',
+        )
+        self.url = f'/api/files/files/{self.uploaded_file.id}/'
+
+    def test_hot_file_served_without_query(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], FileCacheService.etag(self.uploaded_file))
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_shared_cache()], ['file_upload.W002'])
+        self.assertIn('(cached file records, upload progress)', check_shared_cache()[0].msg)
+        with override_settings(FILE_UPLOAD_OBJECT_CACHE_TIMEOUT=0, FILE_UPLOAD_PROGRESS_STORE='memory'):
+            self.assertEqual(check_shared_cache(), [])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(), [])
+
+    def test_save_invalidates_cache(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.uploaded_file.original_filename = 'renamed.pdf'
+        self.uploaded_file.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['original_filename'], 'renamed.pdf')
+
+
+class ExportFilesTest(TestCase):
+    def setUp(self):
+        for index, (file_type, backend) in enumerate([('image', 'local'), ('document', 's3'), ('image', 's3')]):
+            UploadedFile.objects.create(
+                request_id=f'request_{index}',
+                original_filename=f'file_{index}',
+                file_type=file_type,
+                file_size=100 * (index + 1),
+                storage_backend=backend,
+                public_url=f'http://testserver/media/file_{index}',
+            )
+
+    def test_ndjson_export_filters(self):
+        response = self.client.get('/api/files/files/export/?storage_backend=s3&file_type=image')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['original_filename'], 'file_2')
+
+    def test_csv_export(self):
+        response = self.client.get('/api/files/files/export/?format=csv&created_after=2000-01-01')
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sorted(int(row['file_size']) for row in rows), [100, 200, 300])
+
+    def test_invalid_date_rejected(self):
+        response = self.client.get('/api/files/files/export/?created_before=yesterday')
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class RawUploadTest(TestCase):
+    def test_raw_put_streams_to_storage(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with override_settings(MEDIA_ROOT=temp_dir):
+                response = self.client.put(
+                    '/api/files/raw/notes.txt',
+                    data=b'x' * 200000,
+                    content_type='text/plain',
+                    query_params={'file_type': 'document'},
+                )
+
+                self.assertEqual(response.status_code, 201)
+                uploaded_file = UploadedFile.objects.get(id=response.json()['id'])
+                self.assertEqual(uploaded_file.file_size, 200000)
+                self.assertEqual(uploaded_file.file_type, 'document')
+                with open(os.path.join(temp_dir, uploaded_file.local_path), 'rb') as f:
+                    self.assertEqual(f.read(), b'x' * 200000)
+
+    def test_content_type_mismatch_rejected(self):
+        response = self.client.put('/api/files/raw/photo.jpg', data=b'data', content_type='text/plain')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_oversized_body_rejected(self):
+        with override_settings(FILE_UPLOAD_RAW_MAX_SIZE=10):
+            response = self.client.put('/api/files/raw/notes.txt', data=b'x' * 11, content_type='text/plain')
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_retryable_storage_error_is_not_reported_as_a_short_body(self):
+        with patch.object(FileUploadService, 'upload_file', side_effect=StorageError('S3 down', retryable=True)):
+            response = self.client.put(
+                '/api/files/raw/notes.txt', data=b'data', content_type='text/plain', headers={'Idempotency-Key': 'k'}
+            )
+
+        self.assertEqual(response.status_code, 503)
+        # The failure is not stored, so the retry uploads for real
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_unexpected_error_before_the_body_is_read_is_a_server_error(self):
+        with patch.object(FileUploadService, 'upload_file', side_effect=RuntimeError('boom')):
+            response = self.client.put('/api/files/raw/notes.txt', data=b'data', content_type='text/plain')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['error'], 'boom')
+
+
+class ReconcileServiceTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        for key in ['documents/a.txt', 'documents/b.txt', 'images/x.jpg', 'images.jpg']:
+            path = os.path.join(self.temp_dir.name, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'data')
+            os.utime(path, (0, 0))
+
+        for key in ['documents/a.txt', 'documents/missing.txt', 'images/x.jpg']:
+            uploaded_file = UploadedFile.objects.create(
+                original_filename=key,
+                file_size=4,
+                storage_backend='local',
+                local_path=key,
+                public_url=f'http://testserver/media/{key}',
+            )
+            UploadedFile.objects.filter(id=uploaded_file.id).update(created_at=datetime(2000, 1, 1, tzinfo=UTC))
+
+    def test_local_tree_is_listed_in_key_order(self):
+        keys = [obj.key for obj in LocalStorage().list_files()]
+
+        self.assertEqual(keys, ['documents/a.txt', 'documents/b.txt', 'images.jpg', 'images/x.jpg'])
+
+    def test_reports_orphans_on_both_sides(self):
+        report = ReconcileService('local').reconcile()
+
+        self.assertEqual(report.matched, 2)
+        self.assertEqual(report.storage_orphans, 2)
+        self.assertEqual(report.record_orphans, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, 'documents/b.txt')))
+
+    def test_fix_by_prefix(self):
+        report = ReconcileService('local', fix_storage=True, fix_records=True, batch_size=1).reconcile('documents/')
+
+        self.assertEqual(report.deleted_objects, 1)
+        self.assertEqual(report.deleted_records, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, 'documents/b.txt')))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, 'images.jpg')))
+        self.assertFalse(UploadedFile.objects.filter(local_path='documents/missing.txt').exists())
+
+    def test_recent_objects_are_skipped(self):
+        os.utime(os.path.join(self.temp_dir.name, 'documents/b.txt'))
+
+        report = ReconcileService('local').reconcile('documents/')
+
+        self.assertEqual(report.storage_orphans, 0)
+        self.assertEqual(report.skipped_recent, 1)
+
+
+class RetentionTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.temp_dir.name,
+            FILE_UPLOAD_STORAGE_BACKEND='local',
+            FILE_UPLOAD_RETENTION_FILE_TYPE_TTLS={'document': 3600},
+            FILE_UPLOAD_RETENTION_TENANT_TTLS={'tmp': 60},
+            FILE_UPLOAD_PURGE_YIELD_RATIO=0,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def _upload(self, name, request_id='acme:1', **kwargs):
+        return FileUploadService.upload_file(file=SimpleUploadedFile(name, b'content'), request_id=request_id, **kwargs)
+
+    def test_expiry_follows_policy_precedence(self):
+        document = self._upload('a.txt', request_id='acme:1')
+        tenant_document = self._upload('b.txt', request_id='tmp:2')
+        explicit = self._upload('c.txt', request_id='tmp:3', ttl=10)
+        image = self._upload('d.jpg', request_id='acme:4')
+
+        self.assertAlmostEqual((document.expires_at - timezone.now()).total_seconds(), 3600, delta=5)
+        self.assertAlmostEqual((tenant_document.expires_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertAlmostEqual((explicit.expires_at - timezone.now()).total_seconds(), 10, delta=5)
+        self.assertIsNone(image.expires_at)
+
+    def test_purge_deletes_expired_files_in_batches(self):
+        expired = [self._upload(f'{index}.txt') for index in range(3)]
+        kept = self._upload('kept.jpg')
+        UploadedFile.objects.filter(id__in=[f.id for f in expired]).update(expires_at=timezone.now())
+
+        progress = RetentionService.purge(batch_size=2)
+
+        self.assertTrue(progress['finished'])
+        self.assertEqual(progress['batches'], 2)
+        self.assertEqual(progress['deleted_records'], 3)
+        self.assertEqual(list(UploadedFile.objects.values_list('id', flat=True)), [kept.id])
+        for uploaded_file in expired:
+            self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, uploaded_file.local_path)))
+        self.assertEqual(RetentionService.progress()['deleted_records'], 3)
+
+    def test_rows_kept_when_storage_delete_fails(self):
+        uploaded_file = self._upload('a.txt')
+        UploadedFile.objects.filter(id=uploaded_file.id).update(expires_at=timezone.now())
+
+        with patch.object(LocalStorage, 'delete_keys', return_value=[]):
+            progress = RetentionService.purge()
+
+        self.assertEqual(progress['failed_objects'], 1)
+        self.assertTrue(UploadedFile.objects.filter(id=uploaded_file.id).exists())
+
+
+class StorageUsageTest(TestCase):
+    def _create(self, request_id='acme:1', file_type='image', file_size=100, storage_backend='local'):
+        return UploadedFile.objects.create(
+            request_id=request_id,
+            original_filename='file',
+            file_type=file_type,
+            file_size=file_size,
+            storage_backend=storage_backend,
+            public_url='http://testserver/media/file',
+        )
+
+    def test_usage_follows_creates_updates_and_deletes(self):
+        first = self._create()
+        self._create(file_size=50)
+        self._create(request_id='other:1', file_type='document', file_size=7)
+
+        first.storage_backend = 's3'
+        first.save()
+        UploadedFile.objects.get(file_size=50).delete()
+
+        totals = UsageService.totals(tenant='acme')
+        self.assertEqual(totals['file_count'], 1)
+        self.assertEqual(totals['total_bytes'], 100)
+        self.assertEqual(totals['by_storage_backend'], {'s3': {'file_count': 1, 'total_bytes': 100}})
+        self.assertEqual(UsageService.drift(UsageService.compute()), {})
+
+    def test_rebuild_fixes_drift(self):
+        self._create()
+        StorageUsage.objects.update(file_count=5)
+
+        computed = UsageService.compute()
+        self.assertEqual(len(UsageService.drift(computed)), 1)
+        UsageService.rebuild(computed)
+
+        self.assertEqual(UsageService.drift(UsageService.compute()), {})
+
+    def test_usage_endpoint(self):
+        self._create(file_size=10)
+        self._create(request_id='other:1', file_size=5)
+
+        response = self.client.get('/api/files/usage/', {'file_type': 'image'})
+
+        self.assertEqual(response.json()['file_count'], 2)
+        self.assertEqual(response.json()['total_bytes'], 15)
+
+    def test_usage_endpoint_rejects_malformed_dates(self):
+        for since in ('yesterday', '2024-13-01', '2024-1'):
+            response = self.client.get('/api/files/usage/', {'since': since})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('since', response.json()['error'])
+
+        self.assertEqual(self.client.get('/api/files/usage/', {'until': '2999-01-01'}).status_code, 200)
+
+
+class FileSearchTest(TestCase):
+    def _create(self, original_filename, metadata=None):
+        return UploadedFile.objects.create(
+            request_id='search',
+            original_filename=original_filename,
+            file_type='document',
+            file_size=1,
+            storage_backend='local',
+            public_url='http://testserver/media/file',
+            metadata=metadata or {},
+        )
+
+    def test_substring_and_prefix_search(self):
+        self._create('quarterly-report-2024.pdf')
+        self._create('report.pdf')
+        self._create('holiday.jpg')
+
+        substring = SearchService.search('REPORT')
+        self.assertEqual(
+            sorted(f.original_filename for f in substring),
+            ['quarterly-report-2024.pdf', 'report.pdf']
+        )
+        prefix = SearchService.search('rep', mode='prefix')
+        self.assertEqual([f.original_filename for f in prefix], ['report.pdf'])
+        self.assertEqual([f.original_filename for f in SearchService.search('ho')], ['holiday.jpg'])
+
+    def test_index_follows_updates_and_metadata(self):
+        uploaded_file = self._create('scan.png', metadata={'title': 'Invoice March'})
+        self.assertEqual(SearchService.search('invoice').count(), 1)
+
+        uploaded_file.metadata = {'tags': ['receipt']}
+        uploaded_file.save(update_fields=['metadata'])
+        self.assertEqual(SearchService.search('invoice').count(), 0)
+        self.assertEqual(SearchService.search('receipt').count(), 1)
+
+        uploaded_file.delete()
+        self.assertEqual(SearchService.search('scan').count(), 0)
+
+    def test_list_endpoint_search_and_pagination(self):
+        for i in range(3):
+            self._create(f'photo-{i}.jpg')
+        self._create('notes.txt')
+
+        response = self.client.get('/api/files/files/', {'search': 'photo', 'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
+
+
+class ArchiveDownloadTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name, FILE_UPLOAD_ZIP_CHUNK_SIZE=1024)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+
+    def _create(self, name, content, request_id='batch'):
+        path = os.path.join(self.temp_dir.name, f'{len(os.listdir(self.temp_dir.name))}-{name}')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return UploadedFile.objects.create(
+            request_id=request_id,
+            original_filename=name,
+            file_type='document',
+            file_size=len(content),
+            storage_backend='local',
+            local_path=os.path.basename(path),
+            public_url=f'http://testserver/media/{name}',
+        )
+
+    def _zip(self, content):
+        return zipfile.ZipFile(io.BytesIO(content))
+
+    def test_archive_by_request_id(self):
+        self._create('notes.txt', b'hello ' * 5000)
+        self._create('photo.jpg', os.urandom(5000))
+        self._create('notes.txt', b'second')
+        self._create('other.txt', b'other', request_id='other')
+
+        response = self.client.get('/api/files/files/archive/', {'request_id': 'batch'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Length', response)
+        archive = self._zip(b''.join(response.streaming_content))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['notes.txt', 'photo.jpg', 'notes (1).txt'])
+        self.assertEqual(archive.read('notes.txt'), b'hello ' * 5000)
+        self.assertEqual(archive.getinfo('notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('photo.jpg').compress_type, zipfile.ZIP_STORED)
+
+    def test_stored_archive_is_resumable(self):
+        files = [self._create(f'{i}.jpg', os.urandom(3000)) for i in range(3)]
+        ids = ','.join(str(f.id) for f in files)
+
+        response = self.client.get('/api/files/files/archive/', {'ids': ids})
+        content = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        with open(os.path.join(self.temp_dir.name, files[2].local_path), 'rb') as f:
+            self.assertEqual(self._zip(content).read('2.jpg'), f.read())
+
+        for start in (0, 100, 3100, len(content) - 10):
+            resumed = self.client.get(
+                '/api/files/files/archive/', {'ids': ids},
+                HTTP_RANGE=f'bytes={start}-', HTTP_IF_RANGE=response['ETag']
+            )
+            self.assertEqual(resumed.status_code, 206)
+            self.assertEqual(b''.join(resumed.streaming_content), content[start:])
+
+        # Resuming without cached CRCs reads the skipped members again
+        cache.clear()
+        resumed = self.client.get('/api/files/files/archive/', {'ids': ids}, HTTP_RANGE='bytes=7000-7099')
+        self.assertEqual(b''.join(resumed.streaming_content), content[7000:7100])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/files/files/archive/').status_code, 400)
+        response = self.client.post(
+            '/api/files/files/archive/', data={'ids': [str(uuid.uuid4())]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _mp4(moov_at_end=False):
+    mvhd = _box(b'mvhd', b'\x00' * 12 + struct.pack('>II', 1000, 12500) + b'\x00' * 80)
+    tkhd = _box(b'tkhd', b'\x00' * 76 + struct.pack('>II', 640 << 16, 360 << 16))
+    hdlr = _box(b'hdlr', b'\x00' * 8 + b'vide' + b'\x00' * 12)
+    avc1 = struct.pack('>I4s', 86, b'avc1') + b'\x00' * 24 + struct.pack('>HH', 640, 360) + b'\x00' * 50
+    stsd = _box(b'stsd', struct.pack('>II', 0, 1) + avc1)
+    mp4a = struct.pack('>I4s', 36, b'mp4a') + b'\x00' * 16 + struct.pack('>HHHHI', 2, 16, 0, 0, 48000 << 16)
+    video = _box(b'trak', tkhd + _box(b'mdia', hdlr + _box(b'minf', _box(b'stbl', stsd))))
+    audio = _box(b'trak', _box(b'mdia', _box(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 12) + _box(
+        b'minf', _box(b'stbl', _box(b'stsd', struct.pack('>II', 0, 1) + mp4a))
+    )))
+    moov = _box(b'moov', mvhd + video + audio)
+    ftyp = _box(b'ftyp', b'isom' + b'\x00' * 4)
+    mdat = _box(b'mdat', b'\x00' * 100000)
+    return ftyp + mdat + moov if moov_at_end else ftyp + moov + mdat
+
+
+def _mp3():
+    tag_frame = b'TIT2' + struct.pack('>I', 6) + b'\x00\x00' + b'\x03Song\x00'
+    id3 = b'ID3\x03\x00\x00' + bytes([0, 0, 0, len(tag_frame)]) + tag_frame
+    # MPEG1 Layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames
+    frame = b'\xff\xfb\x90\x44' + b'\x00' * 413
+    xing = b'\xff\xfb\x90\x44' + b'\x00' * 32 + b'Xing' + struct.pack('>II', 1, 100) + b'\x00' * 369
+    return id3 + xing + frame * 100
+
+
+class MediaProbeTest(TestCase):
+    def _probe(self, content, filename=''):
+        return probe(RangeReader.from_file(io.BytesIO(content), block_size=1024), filename)
+
+    def test_mp4_with_moov_at_either_end(self):
+        for moov_at_end in (False, True):
+            reader = RangeReader.from_file(io.BytesIO(_mp4(moov_at_end)), block_size=1024)
+            media = probe(reader)
+
+            self.assertEqual(media['container'], 'mp4')
+            self.assertEqual(media['duration'], 12.5)
+            self.assertEqual((media['width'], media['height']), (640, 360))
+            self.assertEqual((media['video_codec'], media['audio_codec']), ('avc1', 'mp4a'))
+            self.assertEqual((media['channels'], media['sample_rate']), (2, 48000))
+            # Only the headers were read, not the 100 KB payload
+            self.assertLess(reader.fetched, 10 * 1024)
+
+    def test_audio_containers(self):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(b'\x00' * 64000)
+        media = self._probe(buffer.getvalue())
+        self.assertEqual((media['container'], media['audio_codec'], media['duration']), ('wav', 'pcm', 2.0))
+
+        streaminfo = b'\x00' * 10 + ((44100 << 44) | (1 << 41) | (15 << 36) | 441000).to_bytes(8, 'big')
+        flac = b'fLaC' + b'\x80\x00\x00\x22' + streaminfo + b'\x00' * 16 + b'\x00' * 5000
+        media = self._probe(flac)
+        self.assertEqual((media['container'], media['channels'], media['duration']), ('flac', 2, 10.0))
+
+        media = self._probe(_mp3(), 'song.mp3')
+        self.assertEqual((media['container'], media['audio_codec']), ('mp3', 'mp3'))
+        self.assertEqual(media['duration'], round(100 * 1152 / 44100, 3))
+        self.assertEqual(media['title'], 'Song')
+
+    @override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+    def test_upload_and_backfill_record_media(self):
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            uploaded = FileUploadService.upload_file(
+                SimpleUploadedFile('clip.mp4', _mp4(), content_type='video/mp4'), request_id='media'
+            )
+            self.assertEqual(uploaded.metadata['media']['duration'], 12.5)
+            with open(os.path.join(temp_dir, uploaded.local_path), 'rb') as f:
+                self.assertEqual(f.read(), _mp4())
+
+            UploadedFile.objects.filter(id=uploaded.id).update(metadata={})
+            etag = FileCacheService.etag(uploaded)
+            counts = MediaMetadataService.backfill(workers=2)
+
+            self.assertEqual(counts, {'probed': 1, 'unparsable': 0, 'failed': 0})
+            uploaded.refresh_from_db()
+            self.assertEqual(uploaded.metadata['media']['video_codec'], 'avc1')
+            self.assertNotEqual(FileCacheService.etag(uploaded), etag)
+
+    @override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+    def test_video_upload_over_http_is_probed_inline(self):
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            response = self.client.post(
+                '/api/files/upload/', {'file': SimpleUploadedFile('clip.mp4', _mp4(), content_type='video/mp4')}
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['file_type'], 'video')
+        self.assertEqual(response.json()['metadata']['media']['duration'], 12.5)
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class UploadProgressTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+
+    def test_multipart_upload_reports_progress(self):
+        response = self.client.post(
+            '/api/files/upload/',
+            {'file': SimpleUploadedFile('notes.txt', b'x' * 300000, content_type='text/plain')},
+            headers={'X-Upload-ID': 'upload-0001'},
+        )
+        self.assertEqual(response.status_code, 201)
+
+        progress = self.client.get('/api/files/progress/upload-0001/').json()
+        self.assertEqual(progress['state'], 'done')
+        self.assertEqual(progress['file_id'], response.json()['id'])
+        self.assertEqual(progress['percent'], 100.0)
+        self.assertEqual(self.client.get('/api/files/progress/unknown-0001/').status_code, 404)
+
+    def test_raw_upload_progress_over_sse(self):
+        response = self.client.put(
+            '/api/files/raw/notes.txt?upload_id=upload-0002', data=b'x' * 1000, content_type='text/plain'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        events = self.client.get('/api/files/progress/upload-0002/events/')
+        self.assertEqual(events['Content-Type'], 'text/event-stream')
+        body = b''.join(events.streaming_content).decode()
+        data = json.loads(body.split('data: ')[1].split('\n')[0])
+        self.assertEqual((data['state'], data['received'], data['total']), ('done', 1000, 1000))
+
+    @override_settings(FILE_UPLOAD_PROGRESS_STORE='memory', FILE_UPLOAD_PROGRESS_INTERVAL=60)
+    def test_updates_are_rate_limited(self):
+        tracker = ProgressTracker('upload-0003', total=100)
+        for _ in range(10):
+            tracker.advance(5)
+
+        self.assertEqual(get_progress('upload-0003')['received'], 0)
+        tracker.finish('received')
+        self.assertEqual(get_progress('upload-0003')['received'], 100)
+
+
+@override_settings(FILE_UPLOAD_MEMORY_BUDGET=1024 * 1024, FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT=0.05)
+class AdmissionControlTest(TestCase):
+    def test_budget_waits_then_rejects(self):
+        budget = MemoryBudget(100, queue_timeout=0.05)
+        reserved = budget.acquire(80)
+
+        with self.assertRaises(AdmissionRejected):
+            budget.acquire(30)
+        budget.release(reserved, held_seconds=3.2)
+
+        self.assertEqual(budget.acquire(30), 30)
+        self.assertEqual(budget.snapshot()['rejected'], 1)
+        self.assertEqual(budget.retry_after(), 4)
+
+    def test_upload_rejected_with_retry_after_when_budget_is_used(self):
+        budget = get_memory_budget()
+        reserved = budget.acquire(budget.budget)
+        try:
+            response = self.client.put('/api/files/raw/notes.txt', data=b'x' * 10, content_type='text/plain')
+        finally:
+            budget.release(reserved, held_seconds=0)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertIn('file_upload_memory_budget_bytes 1048576', self.client.get('/metrics/').content.decode())
+        self.assertEqual(self.client.get('/health-check/').json()['upload_memory']['in_use_bytes'], 0)
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def _upload(self, key, path='/api/files/raw/notes.txt'):
+        return self.client.put(path, data=b'data', content_type='text/plain', headers={'Idempotency-Key': key})
+
+    def test_retries_get_the_original_response(self):
+        first = self._upload('key-1')
+        retry = self._upload('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+        self.assertEqual(self._upload('key-1', '/api/files/raw/other.txt').status_code, 422)
+
+    def test_keys_are_scoped_to_the_client_and_body(self):
+        self.assertEqual(self._upload('key-5').status_code, 201)
+        other_client = self.client.put(
+            '/api/files/raw/notes.txt', data=b'data', content_type='text/plain',
+            headers={'Idempotency-Key': 'key-5', 'X-API-Key': 'other'},
+        )
+        self.assertEqual(other_client.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', other_client)
+        self.assertEqual(UploadedFile.objects.count(), 2)
+
+        longer_body = self.client.put(
+            '/api/files/raw/notes.txt', data=b'more data', content_type='text/plain',
+            headers={'Idempotency-Key': 'key-5'},
+        )
+        self.assertEqual(longer_body.status_code, 422)
+
+    def test_delete_retry_and_multipart_upload(self):
+        response = self.client.post(
+            '/api/files/upload/',
+            {'file': SimpleUploadedFile('notes.txt', b'data', content_type='text/plain')},
+            headers={'Idempotency-Key': 'key-2'},
+        )
+        self.assertEqual(response.status_code, 201)
+        path = f"/api/files/files/{response.json()['id']}/"
+
+        self.assertEqual(self.client.delete(path, headers={'Idempotency-Key': 'key-3'}).status_code, 204)
+        self.assertEqual(self.client.delete(path, headers={'Idempotency-Key': 'key-3'}).status_code, 204)
+        self.assertEqual(self.client.delete(path).status_code, 404)
+
+    @override_settings(FILE_UPLOAD_IDEMPOTENCY_WAIT=0.1, FILE_UPLOAD_IDEMPOTENCY_POLL_INTERVAL=0.02)
+    def test_in_flight_duplicate_waits_then_conflicts(self):
+        request = RequestFactory().put('/api/files/raw/notes.txt', data=b'data', content_type='text/plain')
+        IdempotencyKey.objects.create(
+            key=scoped_key(request, 'key-4'), fingerprint=fingerprint(request), locked_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+        self.assertEqual(self._upload('key-4').status_code, 409)
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+class SignedUrlTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        os.makedirs(os.path.join(self.temp_dir.name, 'documents'))
+        with open(os.path.join(self.temp_dir.name, 'documents', 'report.txt'), 'wb') as f:
+            f.write(b'signed content')
+
+    def test_signed_url_is_served_without_queries(self):
+        url = signing.sign_url('local', 'documents/report.txt', 120)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'signed content')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertTrue(response['Cache-Control'].startswith('private, max-age='))
+        self.assertEqual(signing.sign_url('local', 'documents/report.txt', 120), url)
+
+    def test_tampered_and_expired_urls_are_rejected(self):
+        url = signing.sign_url('local', 'documents/report.txt', 120)
+        path, query = url.split('?')
+        params = dict(pair.split('=', 1) for pair in query.split('&'))
+
+        self.assertEqual(self.client.get(url.replace('report', 'secret')).status_code, 403)
+        self.assertEqual(self.client.get(f"{path}?expires={int(params['expires']) + 60}&sig={params['sig']}").status_code, 403)
+        self.assertEqual(self.client.get(path).status_code, 403)
+
+        expired = int(time.time()) - 1
+        signature = signing.signature('local', 'documents/report.txt', expired)
+        self.assertFalse(signing.verify('local', 'documents/report.txt', str(expired), signature))
+        self.assertEqual(self.client.get(f'{path}?expires={expired}&sig={signature}').status_code, 403)
+
+    def test_local_file_urls_are_signed(self):
+        uploaded_file = UploadedFile.objects.create(
+            original_filename='report.txt',
+            file_type='document',
+            file_size=14,
+            storage_backend='local',
+            local_path='documents/report.txt',
+            public_url='/media/documents/report.txt',
+        )
+
+        response = self.client.get(f'/api/files/files/{uploaded_file.id}/url/')
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertTrue(response.json()['url'].startswith('/api/files/signed/local/documents/report.txt?expires='))
+        self.assertEqual(self.client.get(response.json()['url']).status_code, 200)
+
+        with override_settings(FILE_UPLOAD_LOCAL_SIGNED_URLS=False):
+            self.assertEqual(LocalStorage().get_file_url(uploaded_file), '/media/documents/report.txt')
+
+
+class FileEventTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _create(self, request_id='batch'):
+        return UploadedFile.objects.create(
+            request_id=request_id,
+            original_filename='report.pdf',
+            file_type='document',
+            file_size=10,
+            storage_backend='local',
+            local_path='documents/report.pdf',
+            public_url='http://testserver/media/documents/report.pdf',
+        )
+
+    def test_events_are_written_with_the_change(self):
+        uploaded_file = self._create()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self._create()
+            raise RuntimeError
+        file_id = uploaded_file.id
+        uploaded_file.delete()
+
+        events = list(FileEvent.objects.order_by('id'))
+        self.assertEqual([event.event_type for event in events], [FileEvent.FILE_CREATED, FileEvent.FILE_DELETED])
+        self.assertEqual({event.file_id for event in events}, {file_id})
+        self.assertEqual(events[0].payload['original_filename'], 'report.pdf')
+
+    @override_settings(FILE_UPLOAD_EVENTS_SSE_TIMEOUT=0)
+    def test_stream_filters_by_request_id_and_resumes(self):
+        first, second = self._create(), self._create()
+        self._create('other')
+        last_seen = FileEvent.objects.get(file_id=first.id).pk
+
+        response = self.client.get('/api/files/events/?request_id=batch', headers={'Last-Event-ID': str(last_seen)})
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        messages = [line for line in body.split('\n') if line.startswith('data: ')]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(json.loads(messages[0][6:])['file_id'], str(second.id))
+        self.assertEqual(self.client.get('/api/files/events/').status_code, 400)
+
+    @override_settings(FILE_UPLOAD_WEBHOOK_URL='https://hooks.example.com/files', FILE_UPLOAD_WEBHOOK_SECRET='secret')
+    def test_webhook_batches_are_signed_and_retried(self):
+        self._create()
+        self._create()
+
+        with patch('file_upload.services.event_service.requests.post') as post:
+            post.return_value.status_code = 503
+            self.assertEqual(EventService.dispatch(), {'batches': 1, 'delivered': 0, 'failed': 2})
+            event = FileEvent.objects.first()
+            self.assertEqual(event.attempts, 1)
+            self.assertGreater(event.next_attempt_at, timezone.now())
+
+            FileEvent.objects.update(next_attempt_at=timezone.now())
+            post.return_value.status_code = 200
+            self.assertEqual(EventService.dispatch(), {'batches': 1, 'delivered': 2, 'failed': 0})
+
+        body = post.call_args.kwargs['data']
+        timestamp = post.call_args.kwargs['headers']['X-Webhook-Signature'].split(',')[0][2:]
+        self.assertEqual(
+            post.call_args.kwargs['headers']['X-Webhook-Signature'], EventService.signature(body, int(timestamp))
+        )
+        self.assertEqual(len(json.loads(body)['events']), 2)
+        self.assertFalse(FileEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    @override_settings(FILE_UPLOAD_WEBHOOK_URL='https://hooks.example.com/files')
+    def test_webhooks_are_posted_outside_a_transaction_under_a_lease(self):
+        self._create()
+        leased = self._create()
+        FileEvent.objects.filter(file_id=leased.id).update(locked_until=timezone.now() + timedelta(minutes=1))
+
+        # The test case's own transactions
+        depth = len(transaction.get_connection().atomic_blocks)
+
+        def post(url, data, **kwargs):
+            self.assertEqual(len(transaction.get_connection().atomic_blocks), depth)
+            self.assertEqual(len(json.loads(data)['events']), 1)
+            self.assertEqual(FileEvent.objects.filter(locked_until__gt=timezone.now()).count(), 2)
+            return HttpResponse(status=200)
+
+        with patch('file_upload.services.event_service.requests.post', side_effect=post):
+            self.assertEqual(EventService.dispatch(), {'batches': 1, 'delivered': 1, 'failed': 0})
+
+        self.assertEqual(FileEvent.objects.filter(delivered_at__isnull=True).get().file_id, leased.id)
+        self.assertIsNone(FileEvent.objects.exclude(delivered_at__isnull=True).get().locked_until)
+
+
+@override_settings(
+    FILE_UPLOAD_CLOUDINARY_ASYNC=True,
+    FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE=0,
+    FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL='https://files.example.com/api/files/cloudinary/notifications/',
+    FILE_UPLOAD_CLOUDINARY_EAGER={'video': [{'width': 640, 'crop': 'limit', 'format': 'mp4'}]},
+)
+class CloudinaryAsyncUploadTest(TestCase):
+    def setUp(self):
+        config = cloudinary.config()
+        previous = (config.cloud_name, config.api_secret)
+        cloudinary.config(cloud_name='demo', api_secret='cloudinary-secret')
+        self.addCleanup(lambda: cloudinary.config(cloud_name=previous[0], api_secret=previous[1]))
+
+    def _notify(self, payload, secret='cloudinary-secret'):
+        body = json.dumps(payload)
+        timestamp = str(int(time.time()))
+        signature = cloudinary.utils.compute_hex_hash(f'{body}{timestamp}{secret}', cloudinary.config().signature_algorithm)
+        return self.client.post(
+            '/api/files/cloudinary/notifications/', data=body, content_type='application/json',
+            headers={'X-Cld-Timestamp': timestamp, 'X-Cld-Signature': signature},
+        )
+
+    def test_upload_does_not_wait_for_processing(self):
+        with patch('file_upload.storages.cloudinary_storage.cloudinary.uploader.upload') as upload:
+            upload.return_value = {'status': 'pending', 'public_id': 'videos/clip_batch', 'batch_id': 'b1'}
+            result = CloudinaryStorage().upload_file(
+                SimpleUploadedFile('clip.mp4', b'video'), 'clip.mp4', 'video', request_id='batch'
+            )
+
+        params = upload.call_args.kwargs
+        self.assertTrue(params['async'])
+        self.assertEqual(params['resource_type'], 'video')
+        self.assertEqual(params['eager'], [{'width': 640, 'crop': 'limit', 'format': 'mp4'}])
+        self.assertEqual(params['notification_url'], params['eager_notification_url'])
+        self.assertEqual(result['storage_id'], 'videos/clip_batch')
+        self.assertEqual(result['metadata']['processing'], CloudinaryStorage.PROCESSING_PENDING)
+        self.assertTrue(result['public_url'].startswith('https://res.cloudinary.com/demo/video/upload/'))
+
+    def test_notifications_fill_in_metadata(self):
+        uploaded_file = UploadedFile.objects.create(
+            request_id='batch',
+            original_filename='clip.mp4',
+            file_type='video',
+            file_size=5,
+            storage_backend='cloudinary',
+            cloudinary_public_id='videos/clip_batch',
+            public_url='https://res.cloudinary.com/demo/video/upload/videos/clip_batch',
+            metadata={'processing': 'pending', 'eager_pending': True},
+        )
+        upload = {
+            'notification_type': 'upload', 'public_id': 'videos/clip_batch', 'width': 1920, 'height': 1080,
+            'format': 'mp4', 'bytes': 5, 'duration': 12.5,
+            'secure_url': 'https://res.cloudinary.com/demo/video/upload/v1/videos/clip_batch.mp4',
+        }
+        eager = {
+            'notification_type': 'eager', 'public_id': 'videos/clip_batch',
+            'eager': [{'transformation': 'c_limit,w_640/mp4', 'width': 640, 'height': 360,
+                       'secure_url': 'https://res.cloudinary.com/demo/video/upload/c_limit,w_640/videos/clip_batch.mp4'}],
+        }
+
+        self.assertEqual(self._notify(upload).status_code, 200)
+        uploaded_file.refresh_from_db()
+        self.assertEqual(uploaded_file.metadata['processing'], 'pending')
+        self.assertEqual(uploaded_file.metadata['width'], 1920)
+        self.assertTrue(uploaded_file.public_url.endswith('clip_batch.mp4'))
+
+        self.assertEqual(self._notify(eager).status_code, 200)
+        self.assertEqual(self._notify(eager).status_code, 200)
+        uploaded_file.refresh_from_db()
+        self.assertEqual(uploaded_file.metadata['processing'], 'complete')
+        self.assertEqual(uploaded_file.metadata['derived'][0]['width'], 640)
+        self.assertEqual(FileEvent.objects.filter(event_type=FileEvent.FILE_PROCESSED).count(), 1)
+
+    def test_unsigned_notifications_are_rejected(self):
+        payload = {'notification_type': 'upload', 'public_id': 'videos/missing'}
+        self.assertEqual(self._notify(payload, secret='wrong').status_code, 403)
+        self.assertEqual(self._notify({'notification_type': 'upload'}).status_code, 400)
+        self.assertFalse(CloudinaryNotification.objects.exists())
+
+    def test_notification_before_the_file_is_recorded_is_applied_on_insert(self):
+        payload = {'notification_type': 'upload', 'public_id': 'videos/early_batch', 'width': 1280, 'duration': 3.0}
+        self.assertEqual(self._notify(payload).status_code, 202)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uploaded_file = UploadedFile.objects.create(
+                original_filename='early.mp4',
+                file_type='video',
+                file_size=5,
+                storage_backend='cloudinary',
+                cloudinary_public_id='videos/early_batch',
+                public_url='https://res.cloudinary.com/demo/video/upload/videos/early_batch',
+                metadata={'processing': 'pending', 'eager_pending': False},
+            )
+
+        uploaded_file.refresh_from_db()
+        self.assertEqual(uploaded_file.metadata['width'], 1280)
+        self.assertEqual(uploaded_file.metadata['processing'], 'complete')
+        self.assertFalse(CloudinaryNotification.objects.exists())
+
+    def test_media_files_may_exceed_the_file_size_limit(self):
+        with override_settings(MAX_FILE_SIZE=10, MAX_MEDIA_FILE_SIZE=100):
+            self.assertEqual(max_file_size('clip.mp4'), 100)
+            self.assertEqual(max_file_size('notes.txt'), 10)
+            response = self.client.put('/api/files/raw/song.mp3', data=b'x' * 101, content_type='audio/mpeg')
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(
+                self.client.post('/api/files/upload/', {'file': SimpleUploadedFile('notes.txt', b'x' * 11)}).status_code,
+                400
+            )
+
+
+@override_settings(FILE_UPLOAD_COMPRESSION_ENABLED=True, FILE_UPLOAD_COMPRESSION_ALGORITHM='gzip')
+class CompressionTest(TestCase):
+    CSV = b''.join(b'%d,report,2024-01-01,ok\n' % index for index in range(5000))
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_only_compressible_content_is_compressed(self):
+        self.assertEqual(compression.choose_encoding(self.CSV[:65536], 'export.csv', len(self.CSV)), 'gzip')
+        self.assertIsNone(compression.choose_encoding(self.CSV[:100], 'small.csv', 100))
+        self.assertIsNone(compression.choose_encoding(self.CSV[:65536], 'export.docx', len(self.CSV)))
+        self.assertIsNone(compression.choose_encoding(b'PK\x03\x04' + self.CSV[:65536], 'export.csv'))
+        self.assertIsNone(compression.choose_encoding(os.urandom(65536), 'random.bin', 65536))
+
+    def test_compressed_upload_is_served_encoded_or_decoded(self):
+        uploaded_file = UploadedFile.objects.create(
+            original_filename='export.csv',
+            file_type='document',
+            file_size=len(self.CSV),
+            storage_backend='local',
+            public_url='/media/documents/export.csv',
+        )
+        result = LocalStorage().upload_file(SimpleUploadedFile('export.csv', self.CSV), 'export.csv', 'document')
+        uploaded_file.local_path = result['storage_id']
+        uploaded_file.metadata = result['metadata']
+        uploaded_file.save()
+
+        self.assertTrue(result['storage_id'].endswith('.csv.gz'))
+        self.assertEqual(result['metadata']['compression']['encoding'], 'gzip')
+        stored_size = os.path.getsize(os.path.join(self.temp_dir.name, result['storage_id']))
+        self.assertEqual(result['metadata']['compression']['stored_size'], stored_size)
+        self.assertLess(stored_size * 4, len(self.CSV))
+
+        url = LocalStorage().get_file_url(uploaded_file)
+        encoded = self.client.get(url, headers={'Accept-Encoding': 'br, gzip'})
+        self.assertEqual(encoded['Content-Encoding'], 'gzip')
+        self.assertEqual(encoded['Content-Type'], 'text/csv')
+        self.assertEqual(gzip.decompress(b''.join(encoded.streaming_content)), self.CSV)
+
+        plain = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(plain.streaming_content), self.CSV)
+
+        archive = self.client.get(f'/api/files/files/archive/?ids={uploaded_file.id}')
+        with zipfile.ZipFile(io.BytesIO(b''.join(archive.streaming_content))) as zf:
+            self.assertEqual(zf.read('export.csv'), self.CSV)
+
+    def test_streams_round_trip_without_seeking(self):
+        class Unseekable(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                return self.data.readinto(buffer)
+
+        stream, encoding = compression.prepare(Unseekable(self.CSV), 'export.csv')
+        compressed = compression.CompressingReader(stream, encoding).read()
+        self.assertEqual(compression.decoded(io.BytesIO(compressed), encoding).read(), self.CSV)
+
+    def test_gz_upload_stored_as_is_is_not_sent_with_content_encoding(self):
+        result = LocalStorage().upload_file(SimpleUploadedFile('logs.gz', gzip.compress(self.CSV)), 'logs.gz', 'document')
+        uploaded_file = UploadedFile.objects.create(
+            original_filename='logs.gz',
+            file_size=10,
+            storage_backend='local',
+            local_path=result['storage_id'],
+            public_url=result['public_url'],
+            metadata=result['metadata'],
+        )
+
+        response = self.client.get(LocalStorage().get_file_url(uploaded_file), headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('compression', result['metadata'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.CSV)
+
+    @override_settings(FILE_UPLOAD_LOCAL_SIGNED_URLS=False)
+    def test_compressed_files_get_signed_urls_when_local_urls_are_unsigned(self):
+        result = LocalStorage().upload_file(SimpleUploadedFile('export.csv', self.CSV), 'export.csv', 'document')
+        uploaded_file = UploadedFile(
+            storage_backend='local', local_path=result['storage_id'],
+            public_url=result['public_url'], metadata=result['metadata'],
+        )
+
+        url = LocalStorage().get_file_url(uploaded_file)
+
+        self.assertIn('encoding=gzip', url)
+        plain = self.client.get(url)
+        self.assertEqual(b''.join(plain.streaming_content), self.CSV)
+
+    def test_migrating_a_compressed_s3_object_stores_the_original_content(self):
+        from file_upload.management.migratefiles import Command
+
+        uploaded_file = UploadedFile.objects.create(
+            original_filename='export.csv', file_type='document', file_size=len(self.CSV),
+            storage_backend='s3', s3_key='documents/export.csv.gz',
+            public_url='https://bucket.s3.amazonaws.com/documents/export.csv.gz',
+            metadata={'compression': {'encoding': 'gzip', 'stored_size': 1000}},
+        )
+        response = patch('requests.get').start()
+        self.addCleanup(patch.stopall)
+        response.return_value.__enter__.return_value.status_code = 200
+        response.return_value.__enter__.return_value.raw = io.BytesIO(gzip.compress(self.CSV))
+
+        Command(stdout=io.StringIO()).handle(from_backend='s3', to_backend='local', dry_run=False)
+
+        uploaded_file.refresh_from_db()
+        self.assertEqual(uploaded_file.storage_backend, 'local')
+        with LocalStorage().open_file(uploaded_file) as stream:
+            content = compression.decoded(stream, compression.encoding_for(uploaded_file)).read()
+        self.assertEqual(content, self.CSV)
+
+
+@override_settings(
+    FILE_UPLOAD_STORAGE_BACKEND='chunks',
+    FILE_UPLOAD_CHUNK_STORE_BACKEND='local',
+    FILE_UPLOAD_CHUNK_STORE_MIN_SIZE=2048,
+    FILE_UPLOAD_CHUNK_STORE_AVG_SIZE=8192,
+    FILE_UPLOAD_CHUNK_STORE_MAX_SIZE=32768,
+)
+class ChunkStoreTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(FILE_UPLOAD_CHUNK_STORE_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.content = os.urandom(400 * 1024)
+
+    def test_new_version_only_stores_changed_chunks(self):
+        first = FileUploadService.upload_file(SimpleUploadedFile('data.bin', self.content), request_id='versioned')
+        self.assertEqual(first.storage_backend, 'chunks')
+        self.assertTrue(first.manifest_key)
+        self.assertEqual(first.metadata['chunk_store']['new_chunks'], first.metadata['chunk_store']['chunks'])
+
+        edited = self.content[:200000] + b'inserted bytes' + self.content[200000:]
+        second = FileUploadService.upload_file(
+            SimpleUploadedFile('data.bin', edited), request_id='versioned', previous_version=first
+        )
+        self.assertEqual(second.version, 2)
+        self.assertEqual(second.previous_version, first)
+        stats = second.metadata['chunk_store']
+        self.assertLessEqual(stats['new_chunks'], 3)
+        self.assertLess(stats['new_bytes'], len(edited) // 4)
+
+    def test_reads_reassemble_the_file(self):
+        uploaded_file = FileUploadService.upload_file(SimpleUploadedFile('data.bin', self.content), request_id='reads')
+        storage = ChunkStorage()
+
+        with storage.open_file(uploaded_file) as stream:
+            self.assertEqual(stream.read(), self.content)
+        self.assertEqual(storage.read_range(uploaded_file, 12345, 70000), self.content[12345:82345])
+        self.assertEqual(storage.read_range(uploaded_file, len(self.content) - 10, 100), self.content[-10:])
+
+        response = self.client.get(FileUploadService.get_file_url(uploaded_file))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        digest = storage.read_manifest(uploaded_file.manifest_key)['chunks'][0][0]
+        os.remove(storage.blobs._path(storage._chunk_key(digest)))
+        with self.assertRaises(StorageError) as raised:
+            storage.read_range(uploaded_file, 0, 10)
+        self.assertFalse(raised.exception.retryable)
+
+    def test_garbage_collection_keeps_referenced_chunks(self):
+        kept = FileUploadService.upload_file(SimpleUploadedFile('kept.bin', self.content), request_id='gc')
+        dropped = FileUploadService.upload_file(SimpleUploadedFile('dropped.bin', os.urandom(100 * 1024)), request_id='gc')
+        storage = ChunkStorage()
+        self.assertTrue(storage.delete_file(dropped))
+
+        self.assertEqual(storage.collect_garbage(grace_seconds=3600)['deleted_chunks'], 0)
+        dry_run = storage.collect_garbage(grace_seconds=0, dry_run=True)
+        self.assertGreater(dry_run['deleted_chunks'], 0)
+        result = storage.collect_garbage(grace_seconds=0)
+        self.assertEqual(result['deleted_chunks'], dry_run['deleted_chunks'])
+        self.assertEqual(storage.collect_garbage(grace_seconds=0)['deleted_chunks'], 0)
+
+        with storage.open_file(kept) as stream:
+            self.assertEqual(stream.read(), self.content)
+
+    def test_delete_removes_the_manifest_when_another_backend_is_the_default(self):
+        uploaded_file = FileUploadService.upload_file(SimpleUploadedFile('data.bin', self.content), request_id='delete')
+        storage = ChunkStorage()
+
+        with override_settings(FILE_UPLOAD_STORAGE_BACKEND='local'):
+            self.assertTrue(FileUploadService.delete_file(uploaded_file))
+
+        self.assertFalse(UploadedFile.objects.filter(pk=uploaded_file.pk).exists())
+        self.assertEqual(list(storage.list_files()), [])
+
+    def test_new_version_refreshes_or_rewrites_the_previous_chunks(self):
+        first = FileUploadService.upload_file(SimpleUploadedFile('data.bin', self.content), request_id='refresh')
+        storage = ChunkStorage()
+        paths = [
+            storage.blobs._path(storage._chunk_key(digest))
+            for digest, _ in storage.read_manifest(first.manifest_key)['chunks']
+        ]
+        for path in paths:
+            os.utime(path, (time.time() - 7200, time.time() - 7200))
+        os.remove(paths[0])
+
+        edited = self.content + b'appended bytes'
+        second = FileUploadService.upload_file(
+            SimpleUploadedFile('data.bin', edited), request_id='refresh', previous_version=first
+        )
+        # The previous version going away cannot take chunks of the new one with it
+        self.assertTrue(storage.delete_file(first))
+        storage.collect_garbage(grace_seconds=3600)
+        for digest, _ in storage.read_manifest(second.manifest_key)['chunks']:
+            self.assertGreater(os.path.getmtime(storage.blobs._path(storage._chunk_key(digest))), time.time() - 3600)
+        with storage.open_file(second) as stream:
+            self.assertEqual(stream.read(), edited)
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class NearDuplicateImageTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    @staticmethod
+    def _image(seed, size=(640, 480), fmt='PNG', **options):
+        rng = random.Random(seed)
+        img = Image.new('RGB', (640, 480), (rng.randrange(256),) * 3)
+        draw = ImageDraw.Draw(img)
+        for _ in range(20):
+            x, y = rng.randrange(640), rng.randrange(480)
+            draw.ellipse([x, y, x + rng.randrange(40, 240), y + rng.randrange(40, 240)],
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        output = io.BytesIO()
+        img.resize(size).save(output, fmt, **options)
+        return output.getvalue()
+
+    def test_backfill_indexes_stored_images(self):
+        content = self._image(3)
+        result = LocalStorage().upload_file(SimpleUploadedFile('old.png', content), 'old.png', 'image')
+        uploaded_file = UploadedFile.objects.create(
+            request_id='backfill', original_filename='old.png', file_type='image', file_size=len(content),
+            storage_backend='local', local_path=result['storage_id'], public_url=result['public_url'],
+        )
+        etag = FileCacheService.etag(uploaded_file)
+
+        self.assertEqual(ImageHashService.backfill(workers=2), {'hashed': 1, 'unreadable': 0, 'failed': 0})
+
+        uploaded_file.refresh_from_db()
+        self.assertTrue(ImageHash.objects.filter(uploaded_file=uploaded_file).exists())
+        self.assertIn(ImageHashService.METADATA_KEY, uploaded_file.metadata)
+        self.assertNotEqual(FileCacheService.etag(uploaded_file), etag)
+        self.assertEqual(ImageHashService.backfill(workers=2), {'hashed': 0, 'unreadable': 0, 'failed': 0})
+
+    def test_hashes_survive_resizing_and_reencoding(self):
+        original = compute_image_hashes(io.BytesIO(self._image(1)))
+        copy = compute_image_hashes(io.BytesIO(self._image(1, size=(320, 240), fmt='JPEG', quality=50)))
+        other = compute_image_hashes(io.BytesIO(self._image(2)))
+
+        self.assertLessEqual((original[0] ^ copy[0]).bit_count(), 4)
+        self.assertGreater((original[0] ^ other[0]).bit_count(), 15)
+        self.assertIsNone(compute_image_hashes(io.BytesIO(b'not an image')))
+
+    def test_similar_files_api_returns_near_duplicates(self):
+        original = FileUploadService.upload_file(SimpleUploadedFile('photo.png', self._image(1)), request_id='acme:1')
+        copy = FileUploadService.upload_file(
+            SimpleUploadedFile('photo-small.jpg', self._image(1, size=(320, 240), fmt='JPEG', quality=60)),
+            request_id='acme:2'
+        )
+        FileUploadService.upload_file(SimpleUploadedFile('other.png', self._image(2)), request_id='acme:3')
+        # Same picture, other tenant
+        FileUploadService.upload_file(SimpleUploadedFile('photo.png', self._image(1)), request_id='other:1')
+
+        self.assertEqual(ImageHash.objects.count(), 4)
+        self.assertIn('phash', original.metadata['image_hash'])
+
+        response = self.client.get(f'/api/files/files/{original.id}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(copy.id)])
+
+        too_wide = self.client.get(f'/api/files/files/{original.id}/similar/?max_distance=16')
+        self.assertEqual(too_wide.status_code, 400)
+
+    @override_settings(FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD=True)
+    def test_upload_is_answered_with_a_stored_near_duplicate(self):
+        first = self.client.post('/api/files/upload/', {'file': SimpleUploadedFile('photo.png', self._image(1))})
+        self.assertEqual(first.status_code, 201)
+
+        again = self.client.post(
+            '/api/files/upload/',
+            {'file': SimpleUploadedFile('copy.jpg', self._image(1, size=(480, 360), fmt='JPEG', quality=70))}
+        )
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertIn('near_duplicate_distance', again.json())
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+        different = self.client.post('/api/files/upload/', {'file': SimpleUploadedFile('other.png', self._image(2))})
+        self.assertEqual(different.status_code, 201)
+
+    @override_settings(FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD=True)
+    def test_raw_uploads_are_hashed_and_deduplicated_like_multipart_ones(self):
+        first = self.client.put('/api/files/raw/photo.png', data=self._image(1), content_type='image/png')
+        self.assertEqual(first.status_code, 201)
+        self.assertIn('phash', first.json()['metadata']['image_hash'])
+        self.assertIsNotNone(first.json()['placeholder'])
+
+        again = self.client.put(
+            '/api/files/raw/copy.jpg', data=self._image(1, size=(480, 360), fmt='JPEG', quality=70),
+            content_type='image/jpeg'
+        )
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertIn('near_duplicate_distance', again.json())
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class ImagePlaceholderTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    @staticmethod
+    def _photo(size=(1600, 900), color=(30, 90, 200)):
+        img = Image.new('RGB', size, color)
+        ImageDraw.Draw(img).rectangle([0, 0, size[0] // 4, size[1] // 4], fill=(240, 200, 20))
+        output = io.BytesIO()
+        img.save(output, 'JPEG', quality=90)
+        return output.getvalue()
+
+    def test_image_upload_returns_placeholder(self):
+        response = self.client.post('/api/files/upload/', {'file': SimpleUploadedFile('photo.jpg', self._photo())})
+        self.assertEqual(response.status_code, 201)
+
+        placeholder = response.json()['placeholder']
+        self.assertTrue(placeholder['data_uri'].startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(base64.b64decode(placeholder['data_uri'].split(',', 1)[1])), 1024)
+        self.assertEqual((placeholder['width'], placeholder['height']), (16, 9))
+        self.assertEqual(placeholder['aspect_ratio'], round(1600 / 900, 4))
+        red, green, blue = (int(placeholder['color'][i:i + 2], 16) for i in (1, 3, 5))
+        self.assertLess(abs(red - 30) + abs(green - 90) + abs(blue - 200), 30)
+
+        document = self.client.post('/api/files/upload/', {'file': SimpleUploadedFile('notes.txt', b'notes')})
+        self.assertIsNone(document.json()['placeholder'])
+
+    def test_transparent_images_are_flattened_and_size_is_bounded(self):
+        img = Image.new('RGBA', (300, 300), (0, 0, 0, 0))
+        ImageDraw.Draw(img).ellipse([100, 100, 200, 200], fill=(200, 0, 0, 255))
+        output = io.BytesIO()
+        img.save(output, 'PNG')
+
+        placeholder = compute_placeholder(io.BytesIO(output.getvalue()), size=64, max_bytes=600)
+        self.assertEqual(placeholder['color'], '#ffffff')
+        self.assertLessEqual(len(base64.b64decode(placeholder['data_uri'].split(',', 1)[1])), 600)
+        self.assertIsNone(compute_placeholder(io.BytesIO(b'not an image')))
+
+    def test_backfill_covers_stored_images(self):
+        storage = LocalStorage()
+        uploaded = []
+        for name, content in (('old.jpg', self._photo()), ('broken.jpg', b'not a jpeg')):
+            result = storage.upload_file(SimpleUploadedFile(name, content), name, 'image')
+            uploaded.append(UploadedFile.objects.create(
+                request_id='backfill', original_filename=name, file_type='image', file_size=len(content),
+                storage_backend='local', local_path=result['storage_id'], public_url=result['public_url'],
+            ))
+
+        counts = PlaceholderService.backfill(workers=2)
+        self.assertEqual(counts, {'created': 1, 'unreadable': 1, 'failed': 0})
+        photo, broken = (UploadedFile.objects.get(pk=f.pk) for f in uploaded)
+        self.assertIn('data_uri', photo.metadata['placeholder'])
+        self.assertIn('error', broken.metadata['placeholder'])
+        self.assertNotEqual(FileCacheService.etag(photo), FileCacheService.etag(uploaded[0]))
+        self.assertEqual(PlaceholderService.backfill(workers=2), {'created': 0, 'unreadable': 0, 'failed': 0})
+
+    def test_backfill_failures_are_reported_by_the_command(self):
+        missing = UploadedFile.objects.create(
+            original_filename='gone.jpg', file_type='image', file_size=10,
+            storage_backend='local', local_path='images/gone.jpg', public_url='/media/images/gone.jpg',
+        )
+        stdout, stderr = io.StringIO(), io.StringIO()
+
+        call_command('buildplaceholders', workers=1, stdout=stdout, stderr=stderr)
+
+        self.assertIn(f'{missing.id} gone.jpg: Local storage read failed', stderr.getvalue())
+        self.assertIn('0 unreadable, 1 failed', stdout.getvalue())
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class IngestTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=os.path.join(self.temp_dir.name, 'media'))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.source = os.path.join(self.temp_dir.name, 'source')
+        for name in ('a.txt', 'b/c.txt', 'b/d/e.txt', 'f.txt', '.hidden'):
+            path = os.path.join(self.source, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(f"contents of {name}")
+        self.checkpoint = os.path.join(self.temp_dir.name, 'ingest.json')
+
+    def test_directory_ingest_writes_records_usage_and_events_in_bulk(self):
+        progress = IngestService.ingest(self.source, checkpoint=self.checkpoint, request_id='acme:bulk', batch_size=3)
+
+        self.assertEqual((progress['files'], progress['failed'], progress['batches']), (4, 0, 2))
+        files = UploadedFile.objects.order_by('original_filename')
+        self.assertEqual([f.metadata['source_path'] for f in files], ['a.txt', 'b/c.txt', 'b/d/e.txt', 'f.txt'])
+        self.assertTrue(all(f.local_path and f.original_filename in f.search_text for f in files))
+        usage = StorageUsage.objects.get(tenant='acme')
+        self.assertEqual((usage.file_count, usage.total_bytes), (4, progress['bytes']))
+        self.assertEqual(FileEvent.objects.filter(event_type=FileEvent.FILE_CREATED).count(), 4)
+
+    def test_upload_writes_the_record_once(self):
+        with patch.object(UploadedFile, 'save', autospec=True, side_effect=UploadedFile.save) as save:
+            FileUploadService.upload_file(SimpleUploadedFile('once.txt', b'once'), 'single')
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(UploadedFile.objects.filter(request_id='single').count(), 1)
+
+    def test_interrupted_ingest_resumes_from_checkpoint(self):
+        first = IngestService.ingest(self.source, checkpoint=self.checkpoint, batch_size=1, limit=2)
+        self.assertEqual(first['files'], 2)
+
+        second = IngestService.ingest(self.source, checkpoint=self.checkpoint, batch_size=1)
+        self.assertEqual(second['files'], 2)
+        self.assertEqual(second['request_id'], first['request_id'])
+        self.assertEqual(second['totals']['files'], 4)
+        self.assertEqual(
+            sorted(UploadedFile.objects.values_list('metadata__source_path', flat=True)),
+            ['a.txt', 'b/c.txt', 'b/d/e.txt', 'f.txt'],
+        )
+
+    def test_manifest_entries_that_fail_are_counted(self):
+        manifest = os.path.join(self.source, 'manifest.csv')
+        with open(manifest, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['path', 'file_type', 'ttl'])
+            writer.writerows([['a.txt', 'document', '3600'], ['f.txt', 'spreadsheet', ''], ['missing.txt', '', '']])
+
+        errors = []
+        progress = IngestService.ingest(manifest, on_error=lambda item, error: errors.append(item.name))
+        self.assertEqual((progress['files'], progress['failed']), (1, 2))
+        self.assertEqual(errors, ['f.txt', 'missing.txt'])
+        self.assertIsNotNone(UploadedFile.objects.get().expires_at)
+
+
+class ThrottlingTest(TestCase):
+    def test_token_buckets_report_when_they_can_cover_a_request(self):
+        store = MemoryRateLimitStore()
+        limits = {'requests': (1, 2.0, 2), 'bytes': (500, 1000.0, 800)}
+        self.assertEqual(store.take('ip:a', limits), 0)
+        # 300 bytes left, 200 short at 1000 bytes/s
+        self.assertAlmostEqual(store.take('ip:a', limits), 0.2, places=2)
+        self.assertEqual(store.take('ip:b', limits), 0)
+        # Costs above the burst are capped, so the request is not rejected for ever
+        self.assertLess(store.take('ip:c', {'bytes': (10 ** 9, 1000.0, 800)}), 0.001)
+
+    @override_settings(
+        FILE_UPLOAD_RATE_LIMIT_ENABLED=True,
+        FILE_UPLOAD_RATE_LIMIT_STORE='memory',
+        FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND=0.25,
+        FILE_UPLOAD_RATE_LIMIT_REQUEST_BURST=1,
+    )
+    def test_clients_over_their_rate_get_429_with_retry_after(self):
+        tenant = f"t{uuid.uuid4().hex[:8]}"
+
+        def upload(tenant):
+            # An unsupported extension is answered without storing anything, after throttling
+            return self.client.put('/api/files/raw/notes.exe', data=b'x', headers={'X-Tenant': tenant})
+
+        self.assertEqual(upload(tenant).status_code, 400)
+        limited = upload(tenant)
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited['Retry-After'], '4')
+        self.assertEqual(upload(f"{tenant}-other").status_code, 400)
+        self.assertIn('file_upload_throttled_total{reason="rate_limit"}', self.client.get('/metrics/').content.decode())
+
+    def test_cache_store_on_a_process_local_cache_is_flagged(self):
+        with override_settings(FILE_UPLOAD_RATE_LIMIT_ENABLED=True):
+            self.assertEqual([warning.id for warning in check_rate_limit_store()], ['file_upload.W001'])
+        with override_settings(FILE_UPLOAD_RATE_LIMIT_ENABLED=True, FILE_UPLOAD_RATE_LIMIT_STORE='memory'):
+            self.assertEqual(check_rate_limit_store(), [])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(FILE_UPLOAD_RATE_LIMIT_ENABLED=True, CACHES=shared):
+            self.assertEqual(check_rate_limit_store(), [])
+        self.assertEqual(check_rate_limit_store(), [])
+
+    def test_free_slots_go_to_the_client_with_the_lowest_start_tag(self):
+        scheduler = FairScheduler(slots=1, per_client=1, queue_timeout=2)
+        ticket = scheduler.acquire('heavy', 1000)
+        admitted = []
+
+        def upload(client):
+            client_ticket = scheduler.acquire(client, 1000)
+            admitted.append(client)
+            scheduler.release(client_ticket)
+
+        # 'heavy' queues first, but its start tag follows its running upload
+        threads = []
+        for client in ('heavy', 'light'):
+            threads.append(threading.Thread(target=upload, args=(client,)))
+            threads[-1].start()
+            while scheduler.snapshot()['waiting'] < len(threads):
+                time.sleep(0.001)
+        with self.assertRaises(Throttled) as rejected:
+            scheduler.acquire('heavy', 1000)
+        self.assertEqual(rejected.exception.reason, 'queue_full')
+
+        scheduler.release(ticket)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, ['light', 'heavy'])
+        self.assertEqual(scheduler.snapshot()['active'], 0)
+
+
+@override_settings(FILE_UPLOAD_DB_REPLICAS=['replica_0', 'replica_1'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        self.router = ReplicaRouter()
+
+    def _in_request(self, view, tenant='acme'):
+        request = RequestFactory().get('/api/files/files/', headers={'X-Tenant': tenant})
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_reads_of_uploaded_files_go_to_healthy_replicas(self):
+        with patch.object(replica_health, 'check', side_effect=lambda alias: alias == 'replica_1') as check:
+            databases = {self.router.db_for_read(UploadedFile) for _ in range(10)}
+            self.assertEqual(databases, {'replica_1'})
+            # Results are reused until the check interval passes
+            self.assertEqual(check.call_count, 2)
+        self.assertEqual(replica_health.snapshot(), {'replica_0': False, 'replica_1': True})
+        self.assertIsNone(self.router.db_for_read(FileEvent))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'file_upload'))
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        cache.clear()
+        reads = []
+
+        def upload(request):
+            self.router.db_for_write(UploadedFile)
+            reads.append(self.router.db_for_read(UploadedFile))
+            return HttpResponse()
+
+        def list_files(request):
+            reads.append(self.router.db_for_read(UploadedFile))
+            return HttpResponse()
+
+        with patch.object(replica_health, 'check', return_value=True):
+            self._in_request(list_files)
+            self._in_request(upload)
+            self._in_request(list_files)
+            self._in_request(list_files, tenant='other')
+
+        self.assertIn(reads[0], ('replica_0', 'replica_1'))
+        self.assertEqual(reads[1:3], ['default', 'default'])
+        self.assertIn(reads[3], ('replica_0', 'replica_1'))
+
+    def test_without_healthy_replicas_reads_fall_back_to_the_primary(self):
+        with patch.object(replica_health, 'check', return_value=False):
+            self.assertEqual(self.router.db_for_read(UploadedFile), 'default')
+        self.assertIn('file_upload_db_replica_fallback_total', metrics.render())
+
+
+@override_settings(FILE_UPLOAD_STORAGE_BACKEND='local')
+class ColdArchiveTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.temp_dir.name, 'media'),
+            FILE_UPLOAD_ARCHIVE_DIR=os.path.join(self.temp_dir.name, 'archive'),
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+
+    def _upload(self, name, created_at=None, **kwargs):
+        uploaded_file = FileUploadService.upload_file(SimpleUploadedFile(name, name.encode()), 'acme:old', **kwargs)
+        if created_at is not None:
+            UploadedFile.objects.filter(pk=uploaded_file.pk).update(created_at=created_at)
+        return uploaded_file
+
+    def test_cold_months_move_to_the_archive_table_and_still_resolve(self):
+        old = datetime(2024, 3, 10, 12, 30, 15, 123456, tzinfo=UTC)
+        archived = self._upload('report.pdf', old)
+        expiring = self._upload('draft.pdf', old, ttl=3600)
+        replaced = self._upload('v1.txt', old)
+        self._upload('v2.txt', previous_version=replaced)
+        recent = self._upload('recent.txt')
+        usage = list(StorageUsage.objects.values_list('file_count', 'total_bytes'))
+
+        self.assertEqual(ColdArchiveService.cold_partitions(30), [old.date().replace(day=1)])
+        self.assertEqual(ColdArchiveService.archive_partition(old.date().replace(day=1)), {'archived': 1, 'kept': 1})
+
+        self.assertEqual(
+            set(UploadedFile.objects.values_list('pk', flat=True)),
+            {expiring.pk, replaced.pk, recent.pk, UploadedFile.objects.get(original_filename='v2.txt').pk},
+        )
+        # Moving a file is not deleting it
+        self.assertEqual(list(StorageUsage.objects.values_list('file_count', 'total_bytes')), usage)
+        self.assertFalse(FileEvent.objects.filter(event_type=FileEvent.FILE_DELETED).exists())
+
+        response = self.client.get(f'/api/files/files/{archived.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['original_filename'], 'report.pdf')
+        self.assertEqual(ColdArchiveService.get(archived.pk).created_at, old)
+        self.assertEqual(ArchivedFile.objects.get().partition, old.date().replace(day=1))
+
+    def test_ndjson_archive_resolves_ids_from_compressed_members(self):
+        old = datetime(2023, 11, 5, tzinfo=UTC)
+        files = [self._upload(f"file-{index}.txt", old + timedelta(minutes=index)) for index in range(5)]
+
+        with patch.object(ColdArchiveService, 'MEMBER_RECORDS', 2):
+            counts = ColdArchiveService.archive_partition(date(2023, 11, 1), destination='ndjson', batch_size=3)
+        self.assertEqual(counts, {'archived': 5, 'kept': 0})
+        self.assertFalse(UploadedFile.objects.exists())
+
+        path = os.path.join(self.temp_dir.name, 'archive', 'uploadedfile-2023-11.ndjson.gz')
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 5)
+        self.assertEqual(len(set(ArchivedFile.objects.values_list('offset', flat=True))), 3)
+        for uploaded_file in files:
+            self.assertEqual(ColdArchiveService.get(uploaded_file.pk).original_filename, uploaded_file.original_filename)
+            self.assertIsNone(ArchivedFile.objects.get(pk=uploaded_file.pk).record)
+
+    def test_reconcile_keeps_the_stored_objects_of_archived_files(self):
+        uploaded_file = self._upload('kept.txt', datetime(2022, 6, 1, tzinfo=UTC))
+        self._upload('hot.txt')
+        ColdArchiveService.archive_partition(date(2022, 6, 1))
+        entry = ArchivedFile.objects.get()
+        self.assertEqual((entry.storage_backend, entry.storage_key), ('local', uploaded_file.local_path))
+
+        report = ReconcileService('local', fix_storage=True, min_age=timedelta(0)).reconcile()
+        self.assertEqual((report.matched, report.storage_orphans, report.deleted_objects), (2, 0, 0))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, 'media', uploaded_file.local_path)))
+
+        os.remove(os.path.join(self.temp_dir.name, 'media', uploaded_file.local_path))
+        report = ReconcileService('local', fix_records=True, min_age=timedelta(0)).reconcile()
+        self.assertEqual((report.record_orphans, report.deleted_records), (1, 1))
+        self.assertFalse(ArchivedFile.objects.exists())
+
+    def test_deleting_an_archived_file_removes_its_archive_entry(self):
+        uploaded_file = self._upload('gone.txt', datetime(2022, 1, 1, tzinfo=UTC))
+        ColdArchiveService.archive_partition(date(2022, 1, 1))
+
+        response = self.client.delete(f'/api/files/files/{uploaded_file.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ArchivedFile.objects.exists())
+        self.assertEqual(sum(StorageUsage.objects.values_list('file_count', flat=True)), 0)
+        self.assertEqual(FileEvent.objects.filter(event_type=FileEvent.FILE_DELETED).count(), 1)
+        self.assertEqual(self.client.get(f'/api/files/files/{uploaded_file.pk}/').status_code, 404)
@@ -0,0 +1,394 @@
+"""
+Per-client rate limits and fair scheduling of uploads
+
+Uploads are attributed to a client key: a hashed API key, a tenant or the
+client IP (see client_key). Each client has two token buckets, one for
+requests and one for bytes (the Content-Length), refilled continuously at
+FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND and
+FILE_UPLOAD_RATE_LIMIT_BYTES_PER_SECOND up to their burst sizes. The buckets
+live in the Django cache, which must be shared by all processes (a
+process-local cache fails the file_upload.W001 check), or in memory for
+single-process deployments. A request the buckets cannot cover is answered
+429 with a Retry-After of exactly when they will.
+
+Admitted uploads then take one of the process's FILE_UPLOAD_FAIR_SLOTS upload
+slots, at most FILE_UPLOAD_CLIENT_MAX_CONCURRENCY of them per client. When
+slots are short, waiting uploads are started in weighted fair order
+(start-time fair queuing by bytes), so a client with many large uploads
+queued delays its own uploads, not everyone else's. Client weights
+(FILE_UPLOAD_RATE_LIMIT_WEIGHTS) scale both the buckets and the fair share.
+"""
+import functools
+import hashlib
+import itertools
+import math
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from file_upload.metrics import metrics
+
+TENANT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,100}$')
+
+
+class Throttled(Exception):
+    MESSAGES = {
+        'rate_limit': 'Upload rate limit exceeded',
+        'queue_full': 'Too many uploads queued',
+        'queue_timeout': 'Too many uploads in progress',
+    }
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(f"{self.MESSAGES[reason]}, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _take(state: Optional[Dict[str, Any]], limits: Dict[str, Tuple[float, float, float]], now: float):
+    """
+    Take `cost` tokens from every bucket of `state`, or none if any is short
+
+    Args:
+        state: Bucket levels as {name: [tokens, updated_at]}, None for a new client
+        limits: {name: (cost, rate, burst)}; buckets with no rate are unlimited
+
+    Returns:
+        (new_state, wait): wait is 0 if the tokens were taken, otherwise the
+        seconds until all buckets hold enough and new_state is unchanged
+    """
+    state = state or {}
+    levels = {}
+    wait = 0.0
+    for name, (cost, rate, burst) in limits.items():
+        if not rate:
+            continue
+        tokens, updated_at = state.get(name) or (burst, now)
+        tokens = min(burst, tokens + max(now - updated_at, 0) * rate)
+        # A cost above the burst is capped to it, so any request can be admitted eventually
+        cost = min(cost, burst)
+        levels[name] = (tokens, cost, rate, burst)
+        wait = max(wait, (cost - tokens) / rate)
+
+    if wait > 0:
+        return state, wait
+
+    new_state = {'full_at': now}
+    for name, (tokens, cost, rate, burst) in levels.items():
+        new_state[name] = [tokens - cost, now]
+        new_state['full_at'] = max(new_state['full_at'], now + (burst - tokens + cost) / rate)
+    return new_state, 0.0
+
+
+class CacheRateLimitStore:
+    """Buckets in the Django cache, shared by every process"""
+
+    KEY_PREFIX = 'file_upload:ratelimit:'
+    LOCK_TIMEOUT = 0.05
+
+    def _cache(self):
+        return caches[getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')]
+
+    def take(self, client: str, limits: Dict[str, Tuple[float, float, float]]) -> float:
+        cache = self._cache()
+        key = f"{self.KEY_PREFIX}{client}"
+        # cache.add is atomic on shared caches; if the lock is not released in
+        # time the update goes ahead unlocked, which at worst lets a few
+        # concurrent requests share the same tokens
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        locked = cache.add(f"{key}:lock", 1, timeout=1)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(0.002)
+            locked = cache.add(f"{key}:lock", 1, timeout=1)
+        try:
+            now = time.time()
+            state, wait = _take(cache.get(key), limits, now)
+            if not wait:
+                # Expires once the buckets are full again, which is the same as absent
+                cache.set(key, state, timeout=max(math.ceil(state['full_at'] - now), 1))
+            return wait
+        finally:
+            if locked:
+                cache.delete(f"{key}:lock")
+
+
+class MemoryRateLimitStore:
+    """Process-local buckets; limits apply per process, not per deployment"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, client: str, limits: Dict[str, Tuple[float, float, float]]) -> float:
+        now = time.time()
+        with self._lock:
+            state, wait = _take(self._states.get(client), limits, now)
+            if not wait:
+                self._states[client] = state
+                if len(self._states) > 10000:
+                    self._states = {k: v for k, v in self._states.items() if v['full_at'] > now}
+            return wait
+
+
+_memory_store = MemoryRateLimitStore()
+
+
+# Cache backends whose entries only the process (or host) holding them sees
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+
+def check_rate_limit_store(app_configs=None, **kwargs):
+    """System check: cache-backed rate limits on a cache the processes do not share limit nothing"""
+    if not getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_ENABLED', False) \
+            or getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_STORE', 'cache') != 'cache':
+        return []
+    alias = getattr(settings, 'FILE_UPLOAD_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"Upload rate limits are kept in the '{alias}' cache ({backend.rsplit('.', 1)[-1]}), "
+        "which processes do not share, so every process applies the limits separately",
+        hint="Configure a shared cache (Redis, Memcached, database) or set FILE_UPLOAD_RATE_LIMIT_STORE='memory'.",
+        id='file_upload.W001',
+    )]
+
+
+def get_rate_limit_store():
+    if getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_STORE', 'cache') == 'memory':
+        return _memory_store
+    return CacheRateLimitStore()
+
+
+def client_key(request) -> str:
+    """
+    Key uploads of a request are limited under
+
+    The first of FILE_UPLOAD_RATE_LIMIT_KEYS the request has: 'api_key' (the
+    X-API-Key header or a bearer token, hashed), 'tenant' (the X-Tenant
+    header or `tenant` query parameter, the prefix of the request IDs it
+    creates) or 'ip' (X-Forwarded-For if FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR,
+    else the peer address).
+    """
+    for kind in getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_KEYS', ['api_key', 'tenant', 'ip']):
+        if kind == 'api_key':
+            api_key = request.headers.get('X-API-Key')
+            authorization = request.headers.get('Authorization', '')
+            if not api_key and authorization.startswith('Bearer '):
+                api_key = authorization[len('Bearer '):].strip()
+            if api_key:
+                return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+        elif kind == 'tenant':
+            tenant = request.headers.get('X-Tenant') or request.GET.get('tenant')
+            if tenant and TENANT_PATTERN.match(tenant):
+                return f"tenant:{tenant}"
+        elif kind == 'ip':
+            forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+            if forwarded and getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR', False):
+                return f"ip:{forwarded.split(',')[0].strip()}"
+            return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+    return 'anonymous'
+
+
+def client_weight(client: str) -> float:
+    return float(getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_WEIGHTS', {}).get(client, 1))
+
+
+def request_bytes(request) -> int:
+    """Bytes an upload is charged; uploads without a Content-Length are charged the maximum size"""
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    return content_length if content_length > 0 else getattr(settings, 'MAX_FILE_SIZE', 10485760)
+
+
+def check_rate_limit(client: str, size: int):
+    """
+    Charge one request and `size` bytes to the client's buckets
+
+    Raises:
+        Throttled: With the seconds until the buckets can cover the request
+    """
+    weight = client_weight(client)
+    request_rate = getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND', 5.0) * weight
+    byte_rate = getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_BYTES_PER_SECOND', 20 * 1024 * 1024) * weight
+    wait = get_rate_limit_store().take(client, {
+        'requests': (1, request_rate, getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_REQUEST_BURST', 20) * weight),
+        'bytes': (size, byte_rate, getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_BYTE_BURST', 100 * 1024 * 1024) * weight),
+    })
+    if wait:
+        raise Throttled(math.ceil(wait), 'rate_limit')
+
+
+class FairScheduler:
+    """
+    Upload slots of a process, shared between clients in weighted fair order
+
+    Every upload gets a start tag: the later of the scheduler's virtual time
+    and the finish tag of the client's previous upload, whose finish tag is
+    its start plus bytes / weight. Free slots go to the waiting upload with
+    the lowest start tag among clients below `per_client` running uploads.
+    """
+
+    def __init__(self, slots: int, per_client: int, queue_timeout: float = 5.0, max_waiting: int = 50):
+        self.slots = slots
+        self.per_client = per_client
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._running = {}
+        self._waiting = []
+        self._finish_tags = {}
+        self._virtual_time = 0.0
+        self._hold_seconds = None
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, client: str, cost: int, weight: float = 1.0):
+        """
+        Wait up to `queue_timeout` for a slot
+
+        Returns:
+            A ticket to pass to release()
+
+        Raises:
+            Throttled: If the queue is full or no slot was given in time
+        """
+        with self._condition:
+            client_waiting = sum(1 for entry in self._waiting if entry[2] == client)
+            if len(self._waiting) >= self.max_waiting or client_waiting >= self.per_client:
+                self.rejected += 1
+                raise Throttled(self.retry_after(), 'queue_full')
+
+            previous_finish = self._finish_tags.get(client, 0.0)
+            start = max(self._virtual_time, previous_finish)
+            entry = (start, next(self._sequence), client)
+            finish = self._finish_tags[client] = start + max(cost, 1) / weight
+            self._waiting.append(entry)
+            try:
+                admitted = self._condition.wait_for(lambda: self._next() == entry, timeout=self.queue_timeout)
+            finally:
+                self._waiting.remove(entry)
+            if not admitted:
+                self.rejected += 1
+                if self._finish_tags.get(client) == finish:
+                    self._finish_tags[client] = previous_finish
+                # Slots freed while this upload waited may now go to others
+                self._condition.notify_all()
+                raise Throttled(self.retry_after(), 'queue_timeout')
+
+            self._virtual_time = max(self._virtual_time, start)
+            self._running[client] = self._running.get(client, 0) + 1
+            self.active += 1
+            self.admitted += 1
+            if len(self._finish_tags) > 1000:
+                self._finish_tags = {k: v for k, v in self._finish_tags.items() if v > self._virtual_time}
+            return client, time.monotonic()
+
+    def release(self, ticket):
+        client, started = ticket
+        with self._condition:
+            self.active -= 1
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+            held_seconds = time.monotonic() - started
+            if self._hold_seconds is None:
+                self._hold_seconds = held_seconds
+            else:
+                self._hold_seconds += 0.2 * (held_seconds - self._hold_seconds)
+            self._condition.notify_all()
+
+    def _next(self):
+        if self.active >= self.slots:
+            return None
+        eligible = [entry for entry in self._waiting if self._running.get(entry[2], 0) < self.per_client]
+        return min(eligible) if eligible else None
+
+    def retry_after(self) -> int:
+        if self._hold_seconds is None:
+            return getattr(settings, 'FILE_UPLOAD_ADMISSION_RETRY_AFTER', 5)
+        # Uploads ahead of a retry drain `slots` at a time
+        rounds = math.ceil((len(self._waiting) + 1) / max(self.slots, 1))
+        return min(max(math.ceil(self._hold_seconds * rounds), 1), 60)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'slots': self.slots,
+                'active': self.active,
+                'waiting': len(self._waiting),
+                'clients': len(self._running),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_fair_scheduler() -> FairScheduler:
+    """The process-wide scheduler, recreated if its settings change"""
+    global _scheduler
+    config = (
+        getattr(settings, 'FILE_UPLOAD_FAIR_SLOTS', 8),
+        getattr(settings, 'FILE_UPLOAD_CLIENT_MAX_CONCURRENCY', 4),
+        getattr(settings, 'FILE_UPLOAD_FAIR_QUEUE_TIMEOUT', 5.0),
+        getattr(settings, 'FILE_UPLOAD_FAIR_MAX_WAITING', 50),
+    )
+    with _scheduler_lock:
+        if _scheduler is None or (
+                _scheduler.slots, _scheduler.per_client, _scheduler.queue_timeout, _scheduler.max_waiting
+        ) != config:
+            _scheduler = FairScheduler(*config)
+        return _scheduler
+
+
+def throttle_upload(view):
+    """Apply the client's rate limits and fair share to `view`, answering 429 with Retry-After when exceeded"""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not getattr(settings, 'FILE_UPLOAD_RATE_LIMIT_ENABLED', False):
+            return view(request, *args, **kwargs)
+
+        client = client_key(request)
+        size = request_bytes(request)
+        scheduler = get_fair_scheduler()
+        try:
+            check_rate_limit(client, size)
+            ticket = scheduler.acquire(client, size, client_weight(client))
+        except Throttled as e:
+            metrics.inc('file_upload_throttled_total', reason=e.reason)
+            response = JsonResponse({'error': f"{Throttled.MESSAGES[e.reason]}, retry later"}, status=429)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            scheduler.release(ticket)
+
+    return wrapper
+
+
+def _collect_scheduler_metrics():
+    snapshot = get_fair_scheduler().snapshot()
+    yield 'file_upload_fair_slots_active', {}, snapshot['active']
+    yield 'file_upload_fair_queue_waiting', {}, snapshot['waiting']
+
+
+metrics.register_collector(_collect_scheduler_metrics)
@@ -0,0 +1,41 @@
+from django.core.files.uploadhandler import FileUploadHandler
+
+from file_upload.progress import FAILED, RECEIVED, ProgressTracker, get_upload_id
+
+
+class UploadProgressHandler(FileUploadHandler):
+    """
+    Reports multipart upload progress for requests carrying an upload token
+
+    Must come first in FILE_UPLOAD_HANDLERS: it passes every chunk through
+    unchanged to the handlers that actually store the file. The tracker is
+    left on the request as `upload_progress` so the view can record the
+    outcome once the file is stored.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.tracker = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        upload_id = get_upload_id(self.request)
+        if upload_id:
+            self.tracker = ProgressTracker(upload_id, total=content_length or None)
+            self.request.upload_progress = self.tracker
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.tracker:
+            self.tracker.advance(len(raw_data))
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def upload_complete(self):
+        if self.tracker:
+            # The body is in; storing the file may still take a while
+            self.tracker.finish(RECEIVED)
+
+    def upload_interrupted(self):
+        if self.tracker:
+            self.tracker.finish(FAILED, error='Upload interrupted')
@@ -6,9 +6,19 @@ from file_upload import views
 
 urlpatterns = [
     path('upload/', views.upload_file, name='upload_file'),
+    path('raw/<str:filename>', views.upload_raw_file, name='upload_raw_file'),
+    path('progress/<str:upload_id>/', views.upload_progress, name='upload_progress'),
+    path('progress/<str:upload_id>/events/', views.upload_progress_events, name='upload_progress_events'),
+    path('events/', views.file_events, name='file_events'),
     path('files/', views.FileListView.as_view(), name='file_list'),
+    path('files/export/', views.export_files, name='export_files'),
+    path('files/archive/', views.download_archive, name='download_archive'),
     path('files/<uuid:pk>/', views.FileDetailView.as_view(), name='file_detail'),
     path('files/<uuid:file_id>/url/', views.get_file_url, name='get_file_url'),
+    path('files/<uuid:file_id>/similar/', views.similar_files, name='similar_files'),
+    path('signed/<str:backend>/<path:key>', views.serve_signed_file, name='serve_signed_file'),
+    path('cloudinary/notifications/', views.cloudinary_notification, name='cloudinary_notification'),
+    path('usage/', views.storage_usage, name='storage_usage'),
 ]
 
 if settings.DEBUG:
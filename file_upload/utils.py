@@ -1,26 +1,75 @@
+import base64
+import math
+import os
 from io import BytesIO
 from typing import Optional, Tuple
 
 from django.conf import settings
-from PIL import Image
+from PIL import Image, ImageOps
 
+from file_upload.storages.chunk_storage import ChunkStorage
 from file_upload.storages.cloudinary_storage import CloudinaryStorage
 from file_upload.storages.local_storage import LocalStorage
+from file_upload.storages.resilient_storage import ResilientStorage
 from file_upload.storages.s3_storage import S3Storage
 
 
-def get_storage_backend():
-    backend = getattr(settings, 'FILE_UPLOAD_STORAGE_BACKEND', 'cloudinary')
+def get_storage_backend(backend: Optional[str] = None):
+    backend = backend or getattr(settings, 'FILE_UPLOAD_STORAGE_BACKEND', 'cloudinary')
 
     if backend == 'cloudinary':
-        return CloudinaryStorage()
+        storage = CloudinaryStorage()
     elif backend == 's3':
-        return S3Storage()
+        storage = S3Storage()
     elif backend == 'local':
-        return LocalStorage()
+        storage = LocalStorage()
+    elif backend == 'chunks':
+        storage = ChunkStorage()
     else:
         raise ValueError(f"Unsupported storage backend: {backend}")
 
+    if getattr(settings, 'FILE_UPLOAD_RESILIENCE_ENABLED', True):
+        return ResilientStorage(storage)
+    return storage
+
+
+# The 8 lowest-frequency rows of the 32-point DCT-II basis, all pHash keeps
+_DCT_ROWS = [[math.cos(math.pi * (2 * x + 1) * u / 64) for x in range(32)] for u in range(8)]
+
+
+def allowed_extensions() -> list:
+    """File extensions uploads may have"""
+    return (
+            getattr(settings, 'ALLOWED_IMAGE_EXTENSIONS', []) +
+            getattr(settings, 'ALLOWED_DOCUMENT_EXTENSIONS', []) +
+            getattr(settings, 'ALLOWED_VIDEO_EXTENSIONS', []) +
+            getattr(settings, 'ALLOWED_AUDIO_EXTENSIONS', [])
+    )
+
+
+def max_file_size(filename: str, default: Optional[int] = None) -> int:
+    """Largest upload allowed for `filename`: MAX_MEDIA_FILE_SIZE for audio and video, `default` otherwise"""
+    media_extensions = (
+            getattr(settings, 'ALLOWED_VIDEO_EXTENSIONS', []) +
+            getattr(settings, 'ALLOWED_AUDIO_EXTENSIONS', [])
+    )
+    if os.path.splitext(filename)[1].lower() in media_extensions:
+        return getattr(settings, 'MAX_MEDIA_FILE_SIZE', 100 * 1024 * 1024)
+    return default if default is not None else getattr(settings, 'MAX_FILE_SIZE', 10485760)
+
+
+def get_tenant(request_id: Optional[str]) -> str:
+    """
+    Tenant a request ID belongs to
+
+    Request IDs may be namespaced as "<tenant><FILE_UPLOAD_TENANT_SEPARATOR><id>";
+    IDs without a namespace belong to no tenant ('').
+    """
+    separator = getattr(settings, 'FILE_UPLOAD_TENANT_SEPARATOR', ':')
+    if not request_id or separator not in request_id:
+        return ''
+    return request_id.split(separator, 1)[0]
+
 
 def validate_image(file) -> bool:
     """Validate if file is a valid image"""
@@ -83,3 +132,110 @@ def generate_thumbnail(file, size: Tuple[int, int] = (300, 300)) -> Optional[Byt
     except Exception as e:
         print(f"Error generating thumbnail: {str(e)}")
         return None
+
+
+def reduced_image(file, size: int = 64) -> Optional[Image.Image]:
+    """
+    Upright RGB copy of an image, decoded at reduced size
+
+    JPEGs are scaled down in the decoder (draft mode), to at least `size`
+    pixels on each side, so large photos decode in a fraction of the time;
+    other formats are decoded in full and shrunk. Transparent areas are
+    flattened onto white. `info['original_size']` holds the upright size of
+    the full image. The file position is restored.
+    """
+    position = file.tell()
+    try:
+        with Image.open(file) as img:
+            width, height = img.size
+            img.draft('RGB', (size, size))
+            drafted = img.size
+            img = ImageOps.exif_transpose(img)
+            if img.size != drafted:
+                width, height = height, width
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(background, img)
+            img = img.convert('RGB')
+            img.thumbnail((size * 8, size * 8), Image.Resampling.BOX)
+            img.info['original_size'] = (width, height)
+            return img
+    except Exception as e:
+        print(f"Error decoding image: {str(e)}")
+        return None
+    finally:
+        file.seek(position)
+
+
+def compute_image_hashes(image) -> Optional[Tuple[int, int]]:
+    """
+    Perceptual hash (pHash) and difference hash (dHash) of an image, as 64-bit ints
+
+    Both survive re-encoding and resizing: only the coarse grayscale
+    structure of the image is hashed. Accepts a file or an image from
+    `reduced_image`.
+    """
+    if not isinstance(image, Image.Image):
+        image = reduced_image(image)
+        if image is None:
+            return None
+    gray = image.convert('L')
+
+    pixels = list(gray.resize((32, 32), Image.Resampling.LANCZOS).getdata())
+    # Separable 2D DCT, keeping the top-left 8x8 coefficients
+    rows = [
+        [sum(basis[x] * pixels[y * 32 + x] for x in range(32)) for basis in _DCT_ROWS]
+        for y in range(32)
+    ]
+    coefficients = [sum(basis[y] * rows[y][u] for y in range(32)) for basis in _DCT_ROWS for u in range(8)]
+    median = sorted(coefficients)[32]
+    phash = 0
+    for value in coefficients:
+        phash = (phash << 1) | (value > median)
+
+    small = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    dhash = 0
+    for y in range(8):
+        for x in range(8):
+            dhash = (dhash << 1) | (small[y * 9 + x] > small[y * 9 + x + 1])
+    return phash, dhash
+
+
+def compute_placeholder(image, size: int = 16, quality: int = 40, max_bytes: int = 1024) -> Optional[dict]:
+    """
+    Low-quality placeholder of an image: a tiny JPEG data URI and the dominant color
+
+    The JPEG is at most `size` pixels on its longest side and `max_bytes`
+    long, small enough to inline in API responses and show blurred (CSS
+    `filter: blur()`) while the real image loads. Accepts a file or an
+    image from `reduced_image`.
+    """
+    if not isinstance(image, Image.Image):
+        image = reduced_image(image)
+        if image is None:
+            return None
+
+    # The most common color of a median-cut palette, not the mean, which muddies
+    palette_image = image.resize((32, 32), Image.Resampling.BOX).quantize(colors=6, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette_image.getcolors())
+    red, green, blue = palette_image.getpalette()[index * 3:index * 3 + 3]
+
+    width, height = image.info.get('original_size', image.size)
+    tiny = image.copy()
+    while True:
+        tiny.thumbnail((size, size), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        tiny.save(output, format='JPEG', quality=quality, optimize=True)
+        data = output.getvalue()
+        if len(data) <= max_bytes or size <= 4:
+            break
+        size, quality = size // 2, max(quality - 10, 10)
+
+    return {
+        'data_uri': f"data:image/jpeg;base64,{base64.b64encode(data).decode('ascii')}",
+        'width': tiny.width,
+        'height': tiny.height,
+        'color': f"#{red:02x}{green:02x}{blue:02x}",
+        'aspect_ratio': round(width / height, 4),
+    }
@@ -1,60 +1,363 @@
 from datetime import datetime, UTC
+import json
+import mimetypes
+import os
+import time
 import uuid
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
 from rest_framework import status, generics
 from rest_framework.decorators import api_view, parser_classes
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FileUploadParser
 from rest_framework.response import Response
 
+from file_upload import compression, progress, signing
+from file_upload.admission import admit_upload, get_memory_budget
+from file_upload.db_router import replica_health
+from file_upload.idempotency import idempotent
+from file_upload.metrics import metrics
 from file_upload.models import UploadedFile
 from file_upload.serializers.upload import FileUploadSerializer, UploadedFileSerializer
+from file_upload.services.archive_service import ArchiveError, ArchiveService
+from file_upload.services.cache_service import FileCacheService
+from file_upload.services.cloudinary_service import CloudinaryNotificationService
+from file_upload.services.event_service import EventService
+from file_upload.services.export_service import ExportService
 from file_upload.services.file_service import FileUploadService
+from file_upload.services.health_service import HealthService
+from file_upload.services.image_hash_service import ImageHashService
+from file_upload.services.search_service import SearchService
+from file_upload.services.usage_service import UsageService
+from file_upload.storages.base_storage import StorageError
+from file_upload.storages.resilient_storage import CircuitBreaker, circuit_breaker_states
+from file_upload.streams import IncompleteBodyError, RequestBodyStream
+from file_upload.throttling import get_fair_scheduler, throttle_upload
+from file_upload.utils import allowed_extensions, get_storage_backend, max_file_size
 
 
 @api_view(['GET', 'HEAD'])
 def health_check(request):
+    breakers = circuit_breaker_states()
+    degraded = any(b['state'] != CircuitBreaker.CLOSED for b in breakers.values())
     return Response(
         {
-            "status": "ok",
-            "message": "Service is healthy",
-            "timestamp": datetime.now(UTC).isoformat()
+            "status": "degraded" if degraded else "ok",
+            "message": "Storage backend unavailable" if degraded else "Service is healthy",
+            "timestamp": datetime.now(UTC).isoformat(),
+            "storage": breakers,
+            "upload_memory": get_memory_budget().snapshot(),
+            "upload_slots": get_fair_scheduler().snapshot(),
+            "database_replicas": replica_health.snapshot(),
         },
         status=status.HTTP_200_OK
     )
 
 
+@api_view(['GET', 'HEAD'])
+def readiness_check(request):
+    result = HealthService.readiness()
+    return Response(
+        result,
+        status=status.HTTP_200_OK if result['status'] == 'ok' else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
+
+
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FileUploadParser])
+@throttle_upload
+@idempotent
+@admit_upload
 def upload_file(request):
     try:
         serializer = FileUploadSerializer(data=request.data)
+        # Set by UploadProgressHandler while the body was parsed
+        tracker = getattr(request, 'upload_progress', None)
+
         if serializer.is_valid():
             file = serializer.validated_data['file']
             file_type = serializer.validated_data.get('file_type')
+            tenant = serializer.validated_data.get('tenant')
+            previous_version = serializer.validated_data.get('previous_version')
+
+            if previous_version:
+                # Versions of a file share its request ID
+                request_id = previous_version.request_id
+            else:
+                request_id = f"{tenant}{settings.FILE_UPLOAD_TENANT_SEPARATOR}{uuid.uuid4()}" if tenant else str(uuid.uuid4())
 
             uploaded_file = FileUploadService.upload_file(
                 file=file,
-                request_id=str(uuid.uuid4()),
-                file_type=file_type
+                request_id=request_id,
+                file_type=file_type,
+                ttl=serializer.validated_data.get('ttl'),
+                previous_version=previous_version
             )
+            if tracker:
+                tracker.finish(progress.DONE, file_id=str(uploaded_file.id))
 
-            response_serializer = UploadedFileSerializer(uploaded_file)
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            data, response_status = _upload_result(uploaded_file)
+            return Response(data, status=response_status)
 
+        if tracker:
+            tracker.finish(progress.FAILED, error=serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     except Exception as e:
+        tracker = getattr(request, 'upload_progress', None)
+        if tracker:
+            tracker.finish(progress.FAILED, error=str(e))
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+@csrf_exempt
+@require_http_methods(['PUT'])
+@throttle_upload
+@idempotent
+@admit_upload
+def upload_raw_file(request, filename):
+    """
+    Upload the raw request body as a file, without multipart parsing
+
+    The body is read from the request in fixed-size chunks and handed to the
+    storage backend as a stream, so nothing is parsed or spooled to disk for
+    backends that accept streams.
+    """
+    try:
+        content_length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Content-Length header is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+
+    max_size = max_file_size(filename, getattr(settings, 'FILE_UPLOAD_RAW_MAX_SIZE', settings.MAX_FILE_SIZE))
+    if content_length <= 0:
+        return JsonResponse({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+    if content_length > max_size:
+        return JsonResponse(
+            {'error': f'File size must be less than {max_size // (1024 * 1024)}MB'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in allowed_extensions():
+        return JsonResponse({'error': f'File extension {file_ext} is not allowed'}, status=status.HTTP_400_BAD_REQUEST)
+
+    expected_type = mimetypes.guess_type(filename)[0]
+    if request.content_type not in (expected_type, 'application/octet-stream'):
+        return JsonResponse(
+            {'error': f'Content-Type {request.content_type} does not match {file_ext} files'},
+            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    file_type = request.GET.get('file_type')
+    if file_type and file_type not in dict(UploadedFile.FILE_TYPE_CHOICES):
+        return JsonResponse({'error': f'Invalid file type: {file_type}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    previous_version = None
+    if request.GET.get('previous_version'):
+        try:
+            previous_version = UploadedFile.objects.get(id=request.GET['previous_version'])
+        except (UploadedFile.DoesNotExist, ValidationError):
+            return JsonResponse({'error': 'Previous version not found'}, status=status.HTTP_400_BAD_REQUEST)
+
+    upload_id = progress.get_upload_id(request)
+    tracker = progress.ProgressTracker(upload_id, total=content_length) if upload_id else None
+    stream = RequestBodyStream(
+        request,
+        name=filename,
+        size=content_length,
+        chunk_size=getattr(settings, 'FILE_UPLOAD_RAW_CHUNK_SIZE', 64 * 1024),
+        progress=tracker
+    )
+
+    try:
+        uploaded_file = FileUploadService.upload_file(
+            file=stream,
+            request_id=previous_version.request_id if previous_version else str(uuid.uuid4()),
+            file_type=file_type,
+            previous_version=previous_version
+        )
+    except Exception as e:
+        if _caused_by(e, IncompleteBodyError):
+            error, response_status = (
+                f'Request body ended after {stream.tell()} of {content_length} bytes', status.HTTP_400_BAD_REQUEST
+            )
+        elif isinstance(e, StorageError) and e.retryable:
+            # Not final: idempotent retries upload again instead of replaying it
+            error, response_status = str(e), status.HTTP_503_SERVICE_UNAVAILABLE
+        else:
+            error, response_status = str(e), status.HTTP_500_INTERNAL_SERVER_ERROR
+        if tracker:
+            tracker.finish(progress.FAILED, error=error)
+        return JsonResponse({'error': error}, status=response_status)
+
+    if tracker:
+        tracker.finish(progress.DONE, file_id=str(uploaded_file.id))
+    data, response_status = _upload_result(uploaded_file)
+    return JsonResponse(data, status=response_status)
+
+
+def _upload_result(uploaded_file: UploadedFile):
+    """Body and status answering an upload"""
+    data = UploadedFileSerializer(uploaded_file).data
+    if hasattr(uploaded_file, 'near_duplicate_distance'):
+        # Answered with a stored near-duplicate instead of storing the upload
+        return {**data, 'near_duplicate_distance': uploaded_file.near_duplicate_distance}, status.HTTP_200_OK
+    return data, status.HTTP_201_CREATED
+
+
+def _caused_by(error: BaseException, error_type) -> bool:
+    """Whether `error_type` is `error` or anywhere in the chain of exceptions that caused it"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, error_type):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+@api_view(['GET'])
+def upload_progress(request, upload_id):
+    state = progress.get_progress(upload_id)
+    if state is None:
+        return Response({'error': 'Unknown upload'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = Response(state)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@require_GET
+def upload_progress_events(request, upload_id):
+    """
+    Server-Sent Events stream of an upload's progress
+
+    Sends an event whenever the progress changes and closes once the upload
+    is done or failed, or after FILE_UPLOAD_PROGRESS_SSE_TIMEOUT seconds
+    (clients reconnect). The stream may be opened before the upload starts.
+    """
+    poll_interval = getattr(settings, 'FILE_UPLOAD_PROGRESS_INTERVAL', 0.5)
+    timeout = getattr(settings, 'FILE_UPLOAD_PROGRESS_SSE_TIMEOUT', 300)
+
+    def events():
+        yield 'retry: 1000\n\n'
+        deadline = time.monotonic() + timeout
+        last, last_sent = None, time.monotonic()
+        while time.monotonic() < deadline:
+            state = progress.get_progress(upload_id)
+            if state is not None and state != last:
+                yield f"event: progress\ndata: {json.dumps(state)}\n\n"
+                last, last_sent = state, time.monotonic()
+                if state['state'] in progress.FINAL_STATES:
+                    return
+            elif time.monotonic() - last_sent >= 15:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def file_events(request):
+    """
+    Server-Sent Events stream of the file events of one `request_id`
+
+    Resumes after the `Last-Event-ID` header (or `last_event_id` parameter)
+    and closes after FILE_UPLOAD_EVENTS_SSE_TIMEOUT seconds; browsers
+    reconnect with the last id they saw, so no event is missed. The outbox
+    is only queried when the cache says a newer event was committed, and
+    otherwise every FILE_UPLOAD_EVENTS_RESYNC_INTERVAL seconds.
+    """
+    request_id = request.GET.get('request_id')
+    if not request_id:
+        return JsonResponse({'error': 'request_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid Last-Event-ID'}, status=status.HTTP_400_BAD_REQUEST)
+
+    poll_interval = getattr(settings, 'FILE_UPLOAD_EVENTS_POLL_INTERVAL', 1.0)
+    resync_interval = getattr(settings, 'FILE_UPLOAD_EVENTS_RESYNC_INTERVAL', 30)
+    timeout = getattr(settings, 'FILE_UPLOAD_EVENTS_SSE_TIMEOUT', 300)
+
+    def events():
+        nonlocal last_id
+        yield 'retry: 1000\n\n'
+        deadline = time.monotonic() + timeout
+        queried_at = last_sent = None
+        while True:
+            latest = EventService.latest_id(request_id)
+            now = time.monotonic()
+            if queried_at is None or now - queried_at >= resync_interval or (latest or 0) > last_id:
+                queried_at, sent = now, 0
+                while True:
+                    batch = EventService.events_after(request_id, last_id, limit=100)
+                    for event in batch:
+                        data = json.dumps(EventService.serialize(event))
+                        yield f"id: {event.pk}\nevent: {event.event_type}\ndata: {data}\n\n"
+                        last_id = event.pk
+                    sent += len(batch)
+                    if len(batch) < 100:
+                        break
+                if sent:
+                    last_sent = time.monotonic()
+                elif latest is None:
+                    EventService.remember_latest(request_id, last_id)
+
+            if time.monotonic() >= deadline:
+                return
+            if last_sent is None or time.monotonic() - last_sent >= 15:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class FilePagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 class FileListView(generics.ListAPIView):
     serializer_class = UploadedFileSerializer
+    pagination_class = FilePagination
 
     def get_queryset(self):
-        return UploadedFile.objects.all()
+        queryset = UploadedFile.objects.order_by('-created_at')
+
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            mode = self.request.query_params.get('search_mode', 'substring')
+            if mode not in SearchService.MODES:
+                mode = 'substring'
+            queryset = SearchService.search(search, queryset, mode=mode)
+        return queryset
 
 
 class FileDetailView(generics.RetrieveDestroyAPIView):
@@ -63,6 +366,28 @@ class FileDetailView(generics.RetrieveDestroyAPIView):
     def get_queryset(self):
         return UploadedFile.objects.all()
 
+    def get_object(self):
+        try:
+            instance = FileCacheService.get(self.kwargs['pk'])
+        except UploadedFile.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = FileCacheService.etag(instance)
+
+        if _etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_serializer(instance).data)
+        return _add_cache_headers(response, etag)
+
+    @method_decorator(idempotent)
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
+
     def perform_destroy(self, instance):
         FileUploadService.delete_file(instance)
 
@@ -70,7 +395,7 @@ class FileDetailView(generics.RetrieveDestroyAPIView):
 @api_view(['GET'])
 def get_file_url(request, file_id):
     try:
-        uploaded_file = UploadedFile.objects.get(id=file_id)
+        uploaded_file = FileCacheService.get(file_id)
 
         # if uploaded_file.user and uploaded_file.user != request.user:
         #     return Response(
@@ -90,9 +415,20 @@ def get_file_url(request, file_id):
         if 'expires_in' in request.GET:
             transformations['expires_in'] = int(request.GET['expires_in'])
 
+        if 'expires_in' in transformations or signing.signs_by_default(uploaded_file.storage_backend):
+            # Presigned URLs expire, so a cached copy must never be revalidated
+            url = FileUploadService.get_file_url(uploaded_file, **transformations)
+            response = Response({'url': url})
+            response['Cache-Control'] = 'no-store'
+            return response
+
+        etag = FileCacheService.etag(uploaded_file, *sorted(transformations.items()))
+        if _etag_matches(request, etag):
+            return _add_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
         url = FileUploadService.get_file_url(uploaded_file, **transformations)
 
-        return Response({'url': url})
+        return _add_cache_headers(Response({'url': url}), etag)
 
     except UploadedFile.DoesNotExist:
         return Response(
@@ -103,4 +439,269 @@ def get_file_url(request, file_id):
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+@api_view(['GET'])
+def similar_files(request, file_id):
+    """Images that look like this file: resized, re-encoded or lightly edited copies"""
+    try:
+        uploaded_file = FileCacheService.get(file_id)
+    except UploadedFile.DoesNotExist:
+        return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        max_distance = int(request.GET.get('max_distance', ImageHashService.default_distance()))
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        return Response({'error': 'max_distance and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= max_distance <= ImageHashService.MAX_SEARCH_DISTANCE:
+        return Response(
+            {'error': f'max_distance must be between 0 and {ImageHashService.MAX_SEARCH_DISTANCE}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    matches = ImageHashService.near_duplicates(uploaded_file, max_distance=max_distance, limit=max(limit, 1))
+    if matches is None:
+        return Response({'error': 'File has no perceptual hash'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'file_id': str(uploaded_file.id),
+        'max_distance': max_distance,
+        'results': [
+            {**UploadedFileSerializer(match).data, 'distance': distance} for match, distance in matches
+        ],
+    })
+
+
+@require_GET
+def serve_signed_file(request, backend, key):
+    """
+    Serve a stored object through a signed URL from `signing.sign_url`
+
+    The signature covers the backend, key, expiry and stored encoding, so
+    the file is streamed from storage without looking up its database row.
+    """
+    if backend not in signing.SIGNED_BACKENDS:
+        raise Http404
+    expires = request.GET.get('expires')
+    encoding = request.GET.get('encoding') or None
+    if not signing.verify(backend, key, expires, request.GET.get('sig'), encoding):
+        metrics.inc('file_upload_signed_url_rejected_total')
+        return JsonResponse({'error': 'Invalid or expired signature'}, status=status.HTTP_403_FORBIDDEN)
+    if encoding and encoding not in compression.SUFFIXES:
+        raise Http404
+
+    # An unsaved instance carries the key to the storage backend
+    stored = UploadedFile(storage_backend=backend, **{UploadedFile.STORAGE_KEY_FIELDS[backend]: key})
+    try:
+        stream = get_storage_backend(backend).open_file(stored)
+    except StorageError as e:
+        if e.retryable:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        raise Http404
+
+    # Compressed objects are sent as stored to clients accepting their encoding, decoded otherwise.
+    # The encoding comes from the signed URL: a key ending in .gz may be an upload stored as is.
+    filename = os.path.basename(compression.original_key(key) if encoding else key)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if encoding and not compression.accepts(request, encoding):
+        response = StreamingHttpResponse(compression.decoded(stream, encoding), content_type=content_type)
+    else:
+        response = FileResponse(stream, content_type=content_type, filename=filename)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    if encoding:
+        response['Vary'] = 'Accept-Encoding'
+    # The URL changes when it expires, so it can be cached for as long as it is valid
+    response['Cache-Control'] = f'private, max-age={max(int(expires) - int(time.time()), 0)}'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def cloudinary_notification(request):
+    """Callback Cloudinary calls when an asynchronous upload or its eager transformations are processed"""
+    verified = CloudinaryNotificationService.verify(
+        request.body, request.headers.get('X-Cld-Timestamp'), request.headers.get('X-Cld-Signature')
+    )
+    if not verified:
+        return JsonResponse({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(payload, dict) or not isinstance(payload.get('public_id'), str):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if CloudinaryNotificationService.apply(payload) is None:
+        # Kept until the upload that sent the file has recorded it
+        return JsonResponse({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+    return JsonResponse({'status': 'ok'})
+
+
+@require_GET
+def export_files(request):
+    # Plain Django view: DRF would treat ?format= as a renderer override
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ExportService.FORMATS:
+        return JsonResponse(
+            {'error': f'Unsupported export format: {export_format}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        queryset = ExportService.build_queryset(
+            created_after=request.GET.get('created_after'),
+            created_before=request.GET.get('created_before'),
+            storage_backend=request.GET.get('storage_backend'),
+            file_type=request.GET.get('file_type'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        ExportService.stream(queryset, export_format),
+        content_type=ExportService.FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="files.{export_format}"'
+    return response
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def download_archive(request):
+    """
+    Stream a ZIP of the files given by `ids` or `request_id`
+
+    GET takes comma separated ids, POST a JSON body for long lists. When
+    the archive has a known size, single byte ranges are served so that
+    interrupted downloads can resume.
+    """
+    if request.method == 'POST':
+        try:
+            params = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(params, dict):
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = params.get('ids')
+    else:
+        params = request.GET
+        ids = [file_id for file_id in params.get('ids', '').split(',') if file_id]
+
+    try:
+        archive = ArchiveService(
+            ArchiveService.select(ids=ids, request_id=params.get('request_id')),
+            compress=str(params.get('compress', 'true')).lower() != 'false',
+        )
+    except ArchiveError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    size, etag = archive.size, archive.etag
+    byte_range = _parse_range(request, size, etag) if size is not None else None
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _limit(archive.stream(start), end - start + 1),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type='application/zip'
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = StreamingHttpResponse(archive.stream(), content_type='application/zip')
+        if size is not None:
+            response['Content-Length'] = size
+
+    if size is not None:
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+    response['Content-Disposition'] = 'attachment; filename="files.zip"'
+    return response
+
+
+@api_view(['GET'])
+def storage_usage(request):
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        # parse_date answers None for anything not shaped like a date
+        if value and dates[name] is None:
+            return Response({'error': f"{name} must be a YYYY-MM-DD date"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        UsageService.totals(
+            tenant=request.GET.get('tenant'),
+            storage_backend=request.GET.get('storage_backend'),
+            file_type=request.GET.get('file_type'),
+            since=dates['since'],
+            until=dates['until'],
+        )
+    )
+
+
+def _etag_matches(request, etag: str) -> bool:
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+
+
+def _parse_range(request, size: int, etag: str):
+    """
+    A single `bytes=` range as (start, end), 'unsatisfiable', or None for the whole content
+
+    Multiple ranges, malformed headers and stale If-Range validators are
+    answered with the whole content, as RFC 9110 allows.
+    """
+    header = request.headers.get('Range', '')
+    if not header.startswith('bytes=') or ',' in header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range.strip() != etag:
+        return None
+
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _limit(chunks, length: int):
+    try:
+        for chunk in chunks:
+            if len(chunk) >= length:
+                yield chunk[:length]
+                return
+            length -= len(chunk)
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _add_cache_headers(response, etag: str):
+    response['ETag'] = etag
+    response['Cache-Control'] = getattr(settings, 'FILE_UPLOAD_CACHE_CONTROL', 'private, no-cache')
+    return response
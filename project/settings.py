@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'file_upload.db_router.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -78,13 +79,33 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# The primary database. Connections are kept open for DB_CONN_MAX_AGE seconds
+# (0 closes them after every request) and checked before reuse.
+_DATABASE = {
+    'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.sqlite3'),
+    'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+    'USER': os.getenv('DB_USER', ''),
+    'PASSWORD': os.getenv('DB_PASSWORD', ''),
+    'HOST': os.getenv('DB_HOST', ''),
+    'PORT': os.getenv('DB_PORT', ''),
+    'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+    'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+}
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': _DATABASE,
 }
 
+# Read replicas: hosts of the same database (DB_REPLICA_HOSTS) or, to try
+# replication locally, SQLite files refreshed by `manage.py syncreplicas`
+# (DB_REPLICA_NAMES). Tests read the replicas from the test primary.
+_REPLICAS = (
+    [{**_DATABASE, 'HOST': host} for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]
+    + [{**_DATABASE, 'NAME': name} for name in os.getenv('DB_REPLICA_NAMES', '').split(',') if name]
+)
+for _index, _replica in enumerate(_REPLICAS):
+    DATABASES[f'replica_{_index}'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -122,6 +143,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -143,12 +167,256 @@ if FILE_UPLOAD_STORAGE_BACKEND == 's3':
     AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
     AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'us-east-1')
 
+# Storage resilience: retries for idempotent calls, per-backend circuit
+# breakers and hedged reads/URL generation
+FILE_UPLOAD_RESILIENCE_ENABLED = os.getenv('FILE_UPLOAD_RESILIENCE_ENABLED', 'true').lower() == 'true'
+FILE_UPLOAD_RETRY_ATTEMPTS = int(os.getenv('FILE_UPLOAD_RETRY_ATTEMPTS', 3))
+FILE_UPLOAD_RETRY_BASE_DELAY = float(os.getenv('FILE_UPLOAD_RETRY_BASE_DELAY', 0.1))
+FILE_UPLOAD_RETRY_MAX_DELAY = float(os.getenv('FILE_UPLOAD_RETRY_MAX_DELAY', 2.0))
+FILE_UPLOAD_BREAKER_FAILURE_THRESHOLD = int(os.getenv('FILE_UPLOAD_BREAKER_FAILURE_THRESHOLD', 5))
+FILE_UPLOAD_BREAKER_RESET_TIMEOUT = float(os.getenv('FILE_UPLOAD_BREAKER_RESET_TIMEOUT', 30))
+FILE_UPLOAD_HEDGE_ENABLED = os.getenv('FILE_UPLOAD_HEDGE_ENABLED', 'true').lower() == 'true'
+FILE_UPLOAD_HEDGE_PERCENTILE = float(os.getenv('FILE_UPLOAD_HEDGE_PERCENTILE', 95))
+FILE_UPLOAD_HEDGE_MIN_SAMPLES = int(os.getenv('FILE_UPLOAD_HEDGE_MIN_SAMPLES', 20))
+FILE_UPLOAD_HEDGE_MAX_WORKERS = int(os.getenv('FILE_UPLOAD_HEDGE_MAX_WORKERS', 8))
+
+# Readiness probes: probe results are cached for FILE_UPLOAD_HEALTH_CACHE_SECONDS
+FILE_UPLOAD_HEALTH_CACHE_SECONDS = float(os.getenv('FILE_UPLOAD_HEALTH_CACHE_SECONDS', 10))
+FILE_UPLOAD_HEALTH_BACKENDS = [
+    b for b in os.getenv('FILE_UPLOAD_HEALTH_BACKENDS', FILE_UPLOAD_STORAGE_BACKEND).split(',') if b
+]
+FILE_UPLOAD_LOCAL_MIN_FREE_BYTES = int(os.getenv('FILE_UPLOAD_LOCAL_MIN_FREE_BYTES', 512 * 1024 * 1024))
+
+# Django cache, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://cache:6379. The default LocMemCache is per
+# process: file lookups, upload progress and replica pins then need a single
+# process (see the file_upload.W002 check)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# File metadata caching: UploadedFile lookups by id are cached in the Django
+# cache and responses carry ETags for conditional GETs
+FILE_UPLOAD_CACHE_ALIAS = os.getenv('FILE_UPLOAD_CACHE_ALIAS', 'default')
+FILE_UPLOAD_OBJECT_CACHE_TIMEOUT = int(os.getenv('FILE_UPLOAD_OBJECT_CACHE_TIMEOUT', 300))
+FILE_UPLOAD_CACHE_CONTROL = os.getenv('FILE_UPLOAD_CACHE_CONTROL', 'private, no-cache')
+
+# Request IDs may be namespaced by tenant as "<tenant>:<id>"
+FILE_UPLOAD_TENANT_SEPARATOR = ':'
+
+# Retention: TTLs in seconds, None keeps files for ever. An explicit ttl on
+# upload wins over the tenant policy, which wins over the file type policy.
+FILE_UPLOAD_RETENTION_DEFAULT_TTL = None
+FILE_UPLOAD_RETENTION_FILE_TYPE_TTLS = {}
+FILE_UPLOAD_RETENTION_TENANT_TTLS = {}
+FILE_UPLOAD_PURGE_BATCH_SIZE = int(os.getenv('FILE_UPLOAD_PURGE_BATCH_SIZE', 500))
+# Sleep this multiple of each batch's duration between batches
+FILE_UPLOAD_PURGE_YIELD_RATIO = float(os.getenv('FILE_UPLOAD_PURGE_YIELD_RATIO', 1.0))
+# Leave expired S3 objects to a bucket lifecycle rule on the retention-days
+# tag and only delete the rows
+FILE_UPLOAD_S3_LIFECYCLE_EXPIRY = os.getenv('FILE_UPLOAD_S3_LIFECYCLE_EXPIRY', 'false').lower() == 'true'
+
+# Metadata keys indexed alongside original_filename for search
+FILE_UPLOAD_SEARCH_METADATA_KEYS = ['title', 'description', 'tags']
+
+# ZIP downloads: members opened ahead of the writer, chunks buffered per member
+FILE_UPLOAD_ZIP_MAX_FILES = int(os.getenv('FILE_UPLOAD_ZIP_MAX_FILES', 1000))
+FILE_UPLOAD_ZIP_PREFETCH = int(os.getenv('FILE_UPLOAD_ZIP_PREFETCH', 4))
+FILE_UPLOAD_ZIP_PREFETCH_CHUNKS = int(os.getenv('FILE_UPLOAD_ZIP_PREFETCH_CHUNKS', 4))
+FILE_UPLOAD_ZIP_CHUNK_SIZE = int(os.getenv('FILE_UPLOAD_ZIP_CHUNK_SIZE', 64 * 1024))
+FILE_UPLOAD_ZIP_COMPRESSION_LEVEL = int(os.getenv('FILE_UPLOAD_ZIP_COMPRESSION_LEVEL', 6))
+
+# Header-only media metadata of audio and video uploads; probes give up
+# after reading this many bytes
+FILE_UPLOAD_MEDIA_PROBE_ENABLED = os.getenv('FILE_UPLOAD_MEDIA_PROBE_ENABLED', 'true').lower() == 'true'
+FILE_UPLOAD_MEDIA_PROBE_MAX_BYTES = int(os.getenv('FILE_UPLOAD_MEDIA_PROBE_MAX_BYTES', 1024 * 1024))
+
+# Upload progress: 'cache' shares progress across processes through
+# FILE_UPLOAD_CACHE_ALIAS, 'memory' only works with a single process.
+# Progress is written at most every FILE_UPLOAD_PROGRESS_INTERVAL seconds
+FILE_UPLOAD_PROGRESS_STORE = os.getenv('FILE_UPLOAD_PROGRESS_STORE', 'cache')
+FILE_UPLOAD_PROGRESS_INTERVAL = float(os.getenv('FILE_UPLOAD_PROGRESS_INTERVAL', 0.5))
+FILE_UPLOAD_PROGRESS_TIMEOUT = int(os.getenv('FILE_UPLOAD_PROGRESS_TIMEOUT', 3600))
+FILE_UPLOAD_PROGRESS_SSE_TIMEOUT = int(os.getenv('FILE_UPLOAD_PROGRESS_SSE_TIMEOUT', 300))
+FILE_UPLOAD_HANDLERS = [
+    'file_upload.upload_handlers.UploadProgressHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Admission control: uploads reserve their in-memory size (up to
+# FILE_UPLOAD_MAX_MEMORY_SIZE) plus FILE_UPLOAD_ADMISSION_OVERHEAD from a
+# per-process budget, wait up to FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT seconds
+# when it is exhausted, then get a 503 with Retry-After
+FILE_UPLOAD_MEMORY_BUDGET = int(os.getenv('FILE_UPLOAD_MEMORY_BUDGET', 256 * 1024 * 1024))
+FILE_UPLOAD_ADMISSION_OVERHEAD = int(os.getenv('FILE_UPLOAD_ADMISSION_OVERHEAD', 256 * 1024))
+FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT = float(os.getenv('FILE_UPLOAD_ADMISSION_QUEUE_TIMEOUT', 2.0))
+FILE_UPLOAD_ADMISSION_MAX_WAITING = int(os.getenv('FILE_UPLOAD_ADMISSION_MAX_WAITING', 20))
+FILE_UPLOAD_ADMISSION_RETRY_AFTER = int(os.getenv('FILE_UPLOAD_ADMISSION_RETRY_AFTER', 5))
+
+# Per-client throttling of uploads: token buckets of requests and bytes per
+# client key (hashed API key, tenant or IP), shared through the cache
+# ('memory' keeps them per process), and FILE_UPLOAD_FAIR_SLOTS concurrent
+# uploads per process handed out in weighted fair order, at most
+# FILE_UPLOAD_CLIENT_MAX_CONCURRENCY per client. Exceeding either is a 429
+# with Retry-After. Weights, e.g. {'tenant:acme': 4}, scale a client's limits.
+# Off by default: the 'cache' store needs a cache shared by every process
+# (CACHES), and behind a proxy FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR,
+# or every client is keyed by the proxy's address
+FILE_UPLOAD_RATE_LIMIT_ENABLED = os.getenv('FILE_UPLOAD_RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+FILE_UPLOAD_RATE_LIMIT_STORE = os.getenv('FILE_UPLOAD_RATE_LIMIT_STORE', 'cache')
+FILE_UPLOAD_RATE_LIMIT_KEYS = [k for k in os.getenv('FILE_UPLOAD_RATE_LIMIT_KEYS', 'api_key,tenant,ip').split(',') if k]
+FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv('FILE_UPLOAD_RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND = float(os.getenv('FILE_UPLOAD_RATE_LIMIT_REQUESTS_PER_SECOND', 5))
+FILE_UPLOAD_RATE_LIMIT_REQUEST_BURST = float(os.getenv('FILE_UPLOAD_RATE_LIMIT_REQUEST_BURST', 20))
+FILE_UPLOAD_RATE_LIMIT_BYTES_PER_SECOND = float(os.getenv('FILE_UPLOAD_RATE_LIMIT_BYTES_PER_SECOND', 20 * 1024 * 1024))
+FILE_UPLOAD_RATE_LIMIT_BYTE_BURST = float(os.getenv('FILE_UPLOAD_RATE_LIMIT_BYTE_BURST', 100 * 1024 * 1024))
+FILE_UPLOAD_RATE_LIMIT_WEIGHTS = {}
+FILE_UPLOAD_FAIR_SLOTS = int(os.getenv('FILE_UPLOAD_FAIR_SLOTS', 8))
+FILE_UPLOAD_CLIENT_MAX_CONCURRENCY = int(os.getenv('FILE_UPLOAD_CLIENT_MAX_CONCURRENCY', 4))
+FILE_UPLOAD_FAIR_QUEUE_TIMEOUT = float(os.getenv('FILE_UPLOAD_FAIR_QUEUE_TIMEOUT', 5.0))
+FILE_UPLOAD_FAIR_MAX_WAITING = int(os.getenv('FILE_UPLOAD_FAIR_MAX_WAITING', 50))
+
+# Idempotency-Key: responses are replayed for FILE_UPLOAD_IDEMPOTENCY_TTL
+# seconds; duplicates wait up to FILE_UPLOAD_IDEMPOTENCY_WAIT seconds for
+# the first request, whose claim is taken over after
+# FILE_UPLOAD_IDEMPOTENCY_LOCK_TIMEOUT seconds
+FILE_UPLOAD_IDEMPOTENCY_TTL = int(os.getenv('FILE_UPLOAD_IDEMPOTENCY_TTL', 24 * 3600))
+FILE_UPLOAD_IDEMPOTENCY_WAIT = float(os.getenv('FILE_UPLOAD_IDEMPOTENCY_WAIT', 30))
+FILE_UPLOAD_IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('FILE_UPLOAD_IDEMPOTENCY_LOCK_TIMEOUT', 300))
+
+# Signed URLs: local files (and S3 objects when FILE_UPLOAD_S3_URL_MODE is
+# 'proxy') are served through HMAC-signed links verified without a database
+# query. Expiries are rounded up to FILE_UPLOAD_SIGNED_URL_GRANULARITY
+# seconds so repeated signing yields cacheable, identical URLs
+FILE_UPLOAD_URL_SIGNING_KEY = os.getenv('FILE_UPLOAD_URL_SIGNING_KEY', '')
+FILE_UPLOAD_SIGNED_URL_TTL = int(os.getenv('FILE_UPLOAD_SIGNED_URL_TTL', 3600))
+FILE_UPLOAD_SIGNED_URL_GRANULARITY = int(os.getenv('FILE_UPLOAD_SIGNED_URL_GRANULARITY', 60))
+FILE_UPLOAD_SIGNED_URL_BASE = os.getenv('FILE_UPLOAD_SIGNED_URL_BASE', '')
+FILE_UPLOAD_LOCAL_SIGNED_URLS = os.getenv('FILE_UPLOAD_LOCAL_SIGNED_URLS', 'true').lower() == 'true'
+FILE_UPLOAD_S3_URL_MODE = os.getenv('FILE_UPLOAD_S3_URL_MODE', 'presign')
+
+# File events: an outbox row per created or deleted file, streamed per
+# request_id at /api/files/events/ and, when FILE_UPLOAD_WEBHOOK_URL is set,
+# POSTed in signed batches by `dispatchevents`. Failed batches back off
+# exponentially; events are dropped after FILE_UPLOAD_EVENTS_RETENTION seconds
+FILE_UPLOAD_WEBHOOK_URL = os.getenv('FILE_UPLOAD_WEBHOOK_URL', '')
+FILE_UPLOAD_WEBHOOK_SECRET = os.getenv('FILE_UPLOAD_WEBHOOK_SECRET', '')
+FILE_UPLOAD_WEBHOOK_BATCH_SIZE = int(os.getenv('FILE_UPLOAD_WEBHOOK_BATCH_SIZE', 100))
+FILE_UPLOAD_WEBHOOK_TIMEOUT = float(os.getenv('FILE_UPLOAD_WEBHOOK_TIMEOUT', 10))
+# Seconds a dispatcher holds a batch; longer than a delivery can take
+FILE_UPLOAD_WEBHOOK_LEASE = int(os.getenv('FILE_UPLOAD_WEBHOOK_LEASE', 60))
+FILE_UPLOAD_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('FILE_UPLOAD_WEBHOOK_MAX_ATTEMPTS', 10))
+FILE_UPLOAD_WEBHOOK_RETRY_BASE_DELAY = float(os.getenv('FILE_UPLOAD_WEBHOOK_RETRY_BASE_DELAY', 10))
+FILE_UPLOAD_WEBHOOK_RETRY_MAX_DELAY = float(os.getenv('FILE_UPLOAD_WEBHOOK_RETRY_MAX_DELAY', 3600))
+FILE_UPLOAD_EVENTS_RETENTION = int(os.getenv('FILE_UPLOAD_EVENTS_RETENTION', 7 * 24 * 3600))
+FILE_UPLOAD_EVENTS_POLL_INTERVAL = float(os.getenv('FILE_UPLOAD_EVENTS_POLL_INTERVAL', 1.0))
+FILE_UPLOAD_EVENTS_RESYNC_INTERVAL = float(os.getenv('FILE_UPLOAD_EVENTS_RESYNC_INTERVAL', 30))
+FILE_UPLOAD_EVENTS_SSE_TIMEOUT = int(os.getenv('FILE_UPLOAD_EVENTS_SSE_TIMEOUT', 300))
+
+# Asynchronous Cloudinary uploads: uploads of at least
+# FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE bytes return once Cloudinary has the
+# bytes; processing and the eager transformations per file type are reported
+# to FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL (the public URL of
+# /api/files/cloudinary/notifications/), which fills in the file metadata.
+# Only audio and video may exceed MAX_FILE_SIZE, so with the default
+# threshold only they are uploaded asynchronously
+FILE_UPLOAD_CLOUDINARY_ASYNC = os.getenv('FILE_UPLOAD_CLOUDINARY_ASYNC', 'false').lower() == 'true'
+FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE = int(os.getenv('FILE_UPLOAD_CLOUDINARY_ASYNC_MIN_SIZE', 10 * 1024 * 1024))
+FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL = os.getenv('FILE_UPLOAD_CLOUDINARY_NOTIFICATION_URL', '')
+FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE = int(os.getenv('FILE_UPLOAD_CLOUDINARY_NOTIFICATION_MAX_AGE', 7200))
+FILE_UPLOAD_CLOUDINARY_EAGER = {
+    'image': [{'width': 400, 'height': 400, 'crop': 'limit', 'fetch_format': 'auto'}],
+    'video': [{'width': 1280, 'crop': 'limit', 'format': 'mp4'}, {'width': 400, 'crop': 'limit', 'format': 'jpg'}],
+}
+
+# Compression at rest (local and S3): uploads of at least
+# FILE_UPLOAD_COMPRESSION_MIN_SIZE bytes that are not already compressed and
+# whose first 64KB deflate below FILE_UPLOAD_COMPRESSION_MAX_RATIO are stored
+# gzip or zstd compressed. 'auto' uses zstd (needs the zstandard package) from
+# FILE_UPLOAD_COMPRESSION_ZSTD_MIN_SIZE bytes and gzip below
+FILE_UPLOAD_COMPRESSION_ENABLED = os.getenv('FILE_UPLOAD_COMPRESSION_ENABLED', 'false').lower() == 'true'
+FILE_UPLOAD_COMPRESSION_ALGORITHM = os.getenv('FILE_UPLOAD_COMPRESSION_ALGORITHM', 'auto')
+FILE_UPLOAD_COMPRESSION_MIN_SIZE = int(os.getenv('FILE_UPLOAD_COMPRESSION_MIN_SIZE', 8 * 1024))
+FILE_UPLOAD_COMPRESSION_MAX_RATIO = float(os.getenv('FILE_UPLOAD_COMPRESSION_MAX_RATIO', 0.9))
+FILE_UPLOAD_COMPRESSION_ZSTD_MIN_SIZE = int(os.getenv('FILE_UPLOAD_COMPRESSION_ZSTD_MIN_SIZE', 1024 * 1024))
+FILE_UPLOAD_COMPRESSION_GZIP_LEVEL = int(os.getenv('FILE_UPLOAD_COMPRESSION_GZIP_LEVEL', 6))
+FILE_UPLOAD_COMPRESSION_ZSTD_LEVEL = int(os.getenv('FILE_UPLOAD_COMPRESSION_ZSTD_LEVEL', 3))
+
+# Content-defined chunk store (FILE_UPLOAD_STORAGE_BACKEND=chunks): uploads
+# are split into chunks of MIN_SIZE to MAX_SIZE bytes (AVG_SIZE on average)
+# at content-defined boundaries and each unique chunk is stored once, under
+# FILE_UPLOAD_CHUNK_STORE_ROOT or FILE_UPLOAD_CHUNK_STORE_PREFIX in the S3
+# bucket. `gcchunks` removes chunks no file references any more
+FILE_UPLOAD_CHUNK_STORE_BACKEND = os.getenv('FILE_UPLOAD_CHUNK_STORE_BACKEND', 'local')
+FILE_UPLOAD_CHUNK_STORE_ROOT = os.getenv('FILE_UPLOAD_CHUNK_STORE_ROOT', os.path.join(BASE_DIR, 'chunkstore'))
+FILE_UPLOAD_CHUNK_STORE_PREFIX = os.getenv('FILE_UPLOAD_CHUNK_STORE_PREFIX', 'chunkstore/')
+FILE_UPLOAD_CHUNK_STORE_MIN_SIZE = int(os.getenv('FILE_UPLOAD_CHUNK_STORE_MIN_SIZE', 256 * 1024))
+FILE_UPLOAD_CHUNK_STORE_AVG_SIZE = int(os.getenv('FILE_UPLOAD_CHUNK_STORE_AVG_SIZE', 1024 * 1024))
+FILE_UPLOAD_CHUNK_STORE_MAX_SIZE = int(os.getenv('FILE_UPLOAD_CHUNK_STORE_MAX_SIZE', 4 * 1024 * 1024))
+FILE_UPLOAD_CHUNK_STORE_WORKERS = int(os.getenv('FILE_UPLOAD_CHUNK_STORE_WORKERS', 4))
+FILE_UPLOAD_CHUNK_STORE_GC_GRACE = int(os.getenv('FILE_UPLOAD_CHUNK_STORE_GC_GRACE', 24 * 3600))
+
+# Near-duplicate images: image uploads get a perceptual hash, indexed for
+# lookups within FILE_UPLOAD_IMAGE_HASH_MAX_DISTANCE bits (of 64). With
+# FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD, an upload within
+# FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE bits of a stored image of the same
+# tenant is answered with that image instead of being stored again
+FILE_UPLOAD_IMAGE_HASH_ENABLED = os.getenv('FILE_UPLOAD_IMAGE_HASH_ENABLED', 'true').lower() == 'true'
+FILE_UPLOAD_IMAGE_HASH_MAX_DISTANCE = int(os.getenv('FILE_UPLOAD_IMAGE_HASH_MAX_DISTANCE', 6))
+FILE_UPLOAD_IMAGE_HASH_MAX_DHASH_DISTANCE = int(os.getenv('FILE_UPLOAD_IMAGE_HASH_MAX_DHASH_DISTANCE', 12))
+FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD = os.getenv('FILE_UPLOAD_IMAGE_DEDUP_ON_UPLOAD', 'false').lower() == 'true'
+FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv('FILE_UPLOAD_IMAGE_DEDUP_MAX_DISTANCE', 4))
+
+# Image placeholders: image uploads get a JPEG data URI of at most
+# FILE_UPLOAD_PLACEHOLDER_SIZE pixels (shrunk further to stay under
+# FILE_UPLOAD_PLACEHOLDER_MAX_BYTES) and a dominant color, returned with the file
+FILE_UPLOAD_PLACEHOLDERS_ENABLED = os.getenv('FILE_UPLOAD_PLACEHOLDERS_ENABLED', 'true').lower() == 'true'
+FILE_UPLOAD_PLACEHOLDER_SIZE = int(os.getenv('FILE_UPLOAD_PLACEHOLDER_SIZE', 16))
+FILE_UPLOAD_PLACEHOLDER_QUALITY = int(os.getenv('FILE_UPLOAD_PLACEHOLDER_QUALITY', 40))
+FILE_UPLOAD_PLACEHOLDER_MAX_BYTES = int(os.getenv('FILE_UPLOAD_PLACEHOLDER_MAX_BYTES', 1024))
+
+# Bulk ingest (`ingestfiles`): files uploaded concurrently and inserted per batch
+FILE_UPLOAD_INGEST_WORKERS = int(os.getenv('FILE_UPLOAD_INGEST_WORKERS', 8))
+FILE_UPLOAD_INGEST_BATCH_SIZE = int(os.getenv('FILE_UPLOAD_INGEST_BATCH_SIZE', 200))
+
+# Read replicas: reads of FILE_UPLOAD_DB_REPLICA_MODELS go to healthy
+# replicas, except in transactions and for FILE_UPLOAD_DB_STICKY_SECONDS
+# after the client's last write. Replicas failing the check done every
+# FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL seconds, or PostgreSQL replicas more
+# than FILE_UPLOAD_DB_REPLICA_MAX_LAG seconds behind, get no reads.
+DATABASE_ROUTERS = ['file_upload.db_router.ReplicaRouter']
+FILE_UPLOAD_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+FILE_UPLOAD_DB_REPLICA_MODELS = ['file_upload.uploadedfile']
+FILE_UPLOAD_DB_STICKY_SECONDS = int(os.getenv('FILE_UPLOAD_DB_STICKY_SECONDS', 5))
+FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL = float(os.getenv('FILE_UPLOAD_DB_REPLICA_CHECK_INTERVAL', 5.0))
+FILE_UPLOAD_DB_REPLICA_MAX_LAG = float(os.getenv('FILE_UPLOAD_DB_REPLICA_MAX_LAG', 30))
+
+# Archival (`archivefiles`): months of files older than
+# FILE_UPLOAD_ARCHIVE_AFTER_DAYS move from the hot table to the archive table
+# ('table') or to gzip-compressed NDJSON in FILE_UPLOAD_ARCHIVE_DIR ('ndjson')
+FILE_UPLOAD_ARCHIVE_AFTER_DAYS = int(os.getenv('FILE_UPLOAD_ARCHIVE_AFTER_DAYS', 365))
+FILE_UPLOAD_ARCHIVE_DESTINATION = os.getenv('FILE_UPLOAD_ARCHIVE_DESTINATION', 'table')
+FILE_UPLOAD_ARCHIVE_DIR = os.getenv('FILE_UPLOAD_ARCHIVE_DIR', BASE_DIR / 'archive')
+FILE_UPLOAD_ARCHIVE_BATCH_SIZE = int(os.getenv('FILE_UPLOAD_ARCHIVE_BATCH_SIZE', 1000))
+
 # File Upload Settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Files above this size are spooled to disk instead of held in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440))  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
 ALLOWED_DOCUMENT_EXTENSIONS = ['.pdf', '.doc', '.docx', '.txt', '.csv']
+# Containers the media probe parses (see media_probe)
+ALLOWED_VIDEO_EXTENSIONS = ['.mp4', '.mov']
+ALLOWED_AUDIO_EXTENSIONS = ['.mp3', '.wav', '.flac']
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Audio and video files may be larger
+MAX_MEDIA_FILE_SIZE = int(os.getenv('MAX_MEDIA_FILE_SIZE', 100 * 1024 * 1024))  # 100MB
+FILE_UPLOAD_RAW_MAX_SIZE = int(os.getenv('FILE_UPLOAD_RAW_MAX_SIZE', MAX_FILE_SIZE))
+FILE_UPLOAD_RAW_CHUNK_SIZE = 64 * 1024  # 64KB
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS').split(',') if os.getenv('CORS_ALLOWED_ORIGINS') else []
@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from file_upload.views import health_check
+from file_upload.views import health_check, metrics_view, readiness_check
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health-check/', health_check, name='health_check'),
+    path('health/live/', health_check, name='liveness_check'),
+    path('health/ready/', readiness_check, name='readiness_check'),
+    path('metrics/', metrics_view, name='metrics'),
     path('api/files/', include('file_upload.urls')),
 ]